@@ -0,0 +1,137 @@
+# aggregates.py - Running per-city sums and first/last readings behind /api/metrics and /api/pollutants
+
+import numpy as np
+
+from prediction_engine import POLLUTANT_FEATURES
+
+# Columns with running means; AQI first, then the pollutants in model order
+AGGREGATE_COLUMNS = ['main.aqi'] + POLLUTANT_FEATURES
+
+
+class CityAggregate:
+    """Sums, non-null counts and first/last AQI readings for one city (or all cities)."""
+
+    __slots__ = ('sums', 'counts', 'rows', 'first_time', 'first_aqi', 'last_time', 'last_aqi')
+
+    def __init__(self, sums, counts, rows, first_time, first_aqi, last_time, last_aqi):
+        self.sums = sums
+        self.counts = counts
+        self.rows = rows
+        self.first_time = first_time
+        self.first_aqi = first_aqi
+        self.last_time = last_time
+        self.last_aqi = last_aqi
+
+    def merge(self, other):
+        """Combined aggregate of two disjoint sets of readings."""
+        if other.first_time < self.first_time:
+            first_time, first_aqi = other.first_time, other.first_aqi
+        else:
+            first_time, first_aqi = self.first_time, self.first_aqi
+        # Later (or equally timed) new readings replace the last one, like a stable sort would
+        if other.last_time >= self.last_time:
+            last_time, last_aqi = other.last_time, other.last_aqi
+        else:
+            last_time, last_aqi = self.last_time, self.last_aqi
+        return CityAggregate(self.sums + other.sums, self.counts + other.counts, self.rows + other.rows,
+                             first_time, first_aqi, last_time, last_aqi)
+
+    def summary(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.sums / self.counts
+        pollutant_means = {col.split('.')[-1].upper(): float(mean)
+                           for col, mean in zip(POLLUTANT_FEATURES, means[1:])}
+
+        if self.rows >= 2:
+            trend = 'Worsening' if self.last_aqi > self.first_aqi else 'Improving'
+        else:
+            trend = 'Stable'
+
+        return {
+            'average_aqi': float(means[0]),
+            'pollutants': pollutant_means,
+            'primary_pollutant': max(pollutant_means.items(), key=lambda x: x[1])[0],
+            'trend': trend
+        }
+
+
+def _aggregate_frame(frame):
+    # Aggregate of rows that are already sorted by datetime
+    values = frame[AGGREGATE_COLUMNS].to_numpy(dtype=float)
+    present = ~np.isnan(values)
+    return CityAggregate(
+        np.where(present, values, 0.0).sum(axis=0), present.sum(axis=0), len(frame),
+        frame['datetime'].iloc[0], float(frame['main.aqi'].iloc[0]),
+        frame['datetime'].iloc[-1], float(frame['main.aqi'].iloc[-1])
+    )
+
+
+class RunningAggregates:
+    """Per-city aggregates that can absorb new readings in O(batch).
+
+    Indexing by city (or 'all') returns the same summary dict the metrics and
+    pollutants endpoints have always served.
+    """
+
+    def __init__(self, cities, overall):
+        self.cities = cities
+        self.overall = overall
+
+    @classmethod
+    def from_store(cls, store):
+        """Build from a DataStore with one vectorized pass per column."""
+        starts = store.offsets[:-1]
+        lasts = store.offsets[1:] - 1
+        if len(starts) == 0:
+            return cls({}, None)
+
+        sums = np.empty((len(starts), len(AGGREGATE_COLUMNS)))
+        counts = np.empty((len(starts), len(AGGREGATE_COLUMNS)), dtype=np.int64)
+        for j, col in enumerate(AGGREGATE_COLUMNS):
+            values = store.df[col].to_numpy(dtype=float)
+            present = ~np.isnan(values)
+            sums[:, j] = np.add.reduceat(np.where(present, values, 0.0), starts)
+            counts[:, j] = np.add.reduceat(present.astype(np.int64), starts)
+
+        datetimes = store.df['datetime']
+        aqi = store.df['main.aqi'].to_numpy(dtype=float)
+        first_times = datetimes.iloc[starts].tolist()
+        last_times = datetimes.iloc[lasts].tolist()
+        rows = np.diff(store.offsets)
+
+        cities = {}
+        for i, city in enumerate(store.cities):
+            cities[city] = CityAggregate(sums[i], counts[i], int(rows[i]),
+                                         first_times[i], float(aqi[starts[i]]),
+                                         last_times[i], float(aqi[lasts[i]]))
+
+        overall = None
+        for aggregate in cities.values():
+            overall = aggregate if overall is None else overall.merge(aggregate)
+        return cls(cities, overall)
+
+    def add(self, rows):
+        """Return new aggregates including the given readings; self is left unchanged."""
+        if rows.empty:
+            return self
+        rows = rows.sort_values('datetime', kind='mergesort')
+
+        cities = dict(self.cities)
+        overall = self.overall
+        for city, group in rows.groupby('city_name', observed=True, sort=False):
+            batch = _aggregate_frame(group)
+            cities[city] = cities[city].merge(batch) if city in cities else batch
+
+        batch = _aggregate_frame(rows)
+        overall = batch if overall is None else overall.merge(batch)
+        return RunningAggregates(cities, overall)
+
+    def __contains__(self, city):
+        if city == 'all':
+            return self.overall is not None
+        return city in self.cities
+
+    def __getitem__(self, city):
+        if city == 'all':
+            return self.overall.summary()
+        return self.cities[city].summary()
@@ -0,0 +1,308 @@
+# asgi_app.py - ASGI entry point: cheap endpoints answer at once, heavy ones run in a bounded pool
+#
+# Serve with any ASGI server, e.g.:
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from live_updates import KEEPALIVE_FRAME, KEEPALIVE_SECONDS
+from python_app import STREAM_HEADERS, app as flask_app, broadcaster, open_stream, registry, warm_up_model
+
+# Served on the event loop itself: an idle subscriber costs a coroutine, not a worker thread
+STREAM_PATH = '/api/stream'
+# Endpoints that do real CPU work, and how many requests to each may run at once.
+# Everything else (health, cities, metrics, ...) reads precomputed values and skips the queue.
+ENDPOINT_LIMITS = {
+    '/api/predictions': 2,
+    '/api/dashboard': 4,
+    '/api/historical': 4,
+    '/api/historical/daily': 4,
+    '/api/historical/rollup': 4,
+    '/api/heatmap': 4,
+    '/api/correlations': 4,
+    '/api/readings': 1,
+    '/api/readings/tail': 1,
+    '/api/admin/reload': 1
+}
+
+
+def parse_limits(text):
+    # "/api/predictions=2,/api/heatmap=8" -> {path: limit}
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        path, _, limit = item.partition('=')
+        limits[path.strip()] = int(limit)
+    return limits
+
+
+class EndpointGate:
+    """Concurrency limit for one endpoint with a bounded wait queue."""
+
+    def __init__(self, limit, max_waiting):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+
+class AsgiAdapter:
+    """Run the Flask app under an ASGI server without letting slow endpoints starve fast ones.
+
+    Heavy endpoints go through a per-endpoint gate and then a bounded worker
+    pool; when a gate's queue is full, or a slot does not free up within the
+    queue timeout, the request is rejected with 503 and Retry-After instead
+    of piling up. Cheap endpoints use a separate small pool and never wait
+    behind heavy work. Threads rather than processes are used because every
+    handler needs the in-memory snapshot; the pandas, NumPy and scikit-learn
+    kernels doing the work release the GIL. /api/stream connections wait on
+    the event loop, so thousands of idle ones hold no threads.
+    """
+
+    def __init__(self, wsgi_app, workers=None, fast_workers=4, limits=None,
+                 max_waiting=16, queue_timeout=10.0):
+        self.wsgi_app = wsgi_app
+        self.workers = workers or os.cpu_count() or 4
+        self.heavy_pool = ThreadPoolExecutor(self.workers, thread_name_prefix='aqi-heavy')
+        self.fast_pool = ThreadPoolExecutor(fast_workers, thread_name_prefix='aqi-fast')
+        self.limits = dict(ENDPOINT_LIMITS if limits is None else limits)
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        # Gates hold asyncio primitives, so they are created lazily on the server's event loop
+        self.gates = {}
+
+    def gate(self, path):
+        if path not in self.limits:
+            return None
+        if path not in self.gates:
+            self.gates[path] = EndpointGate(self.limits[path], self.max_waiting)
+        return self.gates[path]
+
+    def stats(self):
+        return {
+            path: {
+                'limit': gate.limit,
+                'running': gate.running,
+                'waiting': gate.waiting,
+                'completed': gate.completed,
+                'rejected': gate.rejected
+            }
+            for path, gate in self.gates.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Load data and model before accepting traffic so no request pays for it
+                if os.environ.get('AQI_EAGER_LOAD', '1') != '0':
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.heavy_pool, lambda: warm_up_model(registry.current()))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.heavy_pool.shutdown(wait=False)
+                self.fast_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = await read_body(receive)
+        if scope['path'] == STREAM_PATH and scope['method'] == 'GET':
+            await self.stream(scope, receive, send)
+            return
+        environ = wsgi_environ(scope, body)
+        loop = asyncio.get_running_loop()
+
+        gate = self.gate(scope['path'])
+        if gate is None:
+            await loop.run_in_executor(self.fast_pool, run_wsgi, self.wsgi_app, environ, send, loop)
+            return
+
+        # Backpressure: refuse instead of queueing without bound
+        if gate.waiting >= gate.max_waiting:
+            gate.rejected += 1
+            await send_busy(send)
+            return
+        gate.waiting += 1
+        try:
+            await asyncio.wait_for(gate.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            gate.rejected += 1
+            await send_busy(send)
+            return
+        finally:
+            gate.waiting -= 1
+
+        gate.running += 1
+        try:
+            await loop.run_in_executor(self.heavy_pool, run_wsgi, self.wsgi_app, environ, send, loop)
+            gate.completed += 1
+        finally:
+            gate.running -= 1
+            gate.semaphore.release()
+
+    async def stream(self, scope, receive, send):
+        """Server-Sent Events for /api/stream, woken by the broadcaster thread."""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        city = query.get('city', ['all'])[0]
+        try:
+            subscription = await loop.run_in_executor(
+                self.fast_pool, open_stream, city, lambda: loop.call_soon_threadsafe(wakeup.set))
+        except LookupError as e:
+            await send_json(send, 404, {'error': str(e)})
+            return
+        except RuntimeError as e:
+            await send_json(send, 500, {'error': str(e)})
+            return
+        if subscription is None:
+            await send_busy(send)
+            return
+
+        closed = False
+
+        async def watch_disconnect():
+            nonlocal closed
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            closed = True
+            wakeup.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            # This path bypasses Flask, so the CORS header flask_cors would add is set here
+            headers = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'access-control-allow-origin', b'*')]
+            headers += [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in STREAM_HEADERS.items()]
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            while not closed:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    await send({'type': 'http.response.body', 'body': KEEPALIVE_FRAME, 'more_body': True})
+                    continue
+                wakeup.clear()
+                frames = subscription.drain()
+                if frames and not closed:
+                    await send({'type': 'http.response.body', 'body': b''.join(frames), 'more_body': True})
+        except OSError:
+            # The client went away while a frame was being sent
+            pass
+        finally:
+            watcher.cancel()
+            broadcaster.unsubscribe(subscription)
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_busy(send):
+    await send({
+        'type': 'http.response.start',
+        'status': 503,
+        'headers': [(b'content-type', b'application/json'), (b'retry-after', b'1')]
+    })
+    await send({'type': 'http.response.body', 'body': b'{"error": "Server busy, retry shortly"}'})
+
+
+async def send_json(send, status, payload):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body))
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ, send, loop):
+    """Call the WSGI app on a worker thread and forward its output to the ASGI send()."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                               for name, value in headers]
+
+    def forward(message):
+        # Blocks the worker until the event loop has passed the chunk on, so slow clients throttle streaming
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    result = wsgi_app(environ, start_response)
+    try:
+        started = False
+        for chunk in result:
+            if not chunk:
+                continue
+            if not started:
+                forward({'type': 'http.response.start', 'status': response['status'],
+                         'headers': response['headers']})
+                started = True
+            forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        if not started:
+            forward({'type': 'http.response.start', 'status': response['status'],
+                     'headers': response['headers']})
+        forward({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+app = AsgiAdapter(
+    flask_app,
+    workers=int(os.environ['AQI_WORKER_THREADS']) if os.environ.get('AQI_WORKER_THREADS') else None,
+    fast_workers=int(os.environ.get('AQI_FAST_THREADS', '4')),
+    limits={**ENDPOINT_LIMITS, **parse_limits(os.environ.get('AQI_ENDPOINT_LIMITS', ''))},
+    max_waiting=int(os.environ.get('AQI_MAX_WAITING', '16')),
+    queue_timeout=float(os.environ.get('AQI_QUEUE_TIMEOUT', '10'))
+)
@@ -0,0 +1,107 @@
+# bench_coalescing.py - Many clients hitting cold endpoints at once: the work must run only once
+#
+# Run from the src/ directory (uses the configured dataset and model):
+#   python benchmarks/bench_coalescing.py [--clients 32]
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+import python_app  # noqa: E402
+from registry import derived_flights  # noqa: E402
+
+URLS = [
+    '/api/historical/daily?city=all',
+    '/api/predictions?city=all&days=7',
+    '/api/metrics?city=all',
+    '/api/dashboard?city={city}'
+]
+# Derived-value builders wrapped to count how often they really run
+COUNTED = ['compute_aggregated_data', 'compute_rollups', 'compute_spatial_index']
+
+
+def count_calls(counts):
+    for name in COUNTED:
+        original = getattr(python_app, name)
+
+        def counted(snapshot, name=name, original=original):
+            counts[name] = counts.get(name, 0) + 1
+            return original(snapshot)
+        setattr(python_app, name, counted)
+
+
+def cold_version(i):
+    # Same data under a new version: response cache, derived values and forecast all start empty
+    python_app.registry.update(lambda snapshot: snapshot.with_data(snapshot.store, f'coalesce-{i}'))
+
+
+def fire(url, clients):
+    """GET url from `clients` threads released at the same instant; returns (statuses, bodies, seconds)."""
+    barrier = threading.Barrier(clients + 1)
+    results = [None] * clients
+
+    def run(k):
+        client = python_app.app.test_client()
+        barrier.wait()
+        response = client.get(url)
+        results[k] = (response.status_code, response.get_data())
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return [status for status, _ in results], {body for _, body in results}, time.perf_counter() - start
+
+
+def flight_counts():
+    flights = [python_app.response_cache.flights, derived_flights, python_app.forecast_cache.flights]
+    return {flight.name: (flight.stats()['executions'], flight.stats()['coalesced']) for flight in flights}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=32)
+    args = parser.parse_args()
+
+    python_app.current_snapshot()
+    city = python_app.get_data_store().cities[0]
+    counts = {}
+    count_calls(counts)
+
+    print(f"{args.clients} concurrent clients per cold endpoint\n")
+    print(f"{'endpoint':>36} {'ms':>8} {'renders':>8} {'coalesced':>10} {'derived':>8} {'forecasts':>10} {'bodies':>7}")
+    failed = False
+    for i, template in enumerate(URLS):
+        url = template.format(city=city)
+        counts.clear()
+        before = flight_counts()
+        # The swap also starts a background forecast refresh, which requests for the new version join
+        cold_version(i)
+        statuses, bodies, seconds = fire(url, args.clients)
+        after = flight_counts()
+        renders = after['response'][0] - before['response'][0]
+        coalesced = after['response'][1] - before['response'][1]
+        forecasts = after['forecast'][0] - before['forecast'][0]
+        print(f"{url:>36} {seconds * 1000:8.1f} {renders:8d} {coalesced:10d} {sum(counts.values()):8d} "
+              f"{forecasts:10d} {len(bodies):7d}")
+        # One render per endpoint, one computation per derived value, and every client got the same body
+        if (renders != 1 or forecasts > 1 or any(n > 1 for n in counts.values())
+                or len(bodies) != 1 or set(statuses) != {200}):
+            failed = True
+
+    print(f"\nCoalescing totals: {python_app.response_cache.flights.stats()}")
+    print('OK: each cold computation ran once' if not failed else 'FAILED: duplicated work or differing responses')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
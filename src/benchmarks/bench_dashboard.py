@@ -0,0 +1,61 @@
+# bench_dashboard.py - One /api/dashboard call vs the six calls the dashboard used to make
+#
+# Run from the src/ directory (uses the configured dataset and model):
+#   python benchmarks/bench_dashboard.py
+
+import statistics
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+import python_app  # noqa: E402
+
+SEPARATE_ENDPOINTS = [
+    '/api/historical/daily?city={city}',
+    '/api/predictions?city={city}&days=7',
+    '/api/pollutants?city={city}',
+    '/api/health-risk?city={city}',
+    '/api/metrics?city={city}',
+    '/api/heatmap?city={city}'
+]
+REPEATS = 20
+
+
+def measure(client, urls):
+    """Median wall time (s) and total body bytes of fetching urls with an empty response cache."""
+    times = []
+    size = 0
+    for _ in range(REPEATS):
+        python_app.response_cache.clear()
+        start = time.perf_counter()
+        size = 0
+        for url in urls:
+            response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            assert response.status_code == 200, (url, response.status_code)
+            size += len(response.data)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), size
+
+
+def main():
+    client = python_app.app.test_client()
+    store = python_app.get_data_store()
+    cities = ['all'] + store.cities.tolist()[:2]
+
+    # Build the per-snapshot aggregates once so neither side pays for them
+    python_app.get_aggregated_data()
+
+    print(f"{'city':>16} {'6 calls (ms)':>13} {'dashboard (ms)':>15} {'speedup':>8} "
+          f"{'6 calls (KB gz)':>16} {'dashboard (KB gz)':>18}")
+    for city in cities:
+        separate, separate_size = measure(client, [url.format(city=city) for url in SEPARATE_ENDPOINTS])
+        combined, combined_size = measure(client, [f'/api/dashboard?city={city}'])
+        print(f"{city:>16} {separate * 1000:13.1f} {combined * 1000:15.1f} {separate / combined:7.1f}x "
+              f"{separate_size / 1024:16.1f} {combined_size / 1024:18.1f}")
+
+
+if __name__ == '__main__':
+    main()
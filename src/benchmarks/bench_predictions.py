@@ -0,0 +1,95 @@
+# bench_predictions.py - Latency of per-row vs batched AQI predictions
+#
+# Run from the src/ directory:
+#   python benchmarks/bench_predictions.py
+
+import pickle
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from prediction_engine import POLLUTANT_FEATURES, predict_batch  # noqa: E402
+
+CITY_COUNTS = [10, 100, 1000]
+DAY_COUNTS = [7, 30, 90]
+# The per-row loop is far too slow to run in full at 1000 cities x 90 days,
+# so it is timed on a sample of pairs and extrapolated
+LOOP_SAMPLE = 200
+
+
+def load_artifacts():
+    with open(SRC_DIR / 'aqi_model.pkl', 'rb') as file:
+        model = pickle.load(file)
+    with open(SRC_DIR / 'aqi_scaler.pkl', 'rb') as file:
+        scaler = pickle.load(file)
+    return model, scaler
+
+
+def make_last_points(n_cities, rng):
+    last_points = pd.DataFrame(rng.random((n_cities, len(POLLUTANT_FEATURES))) * 100,
+                               columns=POLLUTANT_FEATURES)
+    last_points['city_name'] = [f'City {i}' for i in range(n_cities)]
+    last_points['lat'] = 14.0 + rng.random(n_cities)
+    last_points['lon'] = 120.0 + rng.random(n_cities)
+    last_points['datetime'] = pd.Timestamp('2025-03-01', tz='Asia/Manila')
+    return last_points
+
+
+def predict_per_row(model, scaler, last_points, future_dates, limit):
+    # The original get_predictions loop: one DataFrame, transform and predict per pair
+    done = 0
+    for _, row in last_points.iterrows():
+        base_data = row[POLLUTANT_FEATURES].to_dict()
+        for date in future_dates:
+            if done >= limit:
+                return done
+            input_df = pd.DataFrame([{
+                **base_data,
+                'hour': date.hour,
+                'day': date.day,
+                'month': date.month,
+                'day_of_week': date.dayofweek
+            }])
+            float(model.predict(scaler.transform(input_df))[0])
+            done += 1
+    return done
+
+
+def main():
+    model, scaler = load_artifacts()
+    rng = np.random.default_rng(42)
+
+    print(f"{'cities':>7} {'days':>5} {'pairs':>8} {'per-row (s)':>12} {'batched (s)':>12} {'speedup':>9}")
+    for n_cities in CITY_COUNTS:
+        last_points = make_last_points(n_cities, rng)
+        for days in DAY_COUNTS:
+            future_dates = pd.date_range(
+                start=last_points['datetime'].max() + timedelta(days=1),
+                periods=days,
+                freq='D'
+            )
+            pairs = n_cities * days
+
+            start = time.perf_counter()
+            done = predict_per_row(model, scaler, last_points, future_dates, LOOP_SAMPLE)
+            per_row = (time.perf_counter() - start) / done * pairs
+            estimated = '*' if done < pairs else ' '
+
+            start = time.perf_counter()
+            predict_batch(model, scaler, last_points, future_dates)
+            batched = time.perf_counter() - start
+
+            print(f"{n_cities:>7} {days:>5} {pairs:>8} {per_row:>11.3f}{estimated} {batched:>12.3f} {per_row / batched:>8.1f}x")
+
+    print(f"\n* per-row time extrapolated from the first {LOOP_SAMPLE} pairs")
+
+
+if __name__ == '__main__':
+    main()
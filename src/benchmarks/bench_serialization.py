@@ -0,0 +1,83 @@
+# bench_serialization.py - Serialization time and payload size for historical responses
+#
+# Run from the src/ directory:
+#   python benchmarks/bench_serialization.py
+
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from data_store import DataStore  # noqa: E402
+from prediction_engine import POLLUTANT_FEATURES  # noqa: E402
+from serializers import iter_arrow_stream, iter_json_document, iter_ndjson, pa, parquet_bytes  # noqa: E402
+
+ROW_COUNTS = [10_000, 100_000, 1_000_000]
+N_CITIES = 20
+
+
+def make_store(n_rows, rng):
+    per_city = n_rows // N_CITIES
+    datetimes = pd.date_range('2024-01-01', periods=per_city, freq='h', tz='Asia/Manila')
+    df = pd.DataFrame({
+        'city_name': np.repeat([f'City {i}' for i in range(N_CITIES)], per_city),
+        'lat': np.repeat(14.0 + rng.random(N_CITIES), per_city),
+        'lon': np.repeat(120.0 + rng.random(N_CITIES), per_city),
+        'datetime': np.tile(datetimes, N_CITIES),
+        'main.aqi': rng.integers(1, 6, per_city * N_CITIES)
+    })
+    for col in POLLUTANT_FEATURES:
+        df[col] = rng.random(len(df)) * 100
+    return DataStore(df)
+
+
+def measure(serialize):
+    start = time.perf_counter()
+    payload = serialize()
+    elapsed = time.perf_counter() - start
+    return elapsed, len(payload), len(gzip.compress(payload, compresslevel=6))
+
+
+def main():
+    rng = np.random.default_rng(42)
+    envelope = {'timezone': 'Asia/Manila'}
+
+    print(f"{'rows':>9} {'format':>8} {'time (s)':>9} {'size (MB)':>10} {'gzip (MB)':>10}")
+    for n_rows in ROW_COUNTS:
+        store = make_store(n_rows, rng)
+        positions = store.positions()
+        outputs = {
+            'json': lambda: ''.join(iter_json_document(store, positions, envelope)).encode(),
+            'ndjson': lambda: ''.join(iter_ndjson(store, positions)).encode()
+        }
+        if pa is not None:
+            outputs['arrow'] = lambda: b''.join(iter_arrow_stream(store, positions))
+            outputs['parquet'] = lambda: parquet_bytes(store.take(positions))
+        if n_rows <= 100_000:
+            # The old per-row path, for reference
+            def legacy_json():
+                records = []
+                for _, row in store.df.iterrows():
+                    record = row.to_dict()
+                    record['datetime'] = row['datetime'].isoformat()
+                    records.append(record)
+                return json.dumps(records).encode()
+            outputs['iterrows'] = legacy_json
+
+        for name, serialize in outputs.items():
+            elapsed, size, gzipped = measure(serialize)
+            print(f"{n_rows:>9} {name:>8} {elapsed:>9.3f} {size / 1e6:>10.2f} {gzipped / 1e6:>10.2f}")
+
+    if pa is None:
+        print("\npyarrow is not installed; arrow and parquet rows were skipped")
+
+
+if __name__ == '__main__':
+    main()
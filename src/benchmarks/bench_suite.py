@@ -0,0 +1,268 @@
+# bench_suite.py - Every endpoint and train_model.py against generated datasets, with baseline comparison
+#
+# Run from the src/ directory, e.g.:
+#   python benchmarks/bench_suite.py                                  # 1e4x10 and 1e5x100
+#   python benchmarks/bench_suite.py --datasets 1e6x1000,1e7x10000 --output results.json
+#   python benchmarks/bench_suite.py --baseline baseline.json         # exit 1 on regressions
+#
+# A dataset "ROWSxCITIES" is generated once into --data-dir (same seed, same file). Each one
+# is served by a fresh process, so load time and peak RSS are not skewed by earlier runs.
+# Training runs in a temporary directory and never touches the model files in src/.
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from generate_dataset import generate  # noqa: E402
+
+DEFAULT_DATASETS = '1e4x10,1e5x100'
+ENDPOINTS = [
+    '/api/cities',
+    '/api/historical?city={city}',
+    '/api/historical?city={city}&format=ndjson',
+    '/api/historical?city=all&page=1&per_page=1000',
+    '/api/historical?city={city}&max_points=500',
+    '/api/historical/daily?city=all',
+    '/api/historical/daily?city={city}',
+    '/api/historical/rollup?city=all&granularity=month',
+    '/api/predictions?city=all&days=7',
+    '/api/predictions?city={city}&days=30',
+    '/api/pollutants?city=all',
+    '/api/health-risk?city=all',
+    '/api/metrics?city=all',
+    '/api/heatmap?city=all',
+    '/api/heatmap?city=all&zoom=6',
+    '/api/correlations?city=all',
+    '/api/dashboard?city={city}'
+]
+# Relative slowdown (or memory growth) counted as a regression, and the absolute noise floors below it
+TOLERANCE = 0.2
+MIN_DELTA_MS = 1.0
+MIN_DELTA_MB = 20.0
+
+
+def parse_dataset(spec):
+    rows, cities = spec.lower().split('x')
+    return int(float(rows)), int(float(cities))
+
+
+def dataset_csv(data_dir, spec, seed):
+    """Path of the dataset's CSV, generated unless an identical one already exists."""
+    rows, cities = parse_dataset(spec)
+    directory = data_dir / spec
+    csv_path = directory / 'air_quality.csv'
+    meta_path = directory / 'dataset.json'
+    meta = {'rows': rows, 'cities': cities, 'seed': seed}
+    if csv_path.exists() and meta_path.exists() and json.loads(meta_path.read_text()) == meta:
+        return csv_path, None
+    start = time.perf_counter()
+    generate(csv_path, rows, cities, seed)
+    meta_path.write_text(json.dumps(meta))
+    return csv_path, time.perf_counter() - start
+
+
+def clear_caches(csv_path):
+    # Snapshots and feature caches live next to the CSV; removing them makes every run a cold start
+    shutil.rmtree(csv_path.parent / '.cache', ignore_errors=True)
+
+
+def run_worker(csv_path, repeats):
+    """Serve the dataset in a fresh interpreter and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / 'api.json'
+        env = {key: value for key, value in os.environ.items() if key != 'AQI_SHARED_DATA'}
+        env['AQI_CSV_PATH'] = str(csv_path)
+        subprocess.run([sys.executable, __file__, '--worker', str(output), '--repeats', str(repeats)],
+                       cwd=SRC_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        return json.loads(output.read_text())
+
+
+def worker(output, repeats):
+    # Runs inside the fresh interpreter with AQI_CSV_PATH set
+    import python_app
+    from train_model import peak_memory_mb
+
+    start = time.perf_counter()
+    python_app.current_snapshot()
+    store = python_app.get_data_store()
+    result = {'load_seconds': round(time.perf_counter() - start, 3), 'rows': len(store),
+              'cities': len(store.cities), 'endpoints': {}}
+
+    client = python_app.app.test_client()
+    city = store.cities[0]
+    for template in ENDPOINTS:
+        url = template.format(city=city)
+        timings = []
+        size = 0
+        status = None
+        # The first call also builds whatever the endpoint derives from the data; later calls bypass the response cache
+        for _ in range(repeats + 1):
+            python_app.response_cache.clear()
+            call_start = time.perf_counter()
+            response = client.get(url)
+            size = len(response.get_data())
+            timings.append(time.perf_counter() - call_start)
+            status = response.status_code
+        warm = timings[1:]
+        result['endpoints'][template] = {
+            'status': status,
+            'first_ms': round(timings[0] * 1000, 3),
+            'p50_ms': round(statistics.median(warm) * 1000, 3),
+            # Nearest rank: the smallest timing that at least 95% of the calls are at or below
+            'p95_ms': round(sorted(warm)[math.ceil(0.95 * len(warm)) - 1] * 1000, 3),
+            'requests_per_second': round(len(warm) / sum(warm), 1),
+            'bytes': size
+        }
+    result['peak_rss_mb'] = round(peak_memory_mb(), 1)
+    output.write_text(json.dumps(result))
+
+
+def run_training(csv_path, trees):
+    """Train in a scratch directory; returns train_model.py's own metrics plus wall time."""
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(SRC_DIR / 'train_model.py'), '--csv', str(csv_path),
+                        '--trees', str(trees)], cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        metrics_path = Path(tmp) / 'aqi_model_metrics.json'
+        if not metrics_path.exists():
+            raise RuntimeError(f"Training on {csv_path} failed; rerun train_model.py by hand for details")
+        metrics = json.loads(metrics_path.read_text())
+    return {
+        'wall_seconds': round(elapsed, 3),
+        'feature_seconds': metrics['feature_seconds'],
+        'fit_seconds': metrics['fit_seconds'],
+        'peak_rss_mb': metrics['peak_memory_mb'],
+        'trees': trees,
+        'test_r2': metrics['test_r2']
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def metric_pairs(results):
+    """Flatten results into {(dataset, metric): (value, kind)} where kind is 'ms' or 'mb'."""
+    pairs = {}
+    for spec, dataset in results['datasets'].items():
+        api = dataset['api']
+        pairs[(spec, 'load')] = (api['load_seconds'] * 1000, 'ms')
+        pairs[(spec, 'api peak RSS')] = (api['peak_rss_mb'], 'mb')
+        for endpoint, timing in api['endpoints'].items():
+            pairs[(spec, endpoint)] = (timing['p50_ms'], 'ms')
+        if dataset.get('train'):
+            pairs[(spec, 'train')] = (dataset['train']['wall_seconds'] * 1000, 'ms')
+            if dataset['train']['peak_rss_mb'] is not None:
+                pairs[(spec, 'train peak RSS')] = (dataset['train']['peak_rss_mb'], 'mb')
+    return pairs
+
+
+def compare(results, baseline, tolerance):
+    """Print metrics that moved beyond the tolerance; returns the number of regressions."""
+    current, previous = metric_pairs(results), metric_pairs(baseline)
+    regressions = 0
+    print(f"\nAgainst baseline from {baseline['environment'].get('created')} "
+          f"(commit {baseline['environment'].get('commit')}), tolerance {tolerance:.0%}:")
+    for key in sorted(current.keys() & previous.keys()):
+        (value, kind), (before, _) = current[key], previous[key]
+        floor = MIN_DELTA_MS if kind == 'ms' else MIN_DELTA_MB
+        if abs(value - before) < floor or before <= 0:
+            continue
+        ratio = value / before
+        if ratio > 1 + tolerance:
+            regressions += 1
+            label = 'REGRESSION'
+        elif ratio < 1 - tolerance:
+            label = 'improved'
+        else:
+            continue
+        unit = 'ms' if kind == 'ms' else 'MB'
+        print(f"  {label:>10} {key[0]:>10} {key[1]:<55} {before:10.1f} -> {value:10.1f} {unit} ({ratio:.2f}x)")
+    missing = sorted(previous.keys() - current.keys())
+    if missing:
+        print(f"  {len(missing)} baseline metrics were not measured this time")
+    print(f"  {regressions} regression(s)")
+    return regressions
+
+
+def print_dataset(spec, dataset):
+    api = dataset['api']
+    print(f"\n{spec}: {api['rows']:,} rows, {api['cities']:,} cities, load {api['load_seconds']:.2f}s, "
+          f"peak RSS {api['peak_rss_mb']:.0f} MB")
+    print(f"  {'endpoint':<55} {'status':>6} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8} {'KB':>9}")
+    for endpoint, timing in api['endpoints'].items():
+        print(f"  {endpoint:<55} {timing['status']:>6} {timing['first_ms']:9.1f} {timing['p50_ms']:8.1f} "
+              f"{timing['p95_ms']:8.1f} {timing['requests_per_second']:8.1f} {timing['bytes'] / 1024:9.1f}")
+    train = dataset.get('train')
+    if train:
+        print(f"  train_model.py ({train['trees']} trees): {train['wall_seconds']:.1f}s "
+              f"(features {train['feature_seconds']:.1f}s, fit {train['fit_seconds']:.1f}s), "
+              f"peak RSS {train['peak_rss_mb']:.0f} MB, test R² {train['test_r2']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API and training on generated datasets')
+    parser.add_argument('--datasets', default=DEFAULT_DATASETS,
+                        help='Comma-separated ROWSxCITIES, e.g. 1e4x10,1e6x1000,1e8x10000')
+    parser.add_argument('--data-dir', type=Path, default=SRC_DIR / 'benchmarks' / '.data')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeats', type=int, default=5, help='Timed calls per endpoint after the first')
+    parser.add_argument('--trees', type=int, default=20, help='Trees per training run')
+    parser.add_argument('--skip-train', action='store_true')
+    parser.add_argument('--output', type=Path, default=Path('bench_results.json'))
+    parser.add_argument('--baseline', type=Path, help='Earlier results to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--worker', type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.repeats)
+        return
+
+    results = {'environment': environment(), 'datasets': {}}
+    for spec in args.datasets.split(','):
+        csv_path, generate_seconds = dataset_csv(args.data_dir, spec, args.seed)
+        dataset = {'generate_seconds': round(generate_seconds, 3) if generate_seconds else None}
+        clear_caches(csv_path)
+        dataset['api'] = run_worker(csv_path, args.repeats)
+        if not args.skip_train:
+            clear_caches(csv_path)
+            dataset['train'] = run_training(csv_path, args.trees)
+        results['datasets'][spec] = dataset
+        print_dataset(spec, dataset)
+
+    args.output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        if compare(results, json.loads(args.baseline.read_text()), args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# bench_tree_engine.py - sklearn forest + StandardScaler vs the compiled flat-array forest
+#
+# Run from the src/ directory:
+#   python benchmarks/bench_tree_engine.py
+
+import pickle
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from prediction_engine import MODEL_FEATURES, POLLUTANT_FEATURES  # noqa: E402
+from tree_engine import CompiledForest  # noqa: E402
+
+BATCH_SIZES = [1, 10, 100, 1000, 10_000, 100_000]
+# Largest allowed |sklearn - compiled| difference in AQI units
+TOLERANCE = 1e-6
+# Small batches are repeated until this much time has passed, for stable per-call numbers
+MIN_SECONDS = 0.5
+
+
+def load_artifacts():
+    with open(SRC_DIR / 'aqi_model.pkl', 'rb') as file:
+        model = pickle.load(file)
+    with open(SRC_DIR / 'aqi_scaler.pkl', 'rb') as file:
+        scaler = pickle.load(file)
+    return model, scaler
+
+
+def make_features(n_rows, rng):
+    X = np.column_stack([
+        rng.random((n_rows, len(POLLUTANT_FEATURES))) * 200,
+        rng.integers(0, 24, n_rows),
+        rng.integers(1, 29, n_rows),
+        rng.integers(1, 13, n_rows),
+        rng.integers(0, 7, n_rows)
+    ]).astype(float)
+    return pd.DataFrame(X, columns=MODEL_FEATURES)
+
+
+def time_call(function):
+    # Seconds per call, repeating fast calls
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        result = function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SECONDS:
+            return elapsed / calls, result
+
+
+def main():
+    model, scaler = load_artifacts()
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    print(f"Compiled {compiled.n_trees} trees ({compiled.n_nodes} nodes, depth {compiled.max_depth}) "
+          f"in {time.perf_counter() - start:.3f}s\n")
+
+    rng = np.random.default_rng(42)
+    print(f"{'batch':>7} {'sklearn (ms)':>13} {'compiled (ms)':>14} {'speedup':>8} {'max |diff|':>11}")
+    worst = 0.0
+    for batch_size in BATCH_SIZES:
+        X = make_features(batch_size, rng)
+        raw = X.to_numpy()
+        compiled_seconds, actual = time_call(lambda: compiled.predict(raw))
+        sklearn_seconds, expected = time_call(lambda: model.predict(scaler.transform(X)))
+        diff = float(np.abs(expected - actual).max())
+        worst = max(worst, diff)
+        print(f"{batch_size:>7} {sklearn_seconds * 1000:>13.3f} {compiled_seconds * 1000:>14.3f} "
+              f"{sklearn_seconds / compiled_seconds:>7.1f}x {diff:>11.2e}")
+
+    status = 'OK' if worst <= TOLERANCE else 'FAILED'
+    print(f"\nMax difference {worst:.2e} (tolerance {TOLERANCE:.0e}): {status}")
+    if worst > TOLERANCE:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
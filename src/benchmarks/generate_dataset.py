@@ -0,0 +1,131 @@
+# generate_dataset.py - Synthetic air quality CSVs with the bundled dataset's columns, at any size
+#
+# Run from the src/ directory, e.g.:
+#   python benchmarks/generate_dataset.py --rows 1000000 --cities 100 --out /tmp/aqi_1e6.csv
+#
+# Every city reports hourly from --start; rows are written hour by hour in chunks, so
+# memory stays flat even for 10^8 rows. The same --seed always produces the same file.
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SRC_DIR))
+
+from prediction_engine import POLLUTANT_FEATURES  # noqa: E402
+
+# pyarrow writes CSV about 10x faster than pandas; without it generation just takes longer
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+COLUMNS = ['city_name', 'lat', 'lon', 'datetime', 'main.aqi'] + POLLUTANT_FEATURES
+# Rows generated and written per step
+CHUNK_ROWS = 500_000
+# PM2.5 upper bounds (µg/m³) of AQI levels 1-4 on the OpenWeather 1-5 scale; above the last is 5
+AQI_PM25_BOUNDS = [10, 25, 50, 75]
+# Typical level of each pollutant relative to PM2.5, plus how strongly it follows the traffic cycle
+POLLUTANT_PROFILES = {
+    'components.co': (12.0, 0.6),
+    'components.no': (0.4, 1.0),
+    'components.no2': (0.9, 0.9),
+    'components.o3': (2.0, -0.5),
+    'components.so2': (0.3, 0.2),
+    'components.pm2_5': (1.0, 0.5),
+    'components.pm10': (1.5, 0.5),
+    'components.nh3': (0.15, 0.1)
+}
+
+
+def city_table(cities, rng):
+    """Name, position and typical PM2.5 level of every city."""
+    return pd.DataFrame({
+        'city_name': [f'City{i}' for i in range(cities)],
+        'lat': np.round(rng.uniform(5.0, 19.0, cities), 6),
+        'lon': np.round(rng.uniform(117.0, 127.0, cities), 6),
+        'base': rng.lognormal(np.log(25.0), 0.5, cities)
+    })
+
+
+def readings(table, hours, rng):
+    """One reading per city for each of the given hours, hour-major like a live feed."""
+    n_cities = len(table)
+    times = np.repeat(hours, n_cities)
+    city = np.tile(np.arange(n_cities), len(hours))
+    hour_of_day = (times.astype('datetime64[h]').astype(np.int64) % 24).astype(float)
+    # Rush-hour peaks at 08:00 and 20:00, plus a slower weekly swing
+    traffic = 1.0 + 0.35 * np.cos(2 * np.pi * (hour_of_day - 8) / 12)
+    weekly = 1.0 + 0.15 * np.sin(2 * np.pi * times.astype('datetime64[D]').astype(np.int64) / 7)
+    level = table['base'].to_numpy()[city] * weekly * rng.lognormal(0.0, 0.35, len(times))
+
+    # Formatted once per hour, like the bundled CSV ("2024-01-01 00:00:00")
+    stamps = np.char.replace(np.datetime_as_string(hours.astype('datetime64[s]')), 'T', ' ')
+    frame = {
+        'city_name': table['city_name'].to_numpy()[city],
+        'lat': table['lat'].to_numpy()[city],
+        'lon': table['lon'].to_numpy()[city],
+        'datetime': np.repeat(stamps, n_cities)
+    }
+    for col in POLLUTANT_FEATURES:
+        scale, follows_traffic = POLLUTANT_PROFILES[col]
+        noise = rng.lognormal(0.0, 0.2, len(times))
+        frame[col] = np.round(level * scale * traffic ** follows_traffic * noise, 2)
+    frame['main.aqi'] = np.searchsorted(AQI_PM25_BOUNDS, frame['components.pm2_5'], side='right') + 1
+    return pd.DataFrame(frame, columns=COLUMNS)
+
+
+def write_rows(file, chunk):
+    if pa is not None:
+        options = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+        pa_csv.write_csv(pa.Table.from_pandas(chunk, preserve_index=False), file, options)
+    else:
+        file.write(chunk.to_csv(header=False, index=False).encode())
+
+
+def generate(path, rows, cities, seed=42, start='2024-01-01'):
+    """Write about `rows` readings (whole hours of all cities) to path; returns the rows written."""
+    rng = np.random.default_rng(seed)
+    table = city_table(cities, rng)
+    n_hours = max(1, -(-rows // cities))
+    hours = np.datetime64(start, 'h') + np.arange(n_hours)
+    step = max(1, CHUNK_ROWS // cities)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    written = 0
+    with open(tmp, 'wb') as file:
+        file.write((','.join(COLUMNS) + '\n').encode())
+        for first in range(0, n_hours, step):
+            chunk = readings(table, hours[first:first + step], rng)
+            write_rows(file, chunk)
+            written += len(chunk)
+    tmp.replace(path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic air quality dataset')
+    parser.add_argument('--rows', type=float, default=1e6, help='Approximate number of readings (e.g. 1e7)')
+    parser.add_argument('--cities', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start', default='2024-01-01', help='First reading (Manila time)')
+    parser.add_argument('--out', type=Path, required=True)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    written = generate(args.out, int(args.rows), args.cities, args.seed, args.start)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {written:,} rows for {args.cities:,} cities to {args.out} "
+          f"({args.out.stat().st_size / 1e6:.1f} MB) in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
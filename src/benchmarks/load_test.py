@@ -0,0 +1,132 @@
+# load_test.py - Mixed heavy/cheap traffic against a running server, reporting p50/p99 latency
+#
+# Start the server first, then run from the src/ directory, e.g.:
+#   uvicorn asgi_app:app --port 5000 &
+#   python benchmarks/load_test.py --url http://localhost:5000 --duration 20
+#
+# Heavy requests carry a unique dummy parameter so the response cache cannot answer them.
+
+import argparse
+import http.client
+import itertools
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+HEAVY_PATHS = [
+    '/api/predictions?city=all&days=90',
+    '/api/historical/daily?city=all',
+    '/api/dashboard?city=all',
+    '/api/historical?city=all&format=ndjson'
+]
+CHEAP_PATHS = [
+    '/api/health',
+    '/api/cities',
+    '/api/metrics?city=all'
+]
+
+
+class Client(threading.Thread):
+    """Issues requests back to back on one keep-alive connection until the deadline."""
+
+    def __init__(self, kind, paths, base, deadline, counter, results, lock):
+        super().__init__(daemon=True)
+        self.kind = kind
+        self.paths = itertools.cycle(paths)
+        self.base = base
+        self.deadline = deadline
+        self.counter = counter
+        self.results = results
+        self.lock = lock
+
+    def connect(self):
+        return http.client.HTTPConnection(self.base.hostname, self.base.port or 80, timeout=60)
+
+    def run(self):
+        connection = self.connect()
+        while time.perf_counter() < self.deadline:
+            path = next(self.paths)
+            if self.kind == 'heavy':
+                path += f"{'&' if '?' in path else '?'}_nocache={next(self.counter)}"
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = self.connect()
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.results.append((self.kind, path.split('?')[0], status, elapsed))
+            if status == 503:
+                time.sleep(0.05)
+        connection.close()
+
+
+def summarize(results, duration):
+    rows = []
+    groups = {}
+    for kind, path, status, elapsed in results:
+        groups.setdefault((kind, path), []).append((status, elapsed))
+    for kind in ('heavy', 'cheap'):
+        groups[(kind, '*')] = [(status, elapsed) for k, _, status, elapsed in results if k == kind]
+
+    for (kind, path), samples in sorted(groups.items()):
+        ok = np.array([elapsed for status, elapsed in samples if status == 200])
+        rows.append({
+            'kind': kind,
+            'path': path,
+            'requests': len(samples),
+            'ok': len(ok),
+            'rejected_503': sum(1 for status, _ in samples if status == 503),
+            'errors': sum(1 for status, _ in samples if status not in (200, 503)),
+            'throughput_rps': len(ok) / duration,
+            'p50_ms': float(np.percentile(ok, 50) * 1000) if len(ok) else None,
+            'p99_ms': float(np.percentile(ok, 99) * 1000) if len(ok) else None
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--heavy-clients', type=int, default=16)
+    parser.add_argument('--cheap-clients', type=int, default=8)
+    parser.add_argument('--json', help='Also write the summary to this file')
+    args = parser.parse_args()
+
+    base = urlsplit(args.url)
+    results = []
+    lock = threading.Lock()
+    counter = itertools.count()
+    deadline = time.perf_counter() + args.duration
+    clients = ([Client('heavy', HEAVY_PATHS, base, deadline, counter, results, lock)
+                for _ in range(args.heavy_clients)]
+               + [Client('cheap', CHEAP_PATHS, base, deadline, counter, results, lock)
+                  for _ in range(args.cheap_clients)])
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    rows = summarize(results, args.duration)
+    print(f"{'kind':>6} {'path':<24} {'ok':>6} {'503':>5} {'err':>4} {'req/s':>7} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for row in rows:
+        p50 = f"{row['p50_ms']:9.1f}" if row['p50_ms'] is not None else f"{'-':>9}"
+        p99 = f"{row['p99_ms']:9.1f}" if row['p99_ms'] is not None else f"{'-':>9}"
+        print(f"{row['kind']:>6} {row['path']:<24} {row['ok']:6d} {row['rejected_503']:5d} {row['errors']:4d} "
+              f"{row['throughput_rps']:7.1f} {p50} {p99}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'url': args.url, 'duration': args.duration, 'results': rows}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+# stream_load_test.py - Thousands of idle /api/stream connections, then how fast each update reaches all of them
+#
+# Start the ASGI server first, then run from the src/ directory, e.g.:
+#   AQI_ADMIN_TOKEN=secret uvicorn asgi_app:app --port 5000 &
+#   python benchmarks/stream_load_test.py --url http://localhost:5000 --connections 5000 --admin-token secret
+#
+# Updates are triggered by POSTing one synthetic reading per subscribed city to /api/readings.
+# They are not persisted, but they do change the running server's data, so use a test server.
+
+import argparse
+import asyncio
+import json
+import resource
+import time
+import urllib.request
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+# Connections being opened at once, so the server's listen backlog does not overflow
+CONNECT_CONCURRENCY = 200
+
+
+class StreamClient:
+    """One raw HTTP/1.1 SSE connection that records when each 'latest' event arrives."""
+
+    def __init__(self, host, port, city):
+        self.host = host
+        self.port = port
+        self.city = city
+        self.status = None
+        self.hello = None
+        self.received = []
+        self.writer = None
+
+    async def connect(self):
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write((f"GET /api/stream?city={quote(self.city)} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Accept: text/event-stream\r\n\r\n").encode())
+        await self.writer.drain()
+        head = await reader.readuntil(b'\r\n\r\n')
+        self.status = int(head.split(b' ', 2)[1])
+        chunked = b'transfer-encoding: chunked' in head.lower()
+        return reader, chunked
+
+    async def listen(self, reader, chunked):
+        buffer = b''
+        try:
+            while True:
+                if chunked:
+                    size = int((await reader.readline()).strip() or b'0', 16)
+                    if size == 0:
+                        return
+                    data = (await reader.readexactly(size + 2))[:-2]
+                else:
+                    data = await reader.read(65536)
+                    if not data:
+                        return
+                buffer += data
+                *frames, buffer = buffer.split(b'\n\n')
+                for frame in frames:
+                    self.on_frame(frame.decode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+    def on_frame(self, frame):
+        fields = dict(line.split(': ', 1) for line in frame.splitlines() if ': ' in line)
+        if fields.get('event') == 'hello':
+            self.hello = json.loads(fields['data'])
+        elif fields.get('event') == 'latest':
+            self.received.append(time.perf_counter())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def get_json(url, token=None):
+    request = urllib.request.Request(url, headers={'X-Admin-Token': token} if token else {})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def post_readings(url, readings, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['X-Admin-Token'] = token
+    request = urllib.request.Request(f"{url}/api/readings", data=json.dumps(readings).encode(), headers=headers)
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.status
+
+
+def timed_get(url):
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def synthetic_readings(stations, cities, after, hour):
+    # One reading per city, `hour` hours after the newest reading; AQI alternates so risk bands change too
+    when = (np.datetime64(after[:19]) + np.timedelta64(hour, 'h')).astype(str) + after[19:]
+    readings = []
+    for city in cities:
+        reading = {'city_name': city, 'lat': stations[city]['lat'], 'lon': stations[city]['lon'],
+                   'datetime': when, 'main.aqi': 5 if hour % 2 else 1}
+        for pollutant in ('co', 'no', 'no2', 'o3', 'so2', 'pm2_5', 'pm10', 'nh3'):
+            reading[f'components.{pollutant}'] = 80.0 if hour % 2 else 5.0
+        readings.append(reading)
+    return readings
+
+
+def stream_stats(url, token):
+    # aqi_stream_* samples from /api/metrics/internal
+    request = urllib.request.Request(f"{url}/api/metrics/internal", headers={'X-Admin-Token': token} if token else {})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        lines = response.read().decode().splitlines()
+    return {line.split()[0]: float(line.split()[1]) for line in lines if line.startswith('aqi_stream_')}
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+async def run(args):
+    base = urlsplit(args.url)
+    loop = asyncio.get_running_loop()
+    stations = {station['city_name']: station for station in get_json(f"{args.url}/api/heatmap?city=all")}
+    risk = get_json(f"{args.url}/api/health-risk?city=all")
+    newest = max(entry['datetime'] for entry in risk['cities'])
+    cities = sorted(stations)[:args.cities]
+    targets = ['all'] + cities
+
+    rss_before = rss_mb(args.server_pid) if args.server_pid else None
+    clients = [StreamClient(base.hostname, base.port or 80, targets[i % len(targets)])
+               for i in range(args.connections)]
+    gate = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    listeners = []
+
+    async def open_one(client):
+        async with gate:
+            try:
+                reader, chunked = await client.connect()
+            except OSError:
+                return
+            if client.status == 200:
+                listeners.append(asyncio.ensure_future(client.listen(reader, chunked)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(open_one(client) for client in clients))
+    while sum(client.hello is not None for client in clients) < len(listeners):
+        if time.perf_counter() - start > args.timeout:
+            break
+        await asyncio.sleep(0.05)
+    connect_seconds = time.perf_counter() - start
+    connected = sum(client.hello is not None for client in clients)
+    print(f"{connected:,}/{args.connections:,} connections open across {len(targets)} streams "
+          f"in {connect_seconds:.1f}s")
+    if rss_before is not None:
+        rss_after = rss_mb(args.server_pid)
+        print(f"Server RSS {rss_before:.0f} -> {rss_after:.0f} MB "
+              f"({(rss_after - rss_before) * 1024 / max(connected, 1):.1f} KB per idle connection)")
+
+    # A cheap endpoint must stay fast while every connection is held open
+    idle = [await loop.run_in_executor(None, timed_get, f"{args.url}/api/health") for _ in range(50)]
+    print(f"/api/health with all connections idle: p50 {np.percentile(idle, 50) * 1000:.1f} ms, "
+          f"p99 {np.percentile(idle, 99) * 1000:.1f} ms")
+
+    stats_before = stream_stats(args.url, args.admin_token)
+    live = [client for client in clients if client.hello is not None]
+    print(f"\n{'update':>6} {'delivered':>11} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = []
+    for update in range(1, args.updates + 1):
+        readings = synthetic_readings(stations, cities, newest, update)
+        sent = time.perf_counter()
+        await loop.run_in_executor(None, post_readings, args.url, readings, args.admin_token)
+        while sum(len(client.received) >= update for client in live) < len(live):
+            if time.perf_counter() - sent > args.timeout:
+                break
+            await asyncio.sleep(0.01)
+        latencies = np.array([client.received[update - 1] - sent for client in live if len(client.received) >= update])
+        row = {
+            'update': update,
+            'delivered': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else None,
+            'max_ms': float(latencies.max() * 1000) if len(latencies) else None
+        }
+        rows.append(row)
+        print(f"{update:6d} {len(latencies):5d}/{len(live):<5d} {row['p50_ms'] or 0:8.1f} "
+              f"{row['p99_ms'] or 0:8.1f} {row['max_ms'] or 0:8.1f}")
+    stats_after = stream_stats(args.url, args.admin_token)
+
+    computations = stats_after.get('aqi_stream_computations_total', 0) - stats_before.get('aqi_stream_computations_total', 0)
+    print(f"\nServer computed {computations:.0f} per-city deltas for {args.updates} updates "
+          f"to {stats_after.get('aqi_stream_subscribers', 0):.0f} subscribers "
+          f"(once per stream, not per connection)")
+
+    for listener in listeners:
+        listener.cancel()
+    for client in clients:
+        client.close()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'url': args.url, 'connections': args.connections, 'connected': connected,
+                       'connect_seconds': connect_seconds, 'updates': rows,
+                       'computations': computations}, file, indent=2)
+    return connected == args.connections and all(row['delivered'] == len(live) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Idle /api/stream connections and update fan-out latency')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--cities', type=int, default=10, help='Cities subscribed to, besides "all"')
+    parser.add_argument('--updates', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--admin-token', help='Value of AQI_ADMIN_TOKEN; ingesting and reading metrics need it')
+    parser.add_argument('--server-pid', type=int, help='Report the server\'s memory per idle connection')
+    parser.add_argument('--json', help='Also write the summary to this file')
+    args = parser.parse_args()
+
+    # Every connection is a file descriptor on this side too
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.connections + 256)), hard))
+
+    ok = asyncio.run(run(args))
+    print('OK: every connection received every update' if ok else 'FAILED: missing connections or updates')
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
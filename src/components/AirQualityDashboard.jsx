@@ -32,6 +32,8 @@ const AirQualityDashboard = () => {
   const [heatmapData, setHeatmapData] = useState([]);
   const [monthlyAverages, setMonthlyAverages] = useState([]);
   const [dailyPatterns, setDailyPatterns] = useState([]);
+  // Bumped when the live stream says the loaded data can no longer be patched, to refetch everything
+  const [refreshKey, setRefreshKey] = useState(0);
   
 
     
@@ -43,6 +45,43 @@ const AirQualityDashboard = () => {
   
   // Colors for charts
   const COLORS = ['#0088FE', '#00C49F', '#FFBB28', '#FF8042', '#8884d8', '#82ca9d', '#ffc658', '#8dd1e1'];
+
+  // Map API color to Tailwind color class
+  const HEALTH_RISK_COLORS = {
+    'green': 'bg-green-500',
+    'yellow': 'bg-yellow-500',
+    'orange': 'bg-orange-500',
+    'red': 'bg-red-500',
+    'purple': 'bg-purple-500'
+  };
+
+  const processDailyItem = item => ({
+    ...item,
+    datetime: new Date(item.date).toISOString(), // Convert back to datetime format
+    'main.aqi': item['main.aqi'],
+    'components': {
+      pm2_5: item['components.pm2_5'],
+      pm10: item['components.pm10'],
+      o3: item['components.o3'],
+      no2: item['components.no2'],
+      so2: item['components.so2']
+    }
+  });
+
+  const formatPredictions = predictionsData => Array.isArray(predictionsData)
+    ? predictionsData.map(pred => ({
+        ...pred,
+        datetime: pred.datetime,
+        'main.aqi': pred.predicted_aqi,
+        is_prediction: true
+      }))
+    : [];
+
+  const formatHealthRisk = risk => ({
+    level: risk.level,
+    color: HEALTH_RISK_COLORS[risk.color] || 'bg-blue-500',
+    description: risk.description
+  });
   
   useEffect(() => {
     // Fetch cities
@@ -80,64 +119,20 @@ const AirQualityDashboard = () => {
       try {
         const cityParam = selectedCity === 'All Cities' ? 'all' : encodeURIComponent(selectedCity);
     
-        // Fetch aggregated daily data instead of raw data
-        const [dailyResponse, predictionsResponse, pollutantsResponse, 
-              healthRiskResponse, metricsResponse, heatmapResponse] = await Promise.all([
-          fetch(`${API_BASE_URL}/historical/daily?city=${cityParam}`),
-          fetch(`${API_BASE_URL}/predictions?city=${cityParam}&days=7`),
-          fetch(`${API_BASE_URL}/pollutants?city=${cityParam}`),
-          fetch(`${API_BASE_URL}/health-risk?city=${cityParam}`),
-          fetch(`${API_BASE_URL}/metrics?city=${cityParam}`),
-          fetch(`${API_BASE_URL}/heatmap?city=${cityParam}`)
-        ]);
-    
-        if (!dailyResponse.ok) throw new Error('Failed to fetch daily data');
-        // Check for errors in responses
-        if (!predictionsResponse.ok) throw new Error('Failed to fetch predictions');
-        if (!pollutantsResponse.ok) throw new Error('Failed to fetch pollutant data');
-        if (!healthRiskResponse.ok) throw new Error('Failed to fetch health risk');
-        if (!metricsResponse.ok) throw new Error('Failed to fetch metrics');
-        
-        const dailyData = await dailyResponse.json();
-        const predictionsData = await predictionsResponse.json();
-        // Process responses
-        const pollutantsData = await pollutantsResponse.json();
-        const healthRiskData = await healthRiskResponse.json();
-        const metricsData = await metricsResponse.json();
-        const heatmapData = heatmapResponse.ok ? await heatmapResponse.json() : [];
+        // One request returns every panel, computed server-side from a single slice of the data
+        const dashboardResponse = await fetch(`${API_BASE_URL}/dashboard?city=${cityParam}&days=7`);
+        if (!dashboardResponse.ok) throw new Error('Failed to fetch dashboard data');
 
-        const processedDailyData = dailyData.data.map(item => ({
-          ...item,
-          datetime: new Date(item.date).toISOString(), // Convert back to datetime format
-          'main.aqi': item['main.aqi'],
-          'components': {
-            pm2_5: item['components.pm2_5'],
-            pm10: item['components.pm10'],
-            o3: item['components.o3'],
-            no2: item['components.no2'],
-            so2: item['components.so2']
-          }
-        }));
-        
-        const formattedPredictions = Array.isArray(predictionsData)
-          ? predictionsData.map(pred => ({
-              ...pred,
-              datetime: pred.datetime,
-              'main.aqi': pred.predicted_aqi,
-              is_prediction: true
-            }))
-          : [];
-    
+        const dashboard = await dashboardResponse.json();
+        const dailyData = dashboard.daily;
+        const predictionsData = dashboard.predictions;
+        const pollutantsData = dashboard.pollutants;
+        const healthRiskData = dashboard.health_risk;
+        const metricsData = dashboard.metrics;
+        const heatmapData = dashboard.heatmap || [];
 
-    
-        // Map API color to Tailwind color class
-        const colorMap = {
-          'green': 'bg-green-500',
-          'yellow': 'bg-yellow-500',
-          'orange': 'bg-orange-500',
-          'red': 'bg-red-500',
-          'purple': 'bg-purple-500'
-        };
+        const processedDailyData = dailyData.data.map(processDailyItem);
+        const formattedPredictions = formatPredictions(predictionsData);
     
         // Transform pollutant data for chart
         const pollutantsArray = pollutantsData 
@@ -151,17 +146,11 @@ const AirQualityDashboard = () => {
         setData(processedDailyData);
         setPredictions(formattedPredictions);
         setPollutants(pollutantsArray);
-        setHealthRisk({
-          level: healthRiskData.level,
-          color: colorMap[healthRiskData.color] || 'bg-blue-500',
-          description: healthRiskData.description
-        });
+        setHealthRisk(formatHealthRisk(healthRiskData));
         setMetrics(metricsData);
         setHeatmapData(heatmapData);
         
-        // Calculate derived data
-        calculateMonthlyAverages(processedDailyData);
-       calculateDailyPatterns(processedDailyData);
+        // Monthly averages and daily patterns follow data (see below)
        filterDataByMonth(processedDailyData, selectedMonth);
     
         // Close the loading alert
@@ -184,6 +173,48 @@ const AirQualityDashboard = () => {
     };
     
     fetchData();
+  }, [selectedCity, refreshKey]);
+
+  // Live updates: the server pushes only what changed for this city, so there is nothing to poll
+  useEffect(() => {
+    const cityParam = selectedCity === 'All Cities' ? 'all' : encodeURIComponent(selectedCity);
+    const source = new EventSource(`${API_BASE_URL}/stream?city=${cityParam}`);
+    // Version the shown panels are at; every event's id is the version it brings them to
+    let version = null;
+    const on = (name, handler) => source.addEventListener(name, event => {
+      version = event.lastEventId;
+      handler(event);
+    });
+
+    source.addEventListener('hello', event => {
+      // EventSource reconnects on its own; if anything changed meanwhile, reload instead of guessing what was missed
+      const hello = JSON.parse(event.data);
+      if (version !== null && hello.version !== version) {
+        setRefreshKey(key => key + 1);
+      }
+      version = hello.version;
+    });
+    // The panels show health risk rather than the raw latest reading, but the event still moves the version on
+    on('latest', () => {});
+    on('daily', event => {
+      // Changed days replace the ones already shown; new days are appended
+      const points = JSON.parse(event.data).data.map(processDailyItem);
+      setData(current => {
+        const byDate = new Map(current.map(item => [item.date, item]));
+        points.forEach(point => byDate.set(point.date, point));
+        return [...byDate.values()].sort((a, b) => new Date(a.datetime) - new Date(b.datetime));
+      });
+    });
+    on('health_risk', event => {
+      setHealthRisk(formatHealthRisk(JSON.parse(event.data)));
+    });
+    on('model', async () => {
+      const response = await fetch(`${API_BASE_URL}/predictions?city=${cityParam}&days=7`);
+      if (response.ok) setPredictions(formatPredictions(await response.json()));
+    });
+    source.addEventListener('resync', () => setRefreshKey(key => key + 1));
+
+    return () => source.close();
   }, [selectedCity]);
 
 
@@ -238,6 +269,11 @@ const AirQualityDashboard = () => {
   useEffect(() => {
     filterDataByMonth(data, selectedMonth);
   }, [selectedMonth, data]);
+
+  useEffect(() => {
+    calculateMonthlyAverages(data);
+    calculateDailyPatterns(data);
+  }, [data]);
   
   
   const calculateMonthlyAverages = (dailyData) => {
@@ -334,16 +370,6 @@ const AirQualityDashboard = () => {
     }
   };
   
-  const getCorrelationData = () => {
-    return filteredData.map(item => ({
-      'PM2.5': item['components.pm2_5'],
-      'PM10': item['components.pm10'],
-      'O3': item['components.o3'],
-      'AQI': item['main.aqi'],
-      datetime: formatDate(item.datetime)
-    }));
-  };
-  
   // Update the month change handler
   const handleMonthChange = (e) => {
     setSelectedMonth(e.target.value);
@@ -487,11 +513,11 @@ const AirQualityDashboard = () => {
             
             {/* Heatmap Tab */}
             {activeTab === 'heatmap' && <RenderHeatmap filteredData={filteredData} heatmapData={heatmapData} 
-            selectedCity={selectedCity} selectedMonth={selectedMonth}/>}
+            selectedCity={selectedCity} selectedMonth={selectedMonth} apiBaseUrl={API_BASE_URL}/>}
             
             {/* Correlations Tab */}
             {activeTab === 'correlations' && (
-              <Correlations selectedCity={selectedCity} selectedMonth={selectedMonth} getCorrelationData={getCorrelationData} />
+              <Correlations selectedCity={selectedCity} selectedMonth={selectedMonth} apiBaseUrl={API_BASE_URL} />
             )}
           </div>
         )}
@@ -1,7 +1,64 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import { ScatterChart, Scatter, XAxis, YAxis, ZAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 
-function Correlations({selectedCity, selectedMonth, getCorrelationData}) {
+const POLLUTANT_LABELS = {
+    'components.co': 'CO',
+    'components.no': 'NO',
+    'components.no2': 'NO2',
+    'components.o3': 'O3',
+    'components.so2': 'SO2',
+    'components.pm2_5': 'PM2.5',
+    'components.pm10': 'PM10',
+    'components.nh3': 'NH3'
+};
+
+const MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'];
+
+const formatR = (value) => (value === null || value === undefined ? 'n/a' : value.toFixed(2));
+
+function Correlations({selectedCity, selectedMonth, apiBaseUrl}) {
+    // Correlation matrices and a bounded, stratified sample of readings, computed server-side
+    const [correlations, setCorrelations] = useState(null);
+
+    useEffect(() => {
+        const cityParam = selectedCity === 'All Cities' ? 'all' : encodeURIComponent(selectedCity);
+        const monthNumber = MONTHS.indexOf(selectedMonth) + 1;
+        const monthParam = monthNumber > 0 ? `&month=${monthNumber}` : '';
+        const load = async () => {
+            try {
+                const response = await fetch(`${apiBaseUrl}/correlations?city=${cityParam}&points=500${monthParam}`);
+                if (response.ok) setCorrelations(await response.json());
+            } catch (err) {
+                console.error('Error fetching correlations:', err);
+            }
+        };
+        load();
+    }, [selectedCity, selectedMonth, apiBaseUrl]);
+
+    if (!correlations) {
+        return <div className="text-sm text-gray-500">Loading correlations...</div>;
+    }
+
+    const points = correlations.points.map(item => ({
+        'PM2.5': item['components.pm2_5'],
+        'O3': item['components.o3'],
+        'AQI': item['main.aqi'],
+        datetime: item.datetime
+    }));
+
+    // Row 0 of each matrix is AQI against every column
+    const columns = correlations.columns;
+    const withAqi = columns.slice(1).map((column, i) => ({
+        name: POLLUTANT_LABELS[column] || column,
+        pearson: correlations.pearson[0][i + 1],
+        spearman: correlations.spearman[0][i + 1]
+    }));
+    const ranked = withAqi.filter(item => item.pearson !== null)
+        .sort((a, b) => Math.abs(b.pearson) - Math.abs(a.pearson));
+    const pm25 = columns.indexOf('components.pm2_5');
+    const pm10 = columns.indexOf('components.pm10');
+    const particulates = correlations.pearson[pm25][pm10];
+
     return (
         <div>
             <div className="mb-4">
@@ -19,7 +76,7 @@ function Correlations({selectedCity, selectedMonth, getCorrelationData}) {
                             <ZAxis range={[60, 400]} />
                             <Tooltip cursor={{ strokeDasharray: '3 3' }} />
                             <Legend />
-                            <Scatter name="PM2.5 vs AQI" data={getCorrelationData()} fill="#8884d8" />
+                            <Scatter name="PM2.5 vs AQI" data={points} fill="#8884d8" />
                         </ScatterChart>
                     </ResponsiveContainer>
                 </div>
@@ -34,13 +91,13 @@ function Correlations({selectedCity, selectedMonth, getCorrelationData}) {
                             <ZAxis range={[60, 400]} />
                             <Tooltip cursor={{ strokeDasharray: '3 3' }} />
                             <Legend />
-                            <Scatter name="Ozone vs AQI" data={getCorrelationData()} fill="#82ca9d" />
+                            <Scatter name="Ozone vs AQI" data={points} fill="#82ca9d" />
                         </ScatterChart>
                     </ResponsiveContainer>
                 </div>
 
                 <div className="mt-4 text-sm text-gray-500">
-                    <p>These scatter plots show the correlation between different pollutants and overall Air Quality Index. A strong correlation indicates that the pollutant has a significant impact on air quality in this area.</p>
+                    <p>These scatter plots show {points.length} of {correlations.readings} readings, sampled across every AQI level. A strong correlation indicates that the pollutant has a significant impact on air quality in this area.</p>
                 </div>
             </div>
 
@@ -48,20 +105,26 @@ function Correlations({selectedCity, selectedMonth, getCorrelationData}) {
                 <h3 className="text-md font-medium text-gray-700 mb-2">Correlation Analysis</h3>
                 <div className="bg-gray-50 p-4 rounded-lg">
                     <p className="text-sm text-gray-700 mb-4">
-                        The following insights are derived from analyzing correlations between pollutants and AQI:
+                        Correlation of each pollutant with AQI (Pearson r / Spearman ρ):
                     </p>
 
                     <ul className="list-disc list-inside text-sm text-gray-600">
-                        <li>PM2.5 shows the strongest correlation with AQI, suggesting it's the primary driver of air quality issues in {selectedCity}</li>
-                        <li>Ozone (O3) levels tend to peak during midday hours when sunlight is strongest</li>
-                        <li>NO2 levels are typically higher during morning and evening rush hours, indicating traffic as a major source</li>
-                        <li>SO2 levels show less correlation with overall AQI in this region</li>
-                        <li>PM10 and PM2.5 show strong correlation, suggesting common sources for these particulates</li>
+                        {ranked.map(item => (
+                            <li key={item.name}>{item.name}: {formatR(item.pearson)} / {formatR(item.spearman)}</li>
+                        ))}
                     </ul>
+
+                    {ranked.length > 0 && (
+                        <ul className="list-disc list-inside text-sm text-gray-600 mt-4">
+                            <li>{ranked[0].name} shows the strongest correlation with AQI, suggesting it's the primary driver of air quality issues in {selectedCity}</li>
+                            <li>{ranked[ranked.length - 1].name} shows the least correlation with overall AQI in this region</li>
+                            <li>PM10 and PM2.5 have a correlation of {formatR(particulates)}{particulates > 0.5 ? ', suggesting common sources for these particulates' : ''}</li>
+                        </ul>
+                    )}
                 </div>
             </div>
         </div>
     )
 }
 
-export default Correlations
\ No newline at end of file
+export default Correlations
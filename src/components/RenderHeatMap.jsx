@@ -1,9 +1,42 @@
 
-import React from 'react';
-import { MapContainer, TileLayer, CircleMarker, Popup } from 'react-leaflet';
+import React, { useEffect, useState } from 'react';
+import { MapContainer, TileLayer, CircleMarker, Popup, useMapEvents } from 'react-leaflet';
 
 
-const RenderHeatmap = ({filteredData, heatmapData, selectedCity, selectedMonth}) => {
+// Loads the pre-aggregated grid cells of the visible area whenever the map stops moving
+const ViewportCells = ({ apiBaseUrl, onCells }) => {
+  const map = useMapEvents({
+    moveend: () => load()
+  });
+
+  const load = async () => {
+    const bounds = map.getBounds();
+    const bbox = [
+      bounds.getWest(),
+      Math.max(bounds.getSouth(), -90),
+      bounds.getEast(),
+      Math.min(bounds.getNorth(), 90)
+    ].join(',');
+    try {
+      const response = await fetch(`${apiBaseUrl}/heatmap?city=all&zoom=${map.getZoom()}&bbox=${bbox}`);
+      if (response.ok) onCells(await response.json());
+    } catch (err) {
+      console.error('Error fetching heatmap cells:', err);
+    }
+  };
+
+  useEffect(() => {
+    load();
+  }, []);
+
+  return null;
+};
+
+const RenderHeatmap = ({filteredData, heatmapData, selectedCity, selectedMonth, apiBaseUrl}) => {
+    // Grid cells for the current viewport; until they arrive the per-city points are shown
+    const [cells, setCells] = useState(null);
+    const showCells = selectedCity === 'All Cities' && apiBaseUrl;
+
     if (!filteredData || filteredData.length === 0) {
       return (
         <div className="p-4">
@@ -15,15 +48,17 @@ const RenderHeatmap = ({filteredData, heatmapData, selectedCity, selectedMonth})
     }
   
     // Process heatmap data from backend
-    const locations = heatmapData
-      .filter(item => item.lat && item.lon)
+    const toLocations = (items) => items
+      .filter(item => item.lat && item.lon && item.avg_aqi !== null)
       .map(item => ({
         lat: parseFloat(item.lat),
         lng: parseFloat(item.lon),
         aqi: item.avg_aqi,
-        city: item.city_name,
+        city: item.city_name || `${item.stations} stations`,
         dataPoints: item.data_points
       }));
+    const locations = toLocations(heatmapData);
+    const markers = showCells && cells ? toLocations(cells) : locations;
   
     if (locations.length === 0) {
       return (
@@ -85,7 +120,9 @@ const RenderHeatmap = ({filteredData, heatmapData, selectedCity, selectedMonth})
               attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
             />
             
-            {locations.map((location, index) => {
+            {showCells && <ViewportCells apiBaseUrl={apiBaseUrl} onCells={setCells} />}
+
+            {markers.map((location, index) => {
               const color = getColor(location.aqi);
               const label = getLabel(location.aqi);
               
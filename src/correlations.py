@@ -0,0 +1,245 @@
+# correlations.py - Running per-city co-moments and stratified scatter samples behind /api/correlations
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AGGREGATE_COLUMNS
+
+# Rows kept per (city, AQI level) stratum for the scatter plots
+SAMPLE_CAPACITY = 1000
+
+
+class CoMoments:
+    """Count, means and centered co-moment matrix of the complete readings of one city.
+
+    Two sets combine exactly (Chan et al.), so new readings are merged in
+    without revisiting the old ones and without the cancellation of raw sums.
+    """
+
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self, n, mean, m2):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, values):
+        """From an (n, columns) array without NaN."""
+        n = len(values)
+        if n == 0:
+            k = values.shape[1]
+            return cls(0, np.zeros(k), np.zeros((k, k)))
+        mean = values.mean(axis=0)
+        centered = values - mean
+        return cls(n, mean, centered.T @ centered)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            return other
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        mean = self.mean + delta * (other.n / n)
+        m2 = self.m2 + other.m2 + np.outer(delta, delta) * (self.n * other.n / n)
+        return CoMoments(n, mean, m2)
+
+    def pearson(self):
+        """Correlation matrix; NaN where a column is constant."""
+        scale = np.sqrt(np.diag(self.m2))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.m2 / np.outer(scale, scale)
+
+
+def _complete(frame):
+    # Rows with a city, a time and every correlated column, plus their values
+    values = frame[AGGREGATE_COLUMNS].to_numpy(dtype=float)
+    keep = ~np.isnan(values).any(axis=1) & frame['city_name'].notna().to_numpy() & frame['datetime'].notna().to_numpy()
+    return frame[keep], values[keep]
+
+
+def _sample_frame(rows, values):
+    # Candidate sample rows: a hash of (city, time) as the sampling key and the AQI level as the stratum
+    sample = pd.DataFrame(values, columns=AGGREGATE_COLUMNS)
+    sample.insert(0, 'datetime', rows['datetime'].to_numpy())
+    sample.insert(0, 'city_name', rows['city_name'].astype(str).to_numpy())
+    sample['key'] = pd.util.hash_pandas_object(sample[['city_name', 'datetime']], index=False).to_numpy()
+    sample['stratum'] = np.rint(values[:, 0]).astype(np.int64)
+    return sample
+
+
+def _bottom_k(sample, by):
+    # The SAMPLE_CAPACITY smallest keys of every stratum; bottom-k samples of disjoint sets merge the same way
+    sample = sample.sort_values(by + ['stratum', 'key'], kind='stable')
+    ranks = sample.groupby(by + ['stratum'], sort=False).cumcount().to_numpy()
+    return sample[ranks < SAMPLE_CAPACITY].reset_index(drop=True)
+
+
+def _fill(quota, capacity, weights, budget):
+    # Hand out budget rows in proportion to weights by largest remainder, never past a stratum's capacity;
+    # whatever a full stratum cannot take goes round again to the others
+    quota = quota.copy()
+    while budget > 0:
+        room = capacity - quota
+        open_strata = room > 0
+        if not open_strata.any():
+            break
+        shares = np.where(open_strata, weights, 0.0)
+        if shares.sum() <= 0:
+            shares = open_strata.astype(float)
+        shares = budget * shares / shares.sum()
+        extra = np.floor(shares).astype(np.int64)
+        order = np.argsort(extra - shares, kind='stable')
+        extra[order[:budget - extra.sum()]] += 1
+        extra = np.minimum(extra, room)
+        quota += extra
+        budget -= int(extra.sum())
+    return quota
+
+
+class CityCorrelations:
+    """Co-moments, per-stratum reading counts and the stratified sample of one city (or all cities)."""
+
+    __slots__ = ('moments', 'strata', 'sample')
+
+    def __init__(self, moments, strata, sample):
+        self.moments = moments
+        self.strata = strata
+        self.sample = sample
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From a frame of readings of any cities, e.g. one month of the dataset."""
+        rows, values = _complete(rows)
+        strata = pd.Series(np.rint(values[:, 0]).astype(np.int64)).value_counts().sort_index()
+        return cls(CoMoments.from_values(values), strata, _bottom_k(_sample_frame(rows, values), []))
+
+    def merge(self, other):
+        strata = self.strata.add(other.strata, fill_value=0).astype(np.int64)
+        return CityCorrelations(self.moments.merge(other.moments), strata,
+                                _bottom_k(pd.concat([self.sample, other.sample], ignore_index=True), []))
+
+    def uniform_sample(self):
+        """Sample rows that form a uniform random sample of all readings.
+
+        Each stratum keeps the rows with the smallest keys, so below the
+        smallest cut-off key of any truncated stratum every stratum is complete.
+        """
+        kept = self.sample['stratum'].value_counts()
+        truncated = self.strata.index[self.strata.to_numpy() > kept.reindex(self.strata.index, fill_value=0).to_numpy()]
+        if len(truncated) == 0:
+            return self.sample
+        cutoff = self.sample.loc[self.sample['stratum'].isin(truncated)].groupby('stratum')['key'].max().min()
+        return self.sample[self.sample['key'] <= cutoff]
+
+    def points(self, limit):
+        """Up to limit sample rows; half the budget is shared equally between AQI levels, so rare levels show up."""
+        kept = self.sample['stratum'].value_counts().sort_index()
+        if kept.sum() <= limit:
+            return self.sample
+        capacity = kept.to_numpy()
+        population = self.strata.reindex(kept.index, fill_value=0).to_numpy(dtype=float)
+        quota = _fill(np.zeros(len(kept), dtype=np.int64), capacity, np.ones(len(kept)), limit // 2)
+        quota = _fill(quota, capacity, population, limit - quota.sum())
+        ranks = self.sample.groupby('stratum', sort=False).cumcount()
+        return self.sample[ranks.to_numpy() < self.sample['stratum'].map(pd.Series(quota, index=kept.index)).to_numpy()]
+
+    def result(self, limit):
+        uniform = self.uniform_sample()
+        ranks = uniform[AGGREGATE_COLUMNS].rank(method='average').to_numpy()
+        if len(ranks) > 1:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                spearman = np.corrcoef(ranks, rowvar=False)
+        else:
+            spearman = np.full((len(AGGREGATE_COLUMNS), len(AGGREGATE_COLUMNS)), np.nan)
+        points = self.points(limit).sort_values('datetime', kind='stable')
+        return {
+            'columns': AGGREGATE_COLUMNS,
+            'pearson': _matrix(self.moments.pearson()),
+            'spearman': _matrix(spearman),
+            'readings': int(self.moments.n),
+            'spearman_sample_size': len(uniform),
+            'exact_spearman': len(uniform) == self.moments.n,
+            'strata': {str(stratum): int(count) for stratum, count in self.strata.items()},
+            'points': points.drop(columns=['key', 'stratum'])
+        }
+
+
+def _matrix(values):
+    # Nested lists with NaN (constant columns, too few readings) as null
+    return [[None if np.isnan(value) else round(float(value), 6) for value in row] for row in values]
+
+
+def _build(rows, values):
+    # {city: CityCorrelations} for rows sorted by city
+    sample = _bottom_k(_sample_frame(rows, values), ['city_name'])
+    cities = {}
+    names = rows['city_name'].astype(str).to_numpy()
+    if len(names):
+        starts = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1))
+        stops = np.append(starts[1:], len(names))
+        strata = pd.Series(np.rint(values[:, 0]).astype(np.int64))
+        sample_groups = dict(tuple(sample.groupby('city_name', sort=False)))
+        for start, stop in zip(starts, stops):
+            city = names[start]
+            cities[city] = CityCorrelations(
+                CoMoments.from_values(values[start:stop]),
+                strata.iloc[start:stop].value_counts().sort_index(),
+                sample_groups[city].reset_index(drop=True))
+    return cities
+
+
+class RunningCorrelations:
+    """Per-city Pearson co-moments and scatter samples that absorb new readings in O(batch).
+
+    Only readings with AQI and every pollutant present are used. Pearson is
+    exact; Spearman is computed on a uniform subset of the sample, which is
+    every reading while a city has no more than SAMPLE_CAPACITY per AQI level.
+    """
+
+    def __init__(self, cities, overall):
+        self.cities = cities
+        self.overall = overall
+
+    @classmethod
+    def from_store(cls, store):
+        """Build from a DataStore, whose rows are already grouped by city."""
+        rows, values = _complete(store.df)
+        cities = _build(rows, values)
+        return cls(cities, _overall(cities))
+
+    def add(self, rows):
+        """Return correlations including the given readings; self is left unchanged."""
+        rows, values = _complete(rows)
+        if rows.empty:
+            return self
+        order = np.argsort(rows['city_name'].astype(str).to_numpy(), kind='stable')
+        batch = _build(rows.iloc[order], values[order])
+        cities = dict(self.cities)
+        for city, correlations in batch.items():
+            cities[city] = cities[city].merge(correlations) if city in cities else correlations
+        overall = _overall(batch)
+        if self.overall is not None:
+            overall = self.overall.merge(overall)
+        return RunningCorrelations(cities, overall)
+
+    def __contains__(self, city):
+        if city == 'all':
+            return self.overall is not None
+        return city in self.cities
+
+    def __getitem__(self, city):
+        return self.overall if city == 'all' else self.cities[city]
+
+
+def _overall(cities):
+    if not cities:
+        return None
+    moments = None
+    strata = None
+    for correlations in cities.values():
+        moments = correlations.moments if moments is None else moments.merge(correlations.moments)
+        strata = correlations.strata if strata is None else strata.add(correlations.strata, fill_value=0)
+    sample = _bottom_k(pd.concat([c.sample for c in cities.values()], ignore_index=True), [])
+    return CityCorrelations(moments, strata.astype(np.int64), sample)
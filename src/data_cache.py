@@ -0,0 +1,150 @@
+# data_cache.py - Typed binary snapshot of the air quality CSV for fast startup
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from prediction_engine import POLLUTANT_FEATURES
+
+# Feather needs pyarrow; without it the snapshot falls back to a pandas pickle
+try:
+    import pyarrow  # noqa: F401
+    SNAPSHOT_FORMAT = 'feather'
+except ImportError:
+    SNAPSHOT_FORMAT = 'pickle'
+
+# Bump when the snapshot layout or column types change so old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+
+
+def read_csv(csv_path):
+    """Parse the raw CSV and normalize datetimes to Asia/Manila."""
+    df = pd.read_csv(
+        csv_path,
+        parse_dates=['datetime'],
+        date_format='mixed'  # Handles multiple datetime formats
+    )
+    return normalize_datetimes(df)
+
+
+def normalize_datetimes(df):
+    """Make the datetime column tz-aware in Asia/Manila."""
+    if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
+        df['datetime'] = pd.to_datetime(df['datetime'], format='mixed')
+
+    # Handle timezone conversion properly
+    if df['datetime'].dt.tz is not None:
+        # Data already has timezone - convert to Asia/Manila
+        df['datetime'] = df['datetime'].dt.tz_convert('Asia/Manila')
+    else:
+        # Data has no timezone - localize to Asia/Manila
+        df['datetime'] = df['datetime'].dt.tz_localize('Asia/Manila')
+    return df
+
+
+def apply_types(df):
+    """Compact column types: categorical city names and float32 pollutants."""
+    df['city_name'] = df['city_name'].astype('category')
+    for col in POLLUTANT_FEATURES:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def snapshot_paths(csv_path):
+    cache_dir = csv_path.parent / '.cache'
+    suffix = 'feather' if SNAPSHOT_FORMAT == 'feather' else 'pkl'
+    return cache_dir / f"{csv_path.stem}.{suffix}", cache_dir / f"{csv_path.stem}.meta.json"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    # Several workers may build the snapshot at once; the last complete write wins
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_meta(meta_path, meta):
+    def write(path):
+        with open(path, 'w') as file:
+            json.dump(meta, file)
+    _write_atomic(meta_path, write)
+
+
+def _snapshot_is_current(csv_path, snapshot_path, meta_path):
+    meta = _read_meta(meta_path)
+    if (meta is None or not snapshot_path.exists()
+            or meta.get('version') != SNAPSHOT_VERSION or meta.get('format') != SNAPSHOT_FORMAT):
+        return False
+
+    stat = csv_path.stat()
+    if meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size:
+        return True
+
+    # The file was touched; only rebuild if its contents actually changed
+    if meta.get('size') == stat.st_size and meta.get('sha256') == file_hash(csv_path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_meta(meta_path, meta)
+        return True
+    return False
+
+
+def load_dataset(csv_path):
+    """Load the dataset, preferring a current snapshot over parsing the CSV.
+
+    Returns (df, source, seconds) where source is 'snapshot' or 'csv'.
+    """
+    start = time.perf_counter()
+    snapshot_path, meta_path = snapshot_paths(csv_path)
+
+    if _snapshot_is_current(csv_path, snapshot_path, meta_path):
+        try:
+            if SNAPSHOT_FORMAT == 'feather':
+                df = pd.read_feather(snapshot_path)
+            else:
+                df = pd.read_pickle(snapshot_path)
+            return df, 'snapshot', time.perf_counter() - start
+        except Exception as e:
+            print(f"Could not read data snapshot, re-parsing CSV: {str(e)}")
+
+    stat = csv_path.stat()
+    df = apply_types(read_csv(csv_path))
+
+    # A read-only deployment still works, it just parses the CSV every start
+    try:
+        snapshot_path.parent.mkdir(exist_ok=True)
+        if SNAPSHOT_FORMAT == 'feather':
+            _write_atomic(snapshot_path, lambda path: df.to_feather(path))
+        else:
+            _write_atomic(snapshot_path, lambda path: df.to_pickle(path))
+        _write_meta(meta_path, {
+            'version': SNAPSHOT_VERSION,
+            'format': SNAPSHOT_FORMAT,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': file_hash(csv_path)
+        })
+    except Exception as e:
+        print(f"Could not write data snapshot: {str(e)}")
+
+    return df, 'csv', time.perf_counter() - start
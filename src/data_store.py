@@ -0,0 +1,261 @@
+# data_store.py - Sorted, per-city indexed view of the air quality dataset
+
+import numpy as np
+import pandas as pd
+
+
+class DataStore:
+    """Holds the dataset sorted by (city_name, datetime) with per-city row offsets.
+
+    Every city occupies one contiguous block of rows, so selecting a city is a
+    binary search over the sorted city names followed by a positional slice
+    instead of a boolean mask over the whole frame. The month column is
+    computed once here rather than on every request.
+    """
+
+    # Arrays derived from the sorted frame, exported alongside its columns when sharing a store
+    INDEX_ARRAYS = ('offsets', 'month', 'timestamps')
+
+    def __init__(self, df):
+        # Rows without a city can never be selected by name, so drop them up front
+        df = df.dropna(subset=['city_name'])
+        df = _with_sorted_categories(df)
+        df = df.sort_values(['city_name', 'datetime'], kind='mergesort').reset_index(drop=True)
+
+        city_values = df['city_name'].to_numpy()
+        if len(city_values):
+            boundaries = np.flatnonzero(city_values[1:] != city_values[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+        else:
+            starts = np.array([], dtype=np.int64)
+
+        self._init_index(
+            df,
+            cities=city_values[starts],
+            offsets=np.append(starts, len(df)).astype(np.int64),
+            # Precomputed calendar month (datetimes are already in Asia/Manila)
+            month=df['datetime'].dt.month.to_numpy(dtype=np.int8),
+            # UTC instants, sorted within each city's block
+            timestamps=df['datetime'].dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        )
+
+    @classmethod
+    def from_index(cls, df, cities, offsets, month, timestamps, latest=None):
+        """Wrap an already sorted frame and its index arrays without sorting or copying."""
+        store = cls.__new__(cls)
+        store._init_index(df, cities, offsets, month, timestamps, latest)
+        return store
+
+    def _init_index(self, df, cities, offsets, month, timestamps, latest=None):
+        self.df = df
+        # cities[i] owns rows offsets[i]:offsets[i + 1]
+        self.cities = cities
+        self.offsets = offsets
+        self.month = month
+        self.timestamps = timestamps
+
+        # Latest observation per city, indexed by city_name
+        if latest is None:
+            latest = df.iloc[offsets[1:] - 1].set_index('city_name', drop=False)
+            latest.index.name = None
+        self.latest = latest
+        # Where in the source CSV this data ends, for incremental tail reads (see ingest.py)
+        self.csv_tail = None
+
+    def __len__(self):
+        return len(self.df)
+
+    def has_city(self, city):
+        start, stop = self.city_range(city)
+        return stop > start
+
+    def city_range(self, city):
+        """Return the (start, stop) row range for a city, or (0, 0) if unknown."""
+        if city == 'all':
+            return 0, len(self.df)
+        i = np.searchsorted(self.cities, city)
+        if i < len(self.cities) and self.cities[i] == city:
+            return int(self.offsets[i]), int(self.offsets[i + 1])
+        return 0, 0
+
+    def positions(self, city='all', month=None, start=None, end=None):
+        """Row positions matching the city, optional month (1-12) and optional time window.
+
+        start/end are inclusive timezone-aware bounds; each city's block is cut
+        with two binary searches over its sorted timestamps. A single contiguous result comes back as a range so
+        no index array is allocated.
+        """
+        if start is None and end is None:
+            first, last = self.city_range(city)
+            if month is None:
+                return range(first, last)
+            return first + np.flatnonzero(self.month[first:last] == month)
+
+        if city == 'all':
+            blocks = zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())
+        else:
+            blocks = [self.city_range(city)]
+        start = self.instant(start) if start is not None else None
+        end = self.instant(end) if end is not None else None
+        windows = []
+        for first, last in blocks:
+            times = self.timestamps[first:last]
+            lo = first + (int(np.searchsorted(times, start, side='left')) if start is not None else 0)
+            hi = first + (int(np.searchsorted(times, end, side='right')) if end is not None else last - first)
+            if hi > lo:
+                windows.append((lo, hi))
+
+        if month is None and len(windows) <= 1:
+            return range(*windows[0]) if windows else range(0, 0)
+        positions = (np.concatenate([np.arange(lo, hi) for lo, hi in windows]) if windows
+                     else np.array([], dtype=np.int64))
+        if month is not None:
+            positions = positions[self.month[positions] == month]
+        return positions
+
+    def instant(self, timestamp):
+        """A timezone-aware timestamp as a value comparable with the stored UTC timestamps."""
+        return np.datetime64(pd.Timestamp(timestamp).tz_convert('UTC').tz_localize(None)).astype(self.timestamps.dtype)
+
+    def take(self, positions, columns=None):
+        """Rows at the given positions (range or index array), optionally projected."""
+        if isinstance(positions, range):
+            positions = slice(positions.start, positions.stop)
+        if columns is None:
+            return self.df.iloc[positions]
+        return self.df.iloc[positions, [self.df.columns.get_loc(col) for col in columns]]
+
+    def date_range(self, positions):
+        """(min, max) datetime over the given positions, or (None, None) if empty."""
+        if len(positions) == 0:
+            return None, None
+        if isinstance(positions, range):
+            positions = slice(positions.start, positions.stop)
+        datetimes = self.df['datetime'].iloc[positions]
+        return datetimes.min(), datetimes.max()
+
+    def position_after(self, city, timestamp, ordinal=None):
+        """First row position that sorts after (city, timestamp) in store order.
+
+        ordinal picks one of several rows sharing that timestamp (see
+        tie_ordinal), so the rows after it with the same timestamp come next;
+        without it every row at the timestamp is skipped.
+        """
+        i = np.searchsorted(self.cities, city)
+        if i < len(self.cities) and self.cities[i] == city:
+            start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+            times = self.timestamps[start:stop]
+            instant = self.instant(timestamp)
+            after = int(np.searchsorted(times, instant, side='right'))
+            if ordinal is None:
+                return start + after
+            return start + min(int(np.searchsorted(times, instant, side='left')) + ordinal + 1, after)
+        # City no longer present: resume at the next city in sort order
+        return int(self.offsets[i])
+
+    def tie_ordinal(self, position):
+        """How many rows of the same city and timestamp come before the row at position.
+
+        Appends place new rows after existing ones with the same timestamp, so
+        the ordinal of a row does not change as data arrives.
+        """
+        i = int(np.searchsorted(self.offsets, position, side='right')) - 1
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        return position - start - int(np.searchsorted(self.timestamps[start:stop], self.timestamps[position], side='left'))
+
+    def latest_for(self, city):
+        """Latest reading for a city, or the newest reading overall for 'all'."""
+        if self.latest.empty:
+            return None
+        if city == 'all':
+            return self.latest.loc[self.latest['datetime'].idxmax()]
+        if city in self.latest.index:
+            return self.latest.loc[city]
+        return None
+
+    def append(self, rows):
+        """Return a new store with the rows merged in; this store is left unchanged.
+
+        Each new row is placed at its sorted position with a binary search, and
+        every column is rebuilt with one vectorized insert instead of re-sorting.
+        """
+        rows = rows.dropna(subset=['city_name'])
+        if rows.empty:
+            return self
+        df, rows = self._conform(rows)
+        rows = rows.sort_values(['city_name', 'datetime'], kind='mergesort').reset_index(drop=True)
+
+        new_times = rows['datetime'].dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        new_city_values = rows['city_name'].astype(object).to_numpy()
+        boundaries = np.flatnonzero(new_city_values[1:] != new_city_values[:-1]) + 1
+        group_starts = np.concatenate(([0], boundaries))
+        group_stops = np.append(boundaries, len(rows))
+
+        # Insertion point of every new row; ties go after existing readings
+        insert_at = np.empty(len(rows), dtype=np.int64)
+        added_cities = []
+        for a, b in zip(group_starts, group_stops):
+            city = new_city_values[a]
+            i = np.searchsorted(self.cities, city)
+            if i < len(self.cities) and self.cities[i] == city:
+                start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+                insert_at[a:b] = start + np.searchsorted(self.timestamps[start:stop], new_times[a:b], side='right')
+            else:
+                insert_at[a:b] = self.offsets[i]
+                added_cities.append(city)
+
+        n = len(self.df)
+        order = np.insert(np.arange(n), insert_at, np.arange(n, n + len(rows)))
+        merged = pd.concat([df, rows], ignore_index=True).take(order).reset_index(drop=True)
+
+        cities = self.cities
+        if added_cities:
+            cities = np.insert(self.cities, np.searchsorted(self.cities, added_cities), added_cities)
+        # Each city now starts after the old and new rows of every city sorted before it
+        offsets = (self.offsets[np.searchsorted(self.cities, cities)]
+                   + np.searchsorted(new_city_values, cities, side='left'))
+        offsets = np.append(offsets, n + len(rows)).astype(np.int64)
+
+        store = DataStore.from_index(
+            merged,
+            cities=cities,
+            offsets=offsets,
+            month=np.insert(self.month, insert_at, rows['datetime'].dt.month.to_numpy(dtype=np.int8)),
+            timestamps=np.insert(self.timestamps, insert_at, new_times.astype(self.timestamps.dtype)),
+            latest=_merge_latest(self.latest, rows)
+        )
+        store.csv_tail = self.csv_tail
+        return store
+
+    def _conform(self, rows):
+        # Match the store's columns and dtypes; categorical city names get the union of categories
+        df = self.df
+        rows = rows[list(df.columns)].copy()
+        for col, dtype in df.dtypes.items():
+            if col == 'datetime':
+                continue
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = dtype.categories.union(pd.Index(rows[col].dropna().unique()))
+                if len(categories) != len(dtype.categories):
+                    df = df.assign(**{col: df[col].cat.set_categories(categories.sort_values())})
+                rows[col] = pd.Categorical(rows[col], dtype=df[col].dtype)
+            else:
+                rows[col] = rows[col].astype(dtype)
+        return df, rows
+
+
+def _with_sorted_categories(df):
+    # Sorting a categorical follows category order, which must be lexical for the city binary search
+    city = df['city_name']
+    if isinstance(city.dtype, pd.CategoricalDtype) and not city.cat.categories.is_monotonic_increasing:
+        df = df.assign(city_name=city.cat.reorder_categories(city.cat.categories.sort_values()))
+    return df
+
+
+def _merge_latest(latest, rows):
+    # Stable sort keeps new rows after existing ones with the same timestamp
+    combined = pd.concat([latest, rows], ignore_index=True)
+    combined = combined.sort_values('datetime', kind='mergesort')
+    merged = combined.groupby('city_name', observed=True).tail(1).set_index('city_name', drop=False)
+    merged.index.name = None
+    return merged.sort_index()
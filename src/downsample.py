@@ -0,0 +1,128 @@
+# downsample.py - LTTB and min/max-per-bucket reduction of time series for chart endpoints
+
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+# Fewer points than this cannot keep both ends of a series plus a bucket in between
+MIN_POINTS = 3
+
+
+def series_starts(keys):
+    """Start of every run of equal keys, e.g. the city of each row in store order."""
+    keys = np.asarray(keys)
+    if len(keys) == 0:
+        return np.array([], dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+
+
+def downsample(x, y, starts, max_points, method='lttb'):
+    """Indices of the points kept when each series is reduced to at most max_points.
+
+    x and y hold several series back to back, each starting at one of starts
+    and sorted by x. Series that already fit are kept whole. The result is
+    sorted, so it keeps the series and time order of the input.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    if max_points < MIN_POINTS:
+        raise ValueError(f'max_points must be at least {MIN_POINTS}')
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.append(starts[1:], len(x)).astype(np.int64)
+    if method == 'minmax':
+        return _minmax(y, starts, stops, max_points)
+    return _lttb(x, y, starts, stops, max_points)
+
+
+def _minmax(y, starts, stops, max_points):
+    # Lowest and highest point of max_points // 2 equal-count buckets per series, so every peak and trough survives
+    lengths = stops - starts
+    buckets = np.where(lengths > max_points, max_points // 2, lengths)
+    local = np.arange(len(y)) - np.repeat(starts, lengths)
+    bucket = (np.repeat(np.cumsum(buckets) - buckets, lengths)
+              + local * np.repeat(buckets, lengths) // np.repeat(lengths, lengths))
+
+    # Buckets are contiguous runs, so each extreme is the first point of its bucket that reaches it; NaN never wins
+    bucket_starts = series_starts(bucket)
+    counts = np.diff(np.append(bucket_starts, len(y)))
+    lowest = _first_reaching(np.where(np.isnan(y), np.inf, y), np.minimum, bucket, bucket_starts, counts)
+    highest = _first_reaching(np.where(np.isnan(y), -np.inf, y), np.maximum, bucket, bucket_starts, counts)
+    return np.union1d(lowest, highest)
+
+
+def _first_reaching(values, extreme, bucket, bucket_starts, counts):
+    hits = np.flatnonzero(values == np.repeat(extreme.reduceat(values, bucket_starts), counts))
+    return hits[series_starts(bucket[hits])]
+
+
+def _lttb(x, y, starts, stops, max_points):
+    """Largest-Triangle-Three-Buckets, one bucket step at a time across all series at once.
+
+    Each series keeps its first and last point; its middle points are split
+    into max_points - 2 equal-count buckets, and each bucket keeps the point
+    forming the largest triangle with the point kept before it and the mean
+    of the next bucket.
+    """
+    lengths = stops - starts
+    long = lengths > max_points
+    keep = [np.arange(start, stop) for start, stop in zip(starts[~long], stops[~long])]
+    if not long.any():
+        return np.concatenate(keep) if keep else np.array([], dtype=np.int64)
+
+    first, last = starts[long], stops[long] - 1
+    n_buckets = max_points - 2
+    middle_lengths = last - first - 1
+    middle = np.concatenate([np.arange(lo + 1, hi) for lo, hi in zip(first, last)])
+    local = middle - np.repeat(first + 1, middle_lengths)
+    step = local * n_buckets // np.repeat(middle_lengths, middle_lengths)
+    series = np.repeat(np.arange(len(first)), middle_lengths)
+
+    # Mean point of every (series, bucket); middle is already ordered that way and no bucket is empty
+    bucket_starts = series_starts(series * n_buckets + step)
+    counts = np.diff(np.append(bucket_starts, len(middle)))
+    mean_x = (np.add.reduceat(x[middle], bucket_starts) / counts).reshape(len(first), n_buckets)
+    mean_y = (np.add.reduceat(y[middle], bucket_starts) / counts).reshape(len(first), n_buckets)
+    # The third vertex for bucket j is the mean of bucket j + 1, or the series' last point
+    next_x = np.column_stack([mean_x[:, 1:], x[last]])
+    next_y = np.column_stack([mean_y[:, 1:], y[last]])
+
+    # Group the middle points by bucket step; within a step they stay ordered by series
+    order = np.argsort(step, kind='stable')
+    step_bounds = np.searchsorted(step[order], np.arange(n_buckets + 1))
+    anchor_x, anchor_y = x[first].copy(), y[first].copy()
+    chosen = np.empty((len(first), n_buckets), dtype=np.int64)
+    for j in range(n_buckets):
+        points = middle[order[step_bounds[j]:step_bounds[j + 1]]]
+        owner = series[order[step_bounds[j]:step_bounds[j + 1]]]
+        ax, ay = anchor_x[owner], anchor_y[owner]
+        area = np.abs((ax - next_x[owner, j]) * (y[points] - ay) - (ax - x[points]) * (next_y[owner, j] - ay))
+        area = np.where(np.isnan(area), -1.0, area)
+
+        # Per-series argmax: the first point of each series segment that reaches the segment maximum
+        segments = series_starts(owner)
+        best = np.maximum.reduceat(area, segments)
+        hits = np.flatnonzero(area == np.repeat(best, np.diff(np.append(segments, len(area)))))
+        winners = hits[series_starts(owner[hits])]
+        chosen[:, j] = points[winners]
+        anchor_x, anchor_y = x[chosen[:, j]], y[chosen[:, j]]
+
+    keep += [first, last, chosen.ravel()]
+    return np.sort(np.concatenate(keep))
+
+
+def downsample_positions(store, positions, max_points, method='lttb', column='main.aqi'):
+    """Reduce store row positions (range or array) to at most max_points per city, chosen by one column."""
+    positions = np.asarray(positions, dtype=np.int64)
+    # Rows are in (city, time) order, so each city's rows form one series
+    city = np.searchsorted(store.offsets, positions, side='right')
+    x = store.timestamps[positions].astype('datetime64[s]').astype(np.int64)
+    y = store.df[column].to_numpy(dtype=float)[positions]
+    return positions[downsample(x, y, series_starts(city), max_points, method)]
+
+
+def downsample_frame(frame, max_points, method='lttb', column='main.aqi'):
+    """Rows of a date-indexed single-series frame (one row per day) reduced to at most max_points."""
+    x = frame.index.to_numpy().astype('datetime64[s]').astype(np.int64)
+    y = frame[column].to_numpy(dtype=float)
+    return frame.iloc[downsample(x, y, series_starts(np.zeros(len(frame))), max_points, method)]
@@ -0,0 +1,169 @@
+# forecast_cache.py - Per-city forecasts precomputed to a fixed horizon and sliced per request
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from prediction_engine import predict_batch
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def future_dates(last_date, days):
+    """Daily forecast dates starting the day after last_date."""
+    return pd.date_range(start=pd.to_datetime(last_date) + timedelta(days=1), periods=days, freq='D')
+
+
+def _by_city(records):
+    # predict_batch output is city-major, so each city's records form one run
+    grouped = {}
+    for record in records:
+        grouped.setdefault(record['city_name'], []).append(record)
+    return grouped
+
+
+class Forecast:
+    """The horizon-day forecast of every city for one (data, model) version.
+
+    'all' forecasts start the day after the newest reading of any city, while a
+    single city's forecast starts after its own latest reading, as before.
+    """
+
+    def __init__(self, version, horizon, all_cities, per_city, computed_at, seconds):
+        self.version = version
+        self.horizon = horizon
+        self.all_cities = all_cities
+        self.per_city = per_city
+        self.computed_at = computed_at
+        self.seconds = seconds
+
+    @classmethod
+    def compute(cls, snapshot, horizon):
+        start = time.perf_counter()
+        latest = snapshot.store.latest
+        all_cities, per_city = {}, {}
+        if len(latest):
+            newest = latest['datetime'].max()
+            all_cities = _by_city(predict_batch(snapshot.model, snapshot.scaler, latest,
+                                                future_dates(newest, horizon)))
+            # Cities that lag behind the newest reading get their own dates, one batch per distinct date
+            per_city = {city: all_cities.get(city, []) for city in latest.index[latest['datetime'] == newest]}
+            for last_date, lagging in latest[latest['datetime'] != newest].groupby('datetime', sort=False):
+                per_city.update(_by_city(predict_batch(snapshot.model, snapshot.scaler, lagging,
+                                                       future_dates(last_date, horizon))))
+            for city in latest.index:
+                per_city.setdefault(city, [])
+        return cls(snapshot.version, horizon, all_cities, per_city,
+                   datetime.now(timezone.utc), time.perf_counter() - start)
+
+    def covers(self, days):
+        return 0 < days <= self.horizon
+
+    def records(self, city, days):
+        """Forecast records for the first `days` days; None if the city has no readings."""
+        if city == 'all':
+            if not self.per_city:
+                return None
+            return [record for records in self.all_cities.values() for record in records[:days]]
+        if city not in self.per_city:
+            return None
+        return self.per_city[city][:days]
+
+    def age_seconds(self):
+        return (datetime.now(timezone.utc) - self.computed_at).total_seconds()
+
+
+class ForecastCache:
+    """Forecasts for the most recent versions, refreshed in the background.
+
+    get() returns the forecast of the snapshot's version. If it is not ready
+    yet, the newest forecast is returned marked stale while a background
+    thread computes the current one; only a cold cache computes inline.
+    """
+
+    def __init__(self, horizon, max_versions=3):
+        self.horizon = horizon
+        self.max_versions = max_versions
+        self._forecasts = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        # Cold requests, the reload warmup and background refreshes of one version compute it once
+        self.flights = SingleFlight('forecast')
+        self.computed = 0
+        self.stale_served = 0
+        self.last_seconds = None
+        self.last_error = None
+
+    def get(self, snapshot):
+        """(forecast, stale) for the snapshot; (None, False) if it has no model or data."""
+        if snapshot.model is None or snapshot.store is None:
+            return None, False
+        with self._lock:
+            forecast = self._forecasts.get(snapshot.version)
+            newest = next(reversed(self._forecasts.values()), None)
+        if forecast is not None:
+            return forecast, False
+        if newest is None:
+            return self.refresh(snapshot), False
+        self.refresh_async(snapshot)
+        with self._lock:
+            self.stale_served += 1
+        return newest, True
+
+    def refresh(self, snapshot):
+        """Compute and store the snapshot's forecast, or wait for the computation already running."""
+        forecast, _ = self.flights.do(snapshot.version, lambda: self._compute(snapshot))
+        return forecast
+
+    def _compute(self, snapshot):
+        forecast = Forecast.compute(snapshot, self.horizon)
+        with self._lock:
+            self._forecasts[forecast.version] = forecast
+            self._forecasts.move_to_end(forecast.version)
+            while len(self._forecasts) > self.max_versions:
+                self._forecasts.popitem(last=False)
+            self.computed += 1
+            self.last_seconds = forecast.seconds
+        return forecast
+
+    def refresh_async(self, snapshot):
+        """Start computing the snapshot's forecast unless it is already known or underway."""
+        if snapshot.model is None or snapshot.store is None:
+            return
+        with self._lock:
+            if snapshot.version in self._forecasts or snapshot.version in self._pending:
+                return
+            self._pending.add(snapshot.version)
+
+        def run():
+            try:
+                self.refresh(snapshot)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Forecast refresh failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(snapshot.version)
+
+        threading.Thread(target=run, daemon=True, name='forecast-refresh').start()
+
+    def stats(self):
+        with self._lock:
+            newest = next(reversed(self._forecasts.values()), None)
+            return {
+                'horizon_days': self.horizon,
+                'versions': list(self._forecasts),
+                'refreshing': sorted(self._pending),
+                'computed': self.computed,
+                'stale_served': self.stale_served,
+                'last_seconds': self.last_seconds,
+                'last_error': self.last_error,
+                'coalescing': self.flights.stats(),
+                'newest_computed_at': newest.computed_at.isoformat() if newest else None
+            }
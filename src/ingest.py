@@ -0,0 +1,156 @@
+# ingest.py - Parsing new readings and reading rows appended to the CSV since it was loaded
+
+import hashlib
+import io
+import json
+import re
+
+import pandas as pd
+
+from data_cache import normalize_datetimes
+from prediction_engine import POLLUTANT_FEATURES
+
+REQUIRED_COLUMNS = ['city_name', 'lat', 'lon', 'datetime', 'main.aqi'] + POLLUTANT_FEATURES
+
+# Trailing UTC offset of an ISO datetime string
+OFFSET_PATTERN = r'(?:Z|[+-]\d{2}:?\d{2})$'
+
+# Bytes before the tail offset that must be unchanged for the file to count as append-only
+TAIL_CHECK_BYTES = 4096
+
+
+def readings_from_records(records):
+    """Frame from reading dicts, flat ("main.aqi") or nested ({"main": {"aqi": ...}})."""
+    if isinstance(records, dict):
+        records = records.get('readings', [records])
+    if not isinstance(records, list) or not records:
+        raise ValueError("Expected a non-empty list of readings")
+    return normalize_readings(pd.json_normalize(records))
+
+
+def readings_from_ndjson(text):
+    records = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return readings_from_records(records)
+
+
+def readings_from_csv(text):
+    return normalize_readings(pd.read_csv(io.StringIO(text)))
+
+
+def normalize_readings(df):
+    """Validate columns and bring datetimes to Asia/Manila; raises ValueError on bad input."""
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+    if df['city_name'].isna().any():
+        raise ValueError("Every reading needs a city_name")
+    try:
+        df = df.copy()
+        df['datetime'] = _parse_datetimes(df['datetime'])
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid datetime values: {str(e)}") from e
+    if df['datetime'].isna().any():
+        raise ValueError("Every reading needs a datetime")
+    return df
+
+
+def _parse_datetimes(values):
+    # A batch may mix offset-aware and naive strings; naive ones are Manila local time
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return normalize_datetimes(pd.DataFrame({'datetime': values}))['datetime']
+    strings = values.astype(str).str.strip()
+    aware = strings.str.contains(OFFSET_PATTERN)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns, Asia/Manila]')
+    if aware.any():
+        parsed[aware] = pd.to_datetime(strings[aware], format='mixed', utc=True).dt.tz_convert('Asia/Manila')
+    if not aware.all():
+        parsed[~aware] = pd.to_datetime(strings[~aware], format='mixed').dt.tz_localize('Asia/Manila')
+    return parsed
+
+
+class CsvTail:
+    """Byte offset up to which a CSV has been loaded, plus a checksum of the bytes before it.
+
+    If the file has only grown since then, the rows past the offset can be
+    ingested on their own instead of reloading everything.
+    """
+
+    def __init__(self, path, offset, checksum):
+        self.path = path
+        self.offset = offset
+        self.checksum = checksum
+
+    @classmethod
+    def at(cls, path, offset):
+        return cls(path, offset, _checksum_before(path, offset))
+
+    def is_append_only(self):
+        try:
+            size = self.path.stat().st_size
+        except OSError:
+            return False
+        return size >= self.offset and _checksum_before(self.path, self.offset) == self.checksum
+
+    def read_new_rows(self):
+        """Return (rows, next_tail) for the complete lines written since the offset."""
+        with open(self.path, 'rb') as file:
+            header = file.readline()
+            file.seek(self.offset)
+            chunk = file.read()
+
+        # Leave a partially written last line for the next read
+        end = chunk.rfind(b'\n') + 1
+        chunk = chunk[:end]
+        next_tail = CsvTail.at(self.path, self.offset + end)
+        if not chunk.strip():
+            return None, next_tail
+        rows = pd.read_csv(io.BytesIO(header + chunk))
+        return normalize_readings(rows), next_tail
+
+    def after_append(self, csv_text):
+        # Tail position after this process appended csv_text itself
+        return CsvTail.at(self.path, self.offset + len(csv_text.encode()))
+
+
+def _checksum_before(path, offset):
+    with open(path, 'rb') as file:
+        file.seek(max(offset - TAIL_CHECK_BYTES, 0))
+        return hashlib.sha1(file.read(min(offset, TAIL_CHECK_BYTES))).hexdigest()
+
+
+def append_to_csv(path, rows):
+    """Append readings to the CSV in its column order and datetime style; returns the written text."""
+    with open(path, 'rb') as file:
+        header = file.readline().decode().strip().split(',')
+        sample = file.readline().decode()
+        size = file.seek(0, 2)
+        needs_newline = False
+        if size:
+            file.seek(size - 1)
+            needs_newline = file.read(1) != b'\n'
+
+    rows = rows.copy()
+    rows['datetime'] = _format_like(rows['datetime'], _sample_datetime(sample, header))
+    text = rows.reindex(columns=header).to_csv(index=False, header=False)
+    if needs_newline:
+        text = '\n' + text
+    with open(path, 'a', newline='') as file:
+        file.write(text)
+    return text
+
+
+def _sample_datetime(line, header):
+    if not line or 'datetime' not in header:
+        return None
+    sample = pd.read_csv(io.StringIO(line), header=None, names=header)['datetime']
+    return str(sample.iloc[0]) if len(sample) else None
+
+
+def _format_like(datetimes, sample):
+    # Mixing naive and offset-aware strings would break parsing of the whole column,
+    # so new rows copy whichever style (and offset) the file already uses
+    if sample and re.search(OFFSET_PATTERN, sample.strip()):
+        tzinfo = pd.Timestamp(sample.strip()).tzinfo
+        strings = datetimes.dt.tz_convert(tzinfo).dt.strftime('%Y-%m-%d %H:%M:%S%z')
+        return strings.str[:-2] + ':' + strings.str[-2:]
+    return datetimes.dt.strftime('%Y-%m-%d %H:%M:%S')
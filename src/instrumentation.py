@@ -0,0 +1,238 @@
+# instrumentation.py - Per-endpoint latency histograms, stage timings and opt-in request profiling
+
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+# pyinstrument is optional; ?profile=pyinstrument falls back to cProfile without it
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+# Upper bounds in seconds, from response-cache hits to cold multi-second work
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Functions listed in a cProfile summary
+PROFILE_LINES = 40
+
+
+class Histogram:
+    """Counts of observations per latency bucket, plus their sum."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Prometheus sample lines: cumulative buckets, then sum and count."""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum!r}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in items.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(items, escaped)) + '}'
+
+
+def current_endpoint():
+    # The route pattern rather than the raw path, so query strings and ids do not explode the label set
+    if has_request_context():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    return 'background'
+
+
+class Metrics:
+    """Request latencies, per-stage timings and registered gauges, rendered as Prometheus text.
+
+    collectors are callables returning (name, type, help, [(labels, value), ...])
+    tuples, so other components (caches, the registry) report their own counters.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.stages = {}
+        self.collectors = []
+
+    def observe_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(endpoint, Histogram()).observe(seconds)
+
+    def observe_stage(self, stage, seconds, endpoint=None):
+        endpoint = endpoint or current_endpoint()
+        with self._lock:
+            self.stages.setdefault((endpoint, stage), Histogram()).observe(seconds)
+        if has_request_context():
+            # Kept per request for ?profile=1 summaries
+            timings = g.setdefault('stage_seconds', {})
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block as one stage (filter, aggregate, predict, serialize, ...) of the current endpoint."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+
+    def timed_iter(self, name, chunks):
+        """Wrap a streamed body so the time spent producing its chunks counts as a stage."""
+        # The body is produced after the view returns, so the endpoint is resolved now
+        return self._timed_chunks(name, chunks, current_endpoint())
+
+    def _timed_chunks(self, name, chunks, endpoint):
+        elapsed = 0.0
+        iterator = iter(chunks)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield chunk
+        finally:
+            self.observe_stage(name, elapsed, endpoint)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            requests = dict(self.requests)
+            latency = {key: _copy(histogram) for key, histogram in self.latency.items()}
+            stages = {key: _copy(histogram) for key, histogram in self.stages.items()}
+
+        lines = ['# HELP aqi_requests_total Requests served, by endpoint, method and status.',
+                 '# TYPE aqi_requests_total counter']
+        for (endpoint, method, status), count in sorted(requests.items()):
+            lines.append(f"aqi_requests_total{_labels({'endpoint': endpoint, 'method': method, 'status': status})} {count}")
+
+        lines += ['# HELP aqi_request_duration_seconds Time from request start until the response body was sent.',
+                  '# TYPE aqi_request_duration_seconds histogram']
+        for endpoint, histogram in sorted(latency.items()):
+            lines += histogram.samples('aqi_request_duration_seconds', {'endpoint': endpoint})
+
+        lines += ['# HELP aqi_stage_duration_seconds Time spent in each stage of a request.',
+                  '# TYPE aqi_stage_duration_seconds histogram']
+        for (endpoint, stage), histogram in sorted(stages.items()):
+            lines += histogram.samples('aqi_stage_duration_seconds', {'endpoint': endpoint, 'stage': stage})
+
+        for collect in self.collectors:
+            for name, metric_type, help_text, samples in collect():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+                for labels, value in samples:
+                    if value is not None:
+                        lines.append(f"{name}{_labels(labels)} {float(value)!r}")
+        return '\n'.join(lines) + '\n'
+
+    def instrument(self, app):
+        """Record every request's latency; streamed responses include the time to send their body."""
+        @app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+
+        @app.after_request
+        def record_latency(response):
+            start = g.get('request_start')
+            if start is None:
+                return response
+            endpoint, method, status = current_endpoint(), request.method, response.status_code
+            # An event stream stays open as long as its client does, so only the time to open it counts
+            if response.is_streamed and response.mimetype != 'text/event-stream':
+                # Streamed bodies are produced after this hook; the server closes the response once sent
+                response.call_on_close(
+                    lambda: self.observe_request(endpoint, method, status, time.perf_counter() - start))
+            else:
+                self.observe_request(endpoint, method, status, time.perf_counter() - start)
+            return response
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    copy.count = histogram.count
+    return copy
+
+
+def enable_profiling(app, authorized):
+    """?profile=1 (cProfile) or ?profile=pyinstrument replaces the response with a profile of the request.
+
+    authorized() decides who may profile; the body is consumed inside the
+    profiled window, so streamed serialization is included.
+    """
+    @app.before_request
+    def start_profile():
+        mode = request.args.get('profile')
+        if mode not in ('1', 'pyinstrument') or not authorized():
+            return
+        if mode == 'pyinstrument' and PyinstrumentProfiler is not None:
+            g.profiler = PyinstrumentProfiler()
+            g.profiler.start()
+        else:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        try:
+            # An event stream never ends, so it is served as usual instead of being read to the end
+            if response.mimetype == 'text/event-stream':
+                return response
+            body_bytes = len(response.get_data())
+        finally:
+            if isinstance(profiler, cProfile.Profile):
+                profiler.disable()
+            else:
+                profiler.stop()
+        elapsed = time.perf_counter() - g.profile_start
+
+        if isinstance(profiler, cProfile.Profile):
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            profiler_name, summary = 'cProfile', output.getvalue()
+        else:
+            profiler_name, summary = 'pyinstrument', profiler.output_text(unicode=False, color=False)
+
+        return Response(json.dumps({
+            'endpoint': current_endpoint(),
+            'status': response.status_code,
+            'elapsed_ms': round(elapsed * 1000, 3),
+            'response_bytes': body_bytes,
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in g.get('stage_seconds', {}).items()},
+            'profiler': profiler_name,
+            'profile': summary
+        }, indent=2), mimetype='application/json')
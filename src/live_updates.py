@@ -0,0 +1,176 @@
+# live_updates.py - Server-Sent Events fan-out: each update is computed once per city and shared by its subscribers
+
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Seconds between comment lines on an idle stream, so proxies and browsers keep the connection open
+KEEPALIVE_SECONDS = 15
+# Frames a subscriber may fall behind before its backlog is replaced by a single resync event
+MAX_BACKLOG = 64
+
+KEEPALIVE_FRAME = b': keepalive\n\n'
+
+
+def sse_frame(event, data, event_id=None):
+    """One SSE message; data is JSON text."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines += [f'data: {line}' for line in data.splitlines() or ['']]
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+RESYNC_FRAME = sse_frame('resync', '{"reason": "backlog"}')
+
+
+class Subscription:
+    """One client's pending frames; push() never blocks, so a slow client cannot stall the others."""
+
+    def __init__(self, city, notify, max_backlog=MAX_BACKLOG):
+        self.city = city
+        self._notify = notify
+        self._max_backlog = max_backlog
+        self._frames = deque()
+        self._lock = threading.Lock()
+
+    def push(self, frames):
+        """Queue frames and wake the client; returns False if its backlog was dropped for a resync."""
+        with self._lock:
+            kept = len(self._frames) + len(frames) <= self._max_backlog
+            if kept:
+                self._frames.extend(frames)
+            else:
+                # The client refetches instead of catching up through an ever-growing queue
+                self._frames.clear()
+                self._frames.append(RESYNC_FRAME)
+        self._notify()
+        return kept
+
+    def drain(self):
+        with self._lock:
+            frames = list(self._frames)
+            self._frames.clear()
+        return frames
+
+
+def iter_frames(subscription, wakeup, keepalive=KEEPALIVE_SECONDS):
+    """Frames for a WSGI response body; wakeup is the threading.Event the subscription notifies."""
+    while True:
+        if not wakeup.wait(keepalive):
+            yield KEEPALIVE_FRAME
+            continue
+        wakeup.clear()
+        yield from subscription.drain()
+
+
+class Broadcaster:
+    """Pushes the changes between successive snapshots to the subscribers of each city.
+
+    updates(old, new, cities) returns {city: [(event, data)]} for the cities
+    (or 'all') that have subscribers. It runs once per change on a single
+    background thread, and each city's frames are encoded once and shared by
+    every subscriber of that city. Swaps that arrive while an update is
+    being sent are merged into one (oldest to newest), so a burst of ingests
+    costs one computation.
+    """
+
+    def __init__(self, updates, encode, max_subscribers=10000):
+        self._updates = updates
+        self._encode = encode
+        self.max_subscribers = max_subscribers
+        self._subscribers = {}
+        self._count = 0
+        self._pending = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+        self.published = 0
+        self.computations = 0
+        self.frames_sent = 0
+        self.resyncs = 0
+        self.errors = 0
+
+    def frame(self, event, data, event_id=None):
+        return sse_frame(event, self._encode(data), event_id)
+
+    def subscribe(self, city, notify, first=()):
+        """Register a client for a city with frames to send before any update; None when at capacity."""
+        subscription = Subscription(city, notify)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            self._subscribers.setdefault(city, set()).add(subscription)
+            self._count += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True, name='live-updates')
+                self._worker.start()
+        if first:
+            subscription.push(list(first))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.city)
+            if subscribers is None or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[subscription.city]
+
+    def publish(self, old, new):
+        """Registry listener: queue the change from old to new for the background thread."""
+        if old is None:
+            return
+        with self._lock:
+            if not self._subscribers:
+                return
+            self._pending = (self._pending[0] if self._pending else old, new)
+            self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._wakeup.wait()
+                (old, new), self._pending = self._pending, None
+                audience = {city: list(subscribers) for city, subscribers in self._subscribers.items()}
+            self.published += 1
+            try:
+                updates = self._updates(old, new, list(audience))
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Live update to {new.version} failed: {str(e)}")
+                updates = {city: None for city in audience}
+            for city, subscribers in audience.items():
+                # Encoded once per city; every subscriber gets the same bytes
+                events = updates.get(city, [])
+                frames = [RESYNC_FRAME] if events is None else [
+                    self.frame(event, data, new.version) for event, data in events]
+                self.computations += 1
+                if frames:
+                    self._deliver(subscribers, frames)
+
+    def _deliver(self, subscribers, frames):
+        for subscription in subscribers:
+            try:
+                if not subscription.push(frames):
+                    self.resyncs += 1
+                self.frames_sent += len(frames)
+            except Exception:
+                # The client's event loop is gone (e.g. server shutdown)
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': self._count,
+                'cities': len(self._subscribers),
+                'published': self.published,
+                'computations': self.computations,
+                'frames_sent': self.frames_sent,
+                'resyncs': self.resyncs,
+                'errors': self.errors
+            }
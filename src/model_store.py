@@ -0,0 +1,192 @@
+# model_store.py - Model artifact formats, lazy loading and load statistics
+
+import os
+import pickle
+import threading
+import time
+
+import joblib
+import numpy as np
+
+from tree_engine import CompiledForest
+
+# Set to 'compiled', 'joblib' or 'pickle' to load that artifact even when another one is newer
+MODEL_FORMAT = os.environ.get('AQI_MODEL_FORMAT')
+# Largest batch the compiled forest predicts when a scikit-learn model is loaded next to it;
+# scikit-learn is faster from a few hundred rows on (see benchmarks/bench_tree_engine.py)
+COMPILED_MAX_ROWS = int(os.environ.get('AQI_COMPILED_MAX_ROWS', '256'))
+
+def save_joblib(model, path):
+    """Write the model uncompressed so its arrays can be memory-mapped on load."""
+    joblib.dump(model, path)
+
+
+def load_artifact(artifact_format, path, mmap=True):
+    """Load a 'compiled', 'joblib' or 'pickle' model artifact."""
+    if artifact_format == 'compiled':
+        # Mapped .npy files: worker processes share one copy of the node arrays
+        return CompiledForest.load(path, mmap=mmap)
+    if artifact_format == 'joblib':
+        # Large arrays are mapped instead of read and copied through the unpickler
+        return joblib.load(path, mmap_mode='r' if mmap else None)
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def choose_artifact(joblib_path, pickle_path, compiled_path=None):
+    """(format, path) of the newest scikit-learn model artifact.
+
+    On equal mtimes the joblib file beats the pickle. The compiled forest is
+    only chosen when AQI_MODEL_FORMAT=compiled or when it is the only artifact;
+    otherwise it serves small batches next to the scikit-learn model (see
+    compiled_companion). AQI_MODEL_FORMAT forces one format as long as its file exists.
+    """
+    candidates = [('joblib', joblib_path), ('pickle', pickle_path)]
+    if compiled_path is not None:
+        candidates.append(('compiled', compiled_path))
+    found = []
+    for artifact_format, path in candidates:
+        try:
+            found.append((path.stat().st_mtime_ns, artifact_format, path))
+        except OSError:
+            continue
+    for _, artifact_format, path in found:
+        if artifact_format == MODEL_FORMAT:
+            return artifact_format, path
+    sklearn_found = [entry for entry in found if entry[1] != 'compiled']
+    if sklearn_found:
+        found = sklearn_found
+    if not found:
+        return 'pickle', pickle_path
+    newest = max(mtime for mtime, _, _ in found)
+    return next((artifact_format, path) for mtime, artifact_format, path in found if mtime == newest)
+
+
+def compiled_companion(compiled_path, model_path):
+    """The compiled forest to serve small batches for the model at model_path, or None.
+
+    Only a forest written after the model (as train_model.py and tree_engine.py
+    do) is taken to be compiled from it; none is used while AQI_MODEL_FORMAT
+    forces a format.
+    """
+    if MODEL_FORMAT is not None:
+        return None
+    try:
+        if compiled_path.stat().st_mtime_ns >= model_path.stat().st_mtime_ns:
+            return compiled_path
+    except OSError:
+        pass
+    return None
+
+
+def _rss_bytes():
+    # Resident set size from /proc (Linux only)
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class LazyModel:
+    """Stands in for a model and loads the artifact on first use.
+
+    predict() and any other attribute access trigger the load, so snapshots
+    can be built without paying for a model no request has asked for yet.
+    """
+
+    def __init__(self, path, artifact_format):
+        self._path = path
+        self._format = artifact_format
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.resident_bytes = None
+
+    def load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    rss_before = _rss_bytes()
+                    start = time.perf_counter()
+                    model = load_artifact(self._format, self._path)
+                    self.load_seconds = time.perf_counter() - start
+                    rss_after = _rss_bytes()
+                    if rss_before is not None and rss_after is not None:
+                        self.resident_bytes = max(rss_after - rss_before, 0)
+                    print(f"Model loaded from {self._path} in {self.load_seconds:.3f}s")
+                    self._model = model
+        return self._model
+
+    def warm_up(self, n_features):
+        """Load the model and run one prediction so its memory is paged in."""
+        self.load().predict(np.zeros((1, n_features)))
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def predict(self, X):
+        return self.load().predict(X)
+
+    def __getattr__(self, name):
+        # Only reached for attributes not set in __init__, i.e. those of the wrapped model
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def info(self):
+        try:
+            if self._path.is_dir():
+                file_bytes = sum(entry.stat().st_size for entry in self._path.iterdir())
+            else:
+                file_bytes = self._path.stat().st_size
+        except OSError:
+            file_bytes = None
+        return {
+            'path': str(self._path),
+            'format': self._format,
+            'file_bytes': file_bytes,
+            'loaded': self.loaded,
+            'load_seconds': self.load_seconds,
+            'resident_bytes': self.resident_bytes
+        }
+
+
+class BatchSizeRouter:
+    """A scikit-learn model and its compiled forest, each used for the batch sizes it is fastest at.
+
+    predict_batch asks for_rows() which model to use: the compiled forest for
+    batches of up to max_rows rows, scikit-learn for larger ones such as the
+    precomputed forecasts.
+    """
+
+    def __init__(self, model, compiled, max_rows=COMPILED_MAX_ROWS):
+        self.model = model
+        self.compiled = compiled
+        self.max_rows = max_rows
+
+    def _load_compiled(self):
+        # None once the compiled forest failed to load, e.g. one compiled by an older engine version
+        if self.compiled is not None:
+            try:
+                return self.compiled.load()
+            except (OSError, ValueError) as e:
+                print(f"Compiled forest unavailable, using the scikit-learn model for every batch: {str(e)}")
+                self.compiled = None
+        return None
+
+    def for_rows(self, n_rows):
+        compiled = self._load_compiled() if n_rows <= self.max_rows else None
+        return compiled if compiled is not None else self.model
+
+    def warm_up(self, n_features):
+        self.model.warm_up(n_features)
+        compiled = self._load_compiled()
+        if compiled is not None:
+            compiled.predict(np.zeros((1, n_features)))
+
+    def info(self):
+        info = self.model.info()
+        info['small_batches'] = dict(self.compiled.info(), max_rows=self.max_rows) if self.compiled is not None else None
+        return info
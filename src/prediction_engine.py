@@ -0,0 +1,83 @@
+# prediction_engine.py - Batched AQI inference for the predictions endpoint
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Same feature order the model and scaler were trained with (see train_model.py)
+POLLUTANT_FEATURES = ['components.co', 'components.no', 'components.no2',
+                      'components.o3', 'components.so2', 'components.pm2_5',
+                      'components.pm10', 'components.nh3']
+TIME_FEATURES = ['hour', 'day', 'month', 'day_of_week']
+MODEL_FEATURES = POLLUTANT_FEATURES + TIME_FEATURES
+
+
+def build_feature_matrix(last_points, future_dates):
+    """Build one feature row per (city, date), city-major like the old per-row loop."""
+    n_dates = len(future_dates)
+    base = last_points[POLLUTANT_FEATURES].to_numpy(dtype=float)
+    time_features = np.column_stack([
+        future_dates.hour,
+        future_dates.day,
+        future_dates.month,
+        future_dates.dayofweek
+    ]).astype(float)
+
+    X = np.empty((len(base) * n_dates, len(MODEL_FEATURES)))
+    X[:, :len(POLLUTANT_FEATURES)] = np.repeat(base, n_dates, axis=0)
+    X[:, len(POLLUTANT_FEATURES):] = np.tile(time_features, (len(base), 1))
+
+    # Keep the column names so the scaler sees the same schema it was fitted on
+    return pd.DataFrame(X, columns=MODEL_FEATURES)
+
+
+def predict_batch(model, scaler, last_points, future_dates):
+    """Scale and predict every (city, date) pair in a single call.
+
+    Returns the same list of prediction records the endpoint used to build one at a time.
+    """
+    if len(last_points) == 0 or len(future_dates) == 0:
+        return []
+
+    X = build_feature_matrix(last_points, future_dates)
+
+    # Rows with missing pollutant values used to fail individually and get skipped
+    valid = ~np.isnan(X.to_numpy()).any(axis=1)
+    if not valid.all():
+        invalid_cities = (~valid).reshape(len(last_points), -1).any(axis=1)
+        skipped = last_points['city_name'].to_numpy()[invalid_cities]
+        logger.warning(f"Skipping predictions with missing features for: {list(skipped)}")
+
+    predicted = np.full(len(X), np.nan)
+    if valid.any():
+        if hasattr(model, 'for_rows'):
+            # Small batches go to the compiled forest, large ones to scikit-learn (see model_store.py)
+            model = model.for_rows(int(valid.sum()))
+        if getattr(model, 'includes_scaler', False):
+            # Compiled forests have the scaler folded into their thresholds (see tree_engine.py)
+            predicted[valid] = model.predict(X.to_numpy()[valid])
+        else:
+            predicted[valid] = model.predict(scaler.transform(X[valid]))
+
+    n_dates = len(future_dates)
+    city_names = np.repeat(last_points['city_name'].to_numpy(), n_dates).tolist()
+    lats = np.repeat(last_points['lat'].to_numpy(dtype=float), n_dates).tolist()
+    lons = np.repeat(last_points['lon'].to_numpy(dtype=float), n_dates).tolist()
+    dates = [date.isoformat() for date in future_dates] * len(last_points)
+    predicted_list = predicted.tolist()
+    valid_list = valid.tolist()
+
+    return [
+        {
+            'datetime': dates[i],
+            'predicted_aqi': predicted_list[i],
+            'city_name': city_names[i],
+            'lat': lats[i],
+            'lon': lons[i],
+            'is_prediction': True
+        }
+        for i in range(len(X)) if valid_list[i]
+    ]
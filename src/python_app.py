@@ -1,18 +1,42 @@
 # api.py - Flask API to serve the React frontend
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from sklearn.preprocessing import StandardScaler
 import pickle
-from functools import lru_cache
 from flask_compress import Compress
 import json
+import hashlib
+import hmac
+import threading
+import time
 from pathlib import Path
 
+from data_cache import load_dataset
+from data_store import DataStore
+from downsample import downsample_frame, downsample_positions
+from forecast_cache import ForecastCache, future_dates
+from instrumentation import Metrics, enable_profiling
+from live_updates import KEEPALIVE_SECONDS, Broadcaster, iter_frames
+from shared_dataset import attach as attach_shared_dataset
+from spatial_index import SpatialIndex
+from aggregates import RunningAggregates
+from correlations import CityCorrelations, RunningCorrelations
+from ingest import (CsvTail, append_to_csv, readings_from_csv, readings_from_ndjson,
+                    readings_from_records)
+from model_store import BatchSizeRouter, LazyModel, choose_artifact, compiled_companion
+from prediction_engine import MODEL_FEATURES, POLLUTANT_FEATURES, predict_batch
+from registry import Registry, derived_flights
+from response_cache import ResponseCache
+from rollups import Rollups
+from serializers import (FORMAT_MIMETYPES, arrow_bytes, decode_cursor, encode_cursor,
+                         iso_strings, iter_arrow_stream, iter_json_document, iter_ndjson,
+                         negotiate_format, parquet_bytes, shortest_float32)
+
 import logging
 import traceback
 
@@ -48,63 +72,130 @@ app.json_encoder = CustomJSONEncoder  # Use custom encoder
 Compress(app)  # Add compression to responses
 CORS(app)  # Enable CORS for all routes
 
+# Latency histograms and stage timings for /api/metrics/internal; ?profile=1 profiles a single request
+metrics = Metrics()
+metrics.instrument(app)
+enable_profiling(app, lambda: admin_authorized())
+
+# AQI_VERBOSE=1 prints sample rows and per-month ranges whenever the CSV is loaded
+VERBOSE = os.environ.get('AQI_VERBOSE', '0') not in ('', '0')
+
+# Upper bound for the per_page parameter of paginated endpoints
+MAX_PER_PAGE = 10000
+# Upper bound for max_points on the chart endpoints
+MAX_CHART_POINTS = 10000
+# Scatter points returned by /api/correlations by default and at most
+DEFAULT_CORRELATION_POINTS = 500
+MAX_CORRELATION_POINTS = 5000
+
+# Health risk bands: an AQI up to each bound maps to the level at the same position
+HEALTH_RISK_BOUNDS = np.array([1, 2, 3, 4])
+HEALTH_RISK_LEVELS = [
+    {
+        'level': 'Good',
+        'color': 'green',
+        'description': 'Air quality is considered satisfactory, and air pollution poses little or no risk.'
+    },
+    {
+        'level': 'Moderate',
+        'color': 'yellow',
+        'description': 'Air quality is acceptable; however, some pollutants may be a concern for a small number of people.'
+    },
+    {
+        'level': 'Unhealthy for Sensitive Groups',
+        'color': 'orange',
+        'description': 'Members of sensitive groups may experience health effects. The general public is not likely to be affected.'
+    },
+    {
+        'level': 'Unhealthy',
+        'color': 'red',
+        'description': 'Everyone may begin to experience health effects; members of sensitive groups may experience more serious effects.'
+    },
+    {
+        'level': 'Very Unhealthy',
+        'color': 'purple',
+        'description': 'Health warnings of emergency conditions. The entire population is more likely to be affected.'
+    }
+]
+
+def health_risk_index(aqi):
+    # Index into HEALTH_RISK_LEVELS for a scalar or an array of AQI values
+    return np.searchsorted(HEALTH_RISK_BOUNDS, aqi, side='left')
+
+# Data and model files (model paths are relative to the working directory, as train_model.py writes them)
+# AQI_CSV_PATH points the API at another dataset with the same columns (e.g. a generated benchmark set)
+CSV_PATH = Path(os.environ.get('AQI_CSV_PATH') or Path(__file__).parent / "assets" / "updated_air_quality.csv")
+MODEL_PATH = Path('aqi_model.pkl')
+MODEL_JOBLIB_PATH = Path('aqi_model.joblib')
+MODEL_COMPILED_PATH = Path('aqi_model.compiled')
+SCALER_PATH = Path('aqi_scaler.pkl')
+
+def file_version(*paths):
+    # Short id derived from file mtimes and sizes, identical across worker processes
+    stamps = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            stamps.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            stamps.append('missing')
+    return hashlib.sha1('|'.join(stamps).encode()).hexdigest()[:12]
+
 # Load the prediction model
-@lru_cache(maxsize=1)
-def load_model():
+def load_model_files():
+    # The forest itself loads on first use (or in a warmup); the small scaler is read right away
     try:
         print("Attempting to load model files...")
-        with open('aqi_model.pkl', 'rb') as file:
-            model = pickle.load(file)
-            print("Model loaded successfully")
-        with open('aqi_scaler.pkl', 'rb') as file:
+        artifact_format, model_path = choose_artifact(MODEL_JOBLIB_PATH, MODEL_PATH, MODEL_COMPILED_PATH)
+        if not model_path.exists():
+            raise FileNotFoundError(f"Model file not found at {model_path}")
+        model = LazyModel(model_path, artifact_format)
+        compiled_path = compiled_companion(MODEL_COMPILED_PATH, model_path) if artifact_format != 'compiled' else None
+        if compiled_path is not None:
+            model = BatchSizeRouter(model, LazyModel(compiled_path, 'compiled'))
+            version = file_version(model_path, compiled_path, SCALER_PATH)
+        else:
+            version = file_version(model_path, SCALER_PATH)
+        with open(SCALER_PATH, 'rb') as file:
             scaler = pickle.load(file)
             print("Scaler loaded successfully")
-        return model, scaler
+        return model, scaler, version
     except Exception as e:
         print(f"Error loading model: {str(e)}")
-        return None, None
+        return None, None, None
 
-# Load and preprocess data with caching
-@lru_cache(maxsize=1)
+# Load and preprocess data
 def load_data():
     try:
-        current_dir = Path(__file__).parent
-        csv_path = current_dir / "assets" / "updated_air_quality.csv"
+        csv_path = CSV_PATH
         
         print(f"Looking for CSV at: {csv_path}")
         
         if not csv_path.exists():
             raise FileNotFoundError(f"CSV file not found at {csv_path}")
 
-        # Load data with explicit datetime parsing
-        df = pd.read_csv(
-            csv_path,
-            parse_dates=['datetime'],
-            date_format='mixed'  # Handles multiple datetime formats
-        )
-        
-        # Handle timezone conversion properly
-        if df['datetime'].dt.tz is not None:
-            # Data already has timezone - convert to Asia/Manila
-            df['datetime'] = df['datetime'].dt.tz_convert('Asia/Manila')
+        # Load from the typed snapshot when it matches the CSV, otherwise parse and rebuild it
+        df, source, elapsed = load_dataset(csv_path)
+        if source == 'snapshot':
+            print(f"Warm load from data snapshot took {elapsed:.2f}s")
         else:
-            # Data has no timezone - localize to Asia/Manila
-            df['datetime'] = df['datetime'].dt.tz_localize('Asia/Manila')
+            print(f"Cold load from CSV (snapshot rebuilt) took {elapsed:.2f}s")
         
         # Validate data
         if df.empty:
             raise ValueError("Loaded empty DataFrame")
             
         print(f"Successfully loaded {len(df)} records")
-        print(f"Date range: {df['datetime'].min()} to {df['datetime'].max()}")
-        print(f"Timezone info: {df['datetime'].dt.tz}")
+        if VERBOSE:
+            print(f"Date range: {df['datetime'].min()} to {df['datetime'].max()}")
+            print(f"Timezone info: {df['datetime'].dt.tz}")
+
+            print("\nSample May data:")
+            print(df[df['datetime'].dt.month == 5].head(3))
+
+            print("\nDate ranges by month:")
+            print(df.groupby(df['datetime'].dt.month)['datetime'].agg(['min', 'max', 'count']))
 
-        print("\nSample May data:")
-        print(df[df['datetime'].dt.month == 5].head(3))
-        
-        print("\nDate ranges by month:")
-        print(df.groupby(df['datetime'].dt.month)['datetime'].agg(['min', 'max', 'count']))
-        
         return df
         
     except Exception as e:
@@ -112,6 +203,119 @@ def load_data():
         print(traceback.format_exc())
         return None
 
+# Build the sorted per-city index for a freshly loaded dataset
+def build_data_store():
+    # In shared mode, map the dataset published by the loader process instead of loading a private copy
+    shared_dir = os.environ.get('AQI_SHARED_DATA')
+    if shared_dir:
+        try:
+            store = attach_shared_dataset(shared_dir)
+            print(f"Attached to shared dataset version {store.shared_version} ({len(store)} records)")
+            return store, store.shared_version
+        except Exception as e:
+            print(f"Could not attach to shared dataset in {shared_dir}, loading privately: {str(e)}")
+
+    version = file_version(CSV_PATH)
+    csv_size = CSV_PATH.stat().st_size if CSV_PATH.exists() else 0
+    df = load_data()
+    if df is None:
+        return None, None
+    store = DataStore(df)
+    # Remember how much of the CSV is loaded so appended lines can be ingested on their own
+    store.csv_tail = CsvTail.at(CSV_PATH, csv_size)
+    return store, version
+
+# The registry owns the live (data, model) version; the watcher polls the shared manifest in shared mode
+registry = Registry(
+    build_data_store,
+    load_model_files,
+    data_paths=[Path(os.environ['AQI_SHARED_DATA']) / 'manifest.json' if os.environ.get('AQI_SHARED_DATA') else CSV_PATH],
+    model_paths=[MODEL_PATH, MODEL_JOBLIB_PATH, MODEL_COMPILED_PATH, SCALER_PATH],
+    refresh_data=lambda: ingest_csv_tail() is not None
+)
+
+def current_snapshot():
+    # Pin one snapshot per request so a reload mid-request cannot mix versions
+    if has_request_context():
+        if 'snapshot' not in g:
+            g.snapshot = registry.current()
+        return g.snapshot
+    return registry.current()
+
+def get_data_store():
+    return current_snapshot().store
+
+# Rendered GET responses; the key includes the data (or data:model) version so reloads never serve stale bodies
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get('AQI_RESPONSE_CACHE_ENTRIES', '512')),
+    max_bytes=int(os.environ.get('AQI_RESPONSE_CACHE_MB', '64')) * 1024 * 1024
+)
+
+# Every city's forecast up to this many days, recomputed when the data or model changes
+forecast_cache = ForecastCache(horizon=int(os.environ.get('AQI_FORECAST_DAYS', '90')))
+
+def response_version(uses_model):
+    # Version and Last-Modified time of what a cached endpoint reads
+    snapshot = current_snapshot()
+    version = snapshot.version if uses_model else snapshot.data_version
+    return version, snapshot.loaded_at.astimezone(timezone.utc)
+
+def load_model():
+    snapshot = current_snapshot()
+    return snapshot.model, snapshot.scaler
+
+def selection_offset(positions, position):
+    # Index of the first selected row at or after a store position
+    if isinstance(positions, range):
+        return min(max(position - positions.start, 0), len(positions))
+    return int(np.searchsorted(positions, position))
+
+def parse_month(month):
+    # Month filter (1-12) from a query string value, None if absent or invalid
+    if month and month.isdigit():
+        month_num = int(month)
+        if 1 <= month_num <= 12:
+            return month_num
+    return None
+
+def parse_downsample(args):
+    # (max_points, method) from the query, or (None, None) when the full series is wanted
+    if 'max_points' not in args:
+        return None, None
+    try:
+        max_points = int(args['max_points'])
+    except ValueError:
+        raise ValueError('max_points must be an integer')
+    if not 3 <= max_points <= MAX_CHART_POINTS:
+        raise ValueError(f'max_points must be between 3 and {MAX_CHART_POINTS}')
+    method = args.get('downsample', 'lttb')
+    if method not in ('lttb', 'minmax'):
+        raise ValueError('downsample must be lttb or minmax')
+    return max_points, method
+
+def parse_time_range(args):
+    # Inclusive (start, end) from ISO start/end query values; naive times are Manila time
+    # and a date-only end covers that whole day. Raises ValueError for unparseable values.
+    bounds = []
+    for name in ('start', 'end'):
+        value = args.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            timestamp = pd.Timestamp(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.tz_localize('Asia/Manila')
+        if name == 'end' and len(value) == len('YYYY-MM-DD'):
+            timestamp = timestamp + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+        bounds.append(timestamp)
+    start, end = bounds
+    if start is not None and end is not None and start > end:
+        raise ValueError('start must not be after end')
+    return start, end
+
 @app.route('/api/docs/historical', methods=['GET'])
 def historical_docs():
     """Returns documentation for the historical data endpoint
@@ -122,11 +326,33 @@ def historical_docs():
         type: string
         required: false
         default: all
+      - name: start
+        in: query
+        type: string
+        required: false
+        description: ISO 8601 date or datetime; only readings at or after it (Manila time unless an offset is given)
+      - name: end
+        in: query
+        type: string
+        required: false
+        description: ISO 8601 date or datetime; only readings at or before it (a date includes the whole day)
+      - name: max_points
+        in: query
+        type: integer
+        required: false
+        description: Reduce each city's series to at most this many readings (3-10000), chosen on AQI
+      - name: downsample
+        in: query
+        type: string
+        required: false
+        default: lttb
+        description: lttb (largest triangle three buckets) or minmax (lowest and highest reading per bucket)
       - name: page
         in: query
         type: integer
         required: false
         default: 1
+        description: Pagination applies only when page, per_page or cursor is given
       - name: per_page
         in: query
         type: integer
@@ -137,6 +363,17 @@ def historical_docs():
         type: string
         required: false
         description: Comma-separated list of fields to return
+      - name: cursor
+        in: query
+        type: string
+        required: false
+        description: Opaque next_cursor from the previous page; takes precedence over page
+      - name: format
+        in: query
+        type: string
+        required: false
+        default: json
+        description: json, or ndjson for one record per line (pagination in X-Total-Count / X-Next-Cursor headers)
     responses:
       200:
         description: Historical air quality data
@@ -162,77 +399,72 @@ def historical_docs():
         'datetime_format': 'ISO 8601 (YYYY-MM-DDTHH:MM:SS)'
     })
 
-# Pre-calculate aggregated data
-@lru_cache(maxsize=1)
+# Pre-calculate aggregated data once per data version
 def get_aggregated_data():
-    df = load_data()
-    if df is None:
+    return current_snapshot().cached('aggregated_data', compute_aggregated_data)
+
+def compute_aggregated_data(snapshot):
+    # Running sums per city; ingested readings update them without a rescan
+    if snapshot.store is None:
         return None
-    
-    cities = df['city_name'].unique()
-    aggregated_data = {}
-    
-    # Define pollutant columns once
-    pollutant_cols = ['components.co', 'components.no', 'components.no2', 
-                      'components.o3', 'components.so2', 'components.pm2_5', 
-                      'components.pm10', 'components.nh3']
-    
-    for city in cities:
-        city_df = df[df['city_name'] == city]
-        
-        # Calculate pollutant means
-        pollutant_means = {col.split('.')[-1].upper(): float(city_df[col].mean()) for col in pollutant_cols}
-        
-        # Calculate trend
-        city_df_sorted = city_df.sort_values('datetime')
-        if len(city_df_sorted) >= 2:
-            first_aqi = float(city_df_sorted.iloc[0]['main.aqi'])
-            last_aqi = float(city_df_sorted.iloc[-1]['main.aqi'])
-            trend = 'Worsening' if last_aqi > first_aqi else 'Improving'
-        else:
-            trend = 'Stable'
-        
-        # Store aggregated data
-        aggregated_data[city] = {
-            'average_aqi': float(city_df['main.aqi'].mean()),
-            'pollutants': pollutant_means,
-            'primary_pollutant': max(pollutant_means.items(), key=lambda x: x[1])[0],
-            'trend': trend
-        }
-    
-    # Also add an 'all' city aggregation
-    all_avg_aqi = float(df['main.aqi'].mean())
-    all_pollutant_means = {col.split('.')[-1].upper(): float(df[col].mean()) for col in pollutant_cols}
-    all_primary_pollutant = max(all_pollutant_means.items(), key=lambda x: x[1])[0]
-    
-    df_sorted = df.sort_values('datetime')
-    if len(df_sorted) >= 2:
-        all_first_aqi = float(df_sorted.iloc[0]['main.aqi'])
-        all_last_aqi = float(df_sorted.iloc[-1]['main.aqi'])
-        all_trend = 'Worsening' if all_last_aqi > all_first_aqi else 'Improving'
-    else:
-        all_trend = 'Stable'
-    
-    aggregated_data['all'] = {
-        'average_aqi': all_avg_aqi,
-        'pollutants': all_pollutant_means,
-        'primary_pollutant': all_primary_pollutant,
-        'trend': all_trend
-    }
-    
-    return aggregated_data
+    return RunningAggregates.from_store(snapshot.store)
+
+# Daily, monthly and hour-of-day rollups, also kept current by ingestion
+def get_rollups():
+    return current_snapshot().cached('rollups', compute_rollups)
+
+def compute_rollups(snapshot):
+    if snapshot.store is None:
+        return None
+    return Rollups.from_store(snapshot.store)
+
+def get_spatial_index():
+    return current_snapshot().cached('spatial_index', compute_spatial_index)
+
+def compute_spatial_index(snapshot):
+    if snapshot.store is None:
+        return None
+    return SpatialIndex.from_store(snapshot.store)
+
+# Pearson co-moments and scatter samples per city, kept current by ingestion
+def get_correlations():
+    return current_snapshot().cached('correlations', compute_correlations)
+
+def compute_correlations(snapshot):
+    if snapshot.store is None:
+        return None
+    return RunningCorrelations.from_store(snapshot.store)
+
+def parse_bbox(value):
+    # (west, south, east, north) from "west,south,east,north"; west > east crosses the antimeridian
+    if not value:
+        return None
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4 or not (-90 <= parts[1] <= parts[3] <= 90):
+        raise ValueError('bbox must be west,south,east,north in degrees')
+    return tuple(parts)
+
+def parse_zoom(value):
+    # Web map zoom level 0-22; levels past spatial_index.MAX_ZOOM share its grid
+    if value is None:
+        return None
+    try:
+        zoom = int(value)
+    except ValueError:
+        raise ValueError('zoom must be an integer')
+    if not 0 <= zoom <= 22:
+        raise ValueError('zoom must be between 0 and 22')
+    return zoom
 
 @app.route('/api/cities', methods=['GET'])
+@response_cache.cached(response_version)
 def get_cities():
     try:
-        df = load_data()
-        if df is None:
+        store = get_data_store()
+        if store is None:
             return jsonify({'error': 'Data not loaded', 'details': 'Check server logs'}), 500
             
-        if 'city_name' not in df.columns:
-            return jsonify({'error': 'Data format error', 'details': 'city_name column missing'}), 500
-            
-        cities = df['city_name'].unique().tolist()
+        cities = store.cities.tolist()
         return jsonify(cities)
         
     except Exception as e:
@@ -240,142 +472,185 @@ def get_cities():
         return jsonify({'error': 'Server error', 'details': str(e)}), 500
 
 @app.route('/api/historical', methods=['GET'])
+@response_cache.cached(response_version)
 def get_historical_data():
     try:
-        df = load_data()
-        if df is None:
+        store = get_data_store()
+        if store is None:
             return jsonify({'error': 'Data not available'}), 500
 
         city = request.args.get('city', 'all')
-        month = request.args.get('month', None)
-        
-        # Make a copy to avoid SettingWithCopyWarning
-        df = df.copy()
+        month_num = parse_month(request.args.get('month', None))
+        try:
+            start_time, end_time = parse_time_range(request.args)
+            max_points, method = parse_downsample(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Ensure datetime is in proper format and Manila timezone
-        if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-            df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce')
-        
-        # Convert to Manila timezone if not already
-        if df['datetime'].dt.tz is None:
-            df['datetime'] = df['datetime'].dt.tz_localize('Asia/Manila')
-        else:
-            df['datetime'] = df['datetime'].dt.tz_convert('Asia/Manila')
-
-        # Filter by city if specified
-        if city != 'all':
-            df = df[df['city_name'] == city]
-
-        # Filter by month if specified (1-12)
-        if month and month.isdigit():
-            month_num = int(month)
-            if 1 <= month_num <= 12:
-                # Filter using Manila timezone
-                df = df[df['datetime'].dt.month == month_num]
-
-        # Convert to records with proper date formatting
-        records = []
-        for _, row in df.iterrows():
-            record = row.to_dict()
-            # Convert datetime to ISO format with timezone
-            record['datetime'] = row['datetime'].isoformat()
-            records.append(record)
-
-        return jsonify({
-            'data': records,
+        try:
+            output_format = negotiate_format(request)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 406
+
+        # Field projection
+        fields = None
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in store.df.columns]
+            if unknown:
+                return jsonify({'error': f'Unknown fields: {unknown}'}), 400
+
+        # Row positions of the city's range, cut to the time window by binary search; datetimes are already in Manila time
+        with metrics.stage('filter'):
+            positions = store.positions(city, month_num, start_time, end_time)
+        start, end = store.date_range(positions)
+        envelope = {
             'timezone': 'Asia/Manila',
             'date_range': {
-                'start': df['datetime'].min().isoformat() if not df.empty else None,
-                'end': df['datetime'].max().isoformat() if not df.empty else None
+                'start': start.isoformat() if start is not None else None,
+                'end': end.isoformat() if end is not None else None
             }
-        })
+        }
+
+        # Chart mode: each city's AQI series is cut to max_points before paging and serializing
+        if max_points is not None:
+            total = len(positions)
+            with metrics.stage('downsample'):
+                positions = downsample_positions(store, positions, max_points, method)
+            envelope['downsample'] = {'method': method, 'max_points': max_points,
+                                      'points': len(positions), 'total': total}
+
+        # Pagination is opt-in so existing clients still get the full result
+        headers = {}
+        if any(arg in request.args for arg in ('page', 'per_page', 'cursor')):
+            try:
+                page = int(request.args.get('page', '1'))
+                per_page = int(request.args.get('per_page', '100'))
+            except ValueError:
+                return jsonify({'error': 'page and per_page must be integers'}), 400
+            if page < 1 or not 1 <= per_page <= MAX_PER_PAGE:
+                return jsonify({'error': f'page must be >= 1 and per_page between 1 and {MAX_PER_PAGE}'}), 400
+
+            # A cursor resumes after the last row of the previous page
+            if request.args.get('cursor'):
+                try:
+                    cursor_city, cursor_time, cursor_ordinal = decode_cursor(request.args['cursor'])
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                offset = selection_offset(positions, store.position_after(cursor_city, cursor_time, cursor_ordinal))
+                page = None
+            else:
+                offset = (page - 1) * per_page
+
+            total = len(positions)
+            positions = positions[offset:offset + per_page]
+            next_cursor = None
+            if len(positions) and offset + len(positions) < total:
+                last = store.df.iloc[positions[-1]]
+                next_cursor = encode_cursor(last['city_name'], last['datetime'], store.tie_ordinal(int(positions[-1])))
+
+            envelope['pagination'] = {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'next_cursor': next_cursor
+            }
+            headers['X-Total-Count'] = str(total)
+            if next_cursor:
+                headers['X-Next-Cursor'] = next_cursor
+
+        # Serialize in fixed-size batches so memory stays flat for large results
+        mimetype = FORMAT_MIMETYPES[output_format]
+        if output_format == 'ndjson':
+            body = iter_ndjson(store, positions, fields)
+        elif output_format == 'arrow':
+            body = iter_arrow_stream(store, positions, fields)
+        elif output_format == 'parquet':
+            # Parquet needs its footer at the end, so the file is built in one piece
+            with metrics.stage('serialize'):
+                body = parquet_bytes(store.take(positions, fields))
+            return Response(body, mimetype=mimetype, headers=headers)
+        else:
+            body, mimetype = iter_json_document(store, positions, envelope, fields), 'application/json'
+        return Response(metrics.timed_iter('serialize', body), mimetype=mimetype, headers=headers)
 
     except Exception as e:
         logger.error(f"Error in historical data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def forecast_records(model, scaler, store, city, days):
+    # Forecast from each city's most recent reading; None if there is nothing to forecast from
+    if city == 'all':
+        last_points = store.latest
+    else:
+        last_points = store.latest.loc[store.latest.index == city]
+
+    if len(last_points) == 0:
+        return None
+
+    # Score every (city, date) pair from tomorrow on in one model call
+    return predict_batch(model, scaler, last_points, future_dates(last_points['datetime'].max(), days))
+
+def cached_forecast(snapshot, city, days):
+    # (records, forecast) sliced from the precomputed forecast; forecast is None past its horizon
+    forecast, stale = forecast_cache.get(snapshot)
+    if forecast is None or not forecast.covers(days):
+        return forecast_records(snapshot.model, snapshot.scaler, snapshot.store, city, days), None, False
+    records = forecast.records(city, days)
+    if records is None and stale:
+        # A city added since the stale forecast was computed is scored on demand rather than reported missing
+        return forecast_records(snapshot.model, snapshot.scaler, snapshot.store, city, days), None, False
+    return records, forecast, stale
+
+def with_forecast_headers(response, forecast, stale):
+    # X-Forecast-Age itself is added per response in add_forecast_age
+    if forecast is not None:
+        response.headers['X-Forecast-Computed-At'] = forecast.computed_at.isoformat()
+        response.headers['X-Forecast-Version'] = forecast.version
+    if stale:
+        # An older version's forecast must not be cached under the current version
+        response.cache_control.no_store = True
+        response.headers['X-Forecast-Stale'] = '1'
+    return response
+
+@app.after_request
+def add_forecast_age(response):
+    # Computed on every response, including ones replayed from the response cache
+    computed_at = response.headers.get('X-Forecast-Computed-At')
+    if computed_at:
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(computed_at)
+        response.headers['X-Forecast-Age'] = f"{max(age.total_seconds(), 0):.1f}"
+    return response
+
 @app.route('/api/predictions', methods=['GET'])
+@response_cache.cached(response_version, uses_model=True)
 def get_predictions():
     try:
-        model, scaler = load_model()
-        if model is None or scaler is None:
+        snapshot = current_snapshot()
+        if snapshot.model is None or snapshot.scaler is None:
             return jsonify({'error': 'Model or scaler not loaded', 'details': 'Check model files'}), 500
 
-        df = load_data()
-        if df is None:
+        if snapshot.store is None:
             return jsonify({'error': 'Data not loaded'}), 500
 
         city = request.args.get('city', 'all')
         days = int(request.args.get('days', '7'))
 
-        # Get the most recent data point for each city
-        if city == 'all':
-            last_points = df.sort_values('datetime').groupby('city_name').last().reset_index()
-        else:
-            last_points = df[df['city_name'] == city].sort_values('datetime').tail(1)
-
-        if len(last_points) == 0:
+        with metrics.stage('predict'):
+            predictions, forecast, stale = cached_forecast(snapshot, city, days)
+        if predictions is None:
             return jsonify({'error': 'No data available for prediction'}), 404
 
-        # Generate future dates starting from tomorrow
-        last_date = pd.to_datetime(last_points['datetime'].max())
-        future_dates = pd.date_range(
-            start=last_date + timedelta(days=1),
-            periods=days,
-            freq='D'
-        )
-
-        predictions = []
-        features = ['components.co', 'components.no', 'components.no2',
-                   'components.o3', 'components.so2', 'components.pm2_5',
-                   'components.pm10', 'components.nh3']
-
-        for _, row in last_points.iterrows():
-            # Create baseline data for predictions
-            base_data = row[features].to_dict()
-            
-            for date in future_dates:
-                # Create input features
-                input_data = {
-                    **base_data,
-                    'hour': date.hour,
-                    'day': date.day,
-                    'month': date.month,
-                    'day_of_week': date.dayofweek
-                }
-                
-                # Convert to DataFrame for scaling
-                input_df = pd.DataFrame([input_data])
-                
-                try:
-                    # Scale features
-                    X_scaled = scaler.transform(input_df)
-                    
-                    # Make prediction
-                    predicted_aqi = model.predict(X_scaled)[0]
-                    
-                    # Create prediction record
-                    prediction = {
-                        'datetime': date.isoformat(),
-                        'predicted_aqi': float(predicted_aqi),
-                        'city_name': row['city_name'],
-                        'lat': row['lat'],
-                        'lon': row['lon'],
-                        'is_prediction': True
-                    }
-                    predictions.append(prediction)
-                    
-                except Exception as e:
-                    print(f"Prediction error for {row['city_name']} on {date}: {str(e)}")
-                    continue
-
-        return jsonify(predictions)
+        with metrics.stage('serialize'):
+            response = jsonify(predictions)
+        return with_forecast_headers(response, forecast, stale)
 
     except Exception as e:
         logger.error(f"Prediction error: {str(e)}")
         return jsonify({'error': 'Prediction failed', 'details': str(e)}), 500
 
 @app.route('/api/pollutants', methods=['GET'])
+@response_cache.cached(response_version)
 def get_pollutant_data():
     aggregated_data = get_aggregated_data()
     if aggregated_data is None:
@@ -389,55 +664,52 @@ def get_pollutant_data():
         return jsonify({'error': 'City not found'}), 404
 
 @app.route('/api/health-risk', methods=['GET'])
+@response_cache.cached(response_version)
 def get_health_risk():
-    df = load_data()
-    if df is None:
+    store = get_data_store()
+    if store is None:
         return jsonify({'error': 'Data not available'}), 500
     
     city = request.args.get('city', 'all')
     
-    if city != 'all':
-        df = df[df['city_name'] == city]
+    risk = health_risk_for(store, city)
+    if risk is None:
+        return jsonify({'error': 'City not found'}), 404
     
-    # Get the latest AQI
-    latest_data = df.sort_values('datetime', ascending=False).iloc[0]
-    aqi = float(latest_data['main.aqi'])
+    return jsonify(risk)
+
+def health_risk_for(store, city):
+    # Get the latest AQI from the precomputed latest-reading table
+    latest_data = store.latest_for(city)
+    if latest_data is None:
+        return None
+    risk = dict(HEALTH_RISK_LEVELS[health_risk_index(latest_data['main.aqi'])])
     
-    # Determine health risk level
-    if aqi <= 1:
-        risk = {
-            'level': 'Good',
-            'color': 'green',
-            'description': 'Air quality is considered satisfactory, and air pollution poses little or no risk.'
-        }
-    elif aqi <= 2:
-        risk = {
-            'level': 'Moderate',
-            'color': 'yellow',
-            'description': 'Air quality is acceptable; however, some pollutants may be a concern for a small number of people.'
-        }
-    elif aqi <= 3:
-        risk = {
-            'level': 'Unhealthy for Sensitive Groups',
-            'color': 'orange',
-            'description': 'Members of sensitive groups may experience health effects. The general public is not likely to be affected.'
-        }
-    elif aqi <= 4:
-        risk = {
-            'level': 'Unhealthy',
-            'color': 'red',
-            'description': 'Everyone may begin to experience health effects; members of sensitive groups may experience more serious effects.'
-        }
-    else:
-        risk = {
-            'level': 'Very Unhealthy',
-            'color': 'purple',
-            'description': 'Health warnings of emergency conditions. The entire population is more likely to be affected.'
+    # For all cities, also band every city's latest reading in one pass
+    if city == 'all':
+        risk['cities'] = city_risks(store.latest)
+    return risk
+
+def city_risks(latest):
+    # Risk band of each row of a latest-reading table
+    levels = health_risk_index(latest['main.aqi'].to_numpy(dtype=float))
+    return [
+        {
+            'city_name': name,
+            'aqi': aqi,
+            'datetime': timestamp.isoformat(),
+            **HEALTH_RISK_LEVELS[level]
         }
-    
-    return jsonify(risk)
+        for name, aqi, timestamp, level in zip(
+            latest['city_name'].tolist(),
+            latest['main.aqi'].astype(float).tolist(),
+            latest['datetime'],
+            levels.tolist()
+        )
+    ]
 
 @app.route('/api/metrics', methods=['GET'])
+@response_cache.cached(response_version)
 def get_metrics():
     aggregated_data = get_aggregated_data()
     if aggregated_data is None:
@@ -446,119 +718,581 @@ def get_metrics():
     city = request.args.get('city', 'all')
     
     if city in aggregated_data:
-        metrics = {
+        summary = {
             'average_aqi': aggregated_data[city]['average_aqi'],
             'primary_pollutant': aggregated_data[city]['primary_pollutant'],
             'trend': aggregated_data[city]['trend']
         }
-        return jsonify(metrics)
+        return jsonify(summary)
     else:
         return jsonify({'error': 'City not found'}), 404
 
 @app.route('/api/historical/daily', methods=['GET'])
+@response_cache.cached(response_version)
 def get_daily_historical_data():
     try:
-        df = load_data()
-        if df is None:
+        store = get_data_store()
+        if store is None:
             return jsonify({'error': 'Data not available'}), 500
 
         city = request.args.get('city', 'all')
-        month = request.args.get('month', None)
+        month_num = parse_month(request.args.get('month', None))
+        try:
+            start_time, end_time = parse_time_range(request.args)
+            max_points, method = parse_downsample(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        try:
+            output_format = negotiate_format(request, allowed=('json', 'arrow', 'parquet'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 406
         
-        if city != 'all':
-            df = df[df['city_name'] == city]
+        # Whole Manila days overlapping start/end are included
+        with metrics.stage('aggregate'):
+            daily_avg, date_range = daily_aggregates(get_rollups(), city, month_num, start_time, end_time)
+        downsampled = None
+        if max_points is not None:
+            total = len(daily_avg)
+            with metrics.stage('downsample'):
+                daily_avg = downsample_frame(daily_avg, max_points, method)
+            downsampled = {'method': method, 'max_points': max_points, 'points': len(daily_avg), 'total': total}
 
-        # Convert to Manila timezone if not already
-        if df['datetime'].dt.tz is None:
-            df['datetime'] = df['datetime'].dt.tz_localize('Asia/Manila')
-        else:
-            df['datetime'] = df['datetime'].dt.tz_convert('Asia/Manila')
-
-        # Filter by month if specified
-        if month and month.isdigit():
-            month_num = int(month)
-            if 1 <= month_num <= 12:
-                df = df[df['datetime'].dt.month == month_num]
-
-        # Create date column (without time)
-        df['date'] = df['datetime'].dt.date
-
-        # Group by date and calculate daily averages
-        daily_avg = df.groupby('date').agg({
-            'main.aqi': 'mean',
-            'components.pm2_5': 'mean',
-            'components.pm10': 'mean',
-            'components.o3': 'mean',
-            'components.no2': 'mean',
-            'components.so2': 'mean',
-            'lat': 'first',
-            'lon': 'first',
-            'city_name': 'first'
-        }).reset_index()
-
-        # Convert to records with proper date formatting
-        records = daily_avg.to_dict('records')
-        
-        return jsonify({
-            'data': records,
-            'timezone': 'Asia/Manila',
-            'date_range': {
-                'start': df['datetime'].min().isoformat() if not df.empty else None,
-                'end': df['datetime'].max().isoformat() if not df.empty else None
-            }
-        })
+        # Columnar formats are built straight from the aggregated frame
+        with metrics.stage('serialize'):
+            if output_format == 'arrow':
+                return Response(arrow_bytes(daily_avg), mimetype=FORMAT_MIMETYPES['arrow'])
+            if output_format == 'parquet':
+                return Response(parquet_bytes(daily_avg), mimetype=FORMAT_MIMETYPES['parquet'])
+            payload = daily_payload(daily_avg, date_range)
+            if downsampled is not None:
+                payload['downsample'] = downsampled
+            return jsonify(payload)
 
     except Exception as e:
         logger.error(f"Error in daily historical data: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Mean columns of the daily series, in the order the endpoint has always returned them
+DAILY_COLUMNS = ['main.aqi', 'components.pm2_5', 'components.pm10', 'components.o3',
+                 'components.no2', 'components.so2']
+
+def daily_aggregates(rollups, city, month=None, start=None, end=None):
+    # Daily averages read from the day rollup; returns the frame and the (first, last) reading times
+    rollup = rollups['day']
+    if city not in rollup:
+        daily_avg = pd.DataFrame(columns=['date'] + DAILY_COLUMNS + ['lat', 'lon', 'city_name'])
+        return daily_avg, (None, None)
+    table = rollup.table(city, month, start, end)
+    daily_avg = table[[f'{col}.mean' for col in DAILY_COLUMNS] + ['lat', 'lon', 'city_name']]
+    daily_avg.columns = DAILY_COLUMNS + ['lat', 'lon', 'city_name']
+    daily_avg.insert(0, 'date', daily_avg.index.date)
+    if table.empty:
+        return daily_avg, (None, None)
+    return daily_avg, (table['first_time'].min(), table['last_time'].max())
+
+def daily_payload(daily_avg, date_range):
+    # Convert to records with proper date formatting
+    start, end = date_range
+    return {
+        'data': daily_avg.to_dict('records'),
+        'timezone': 'Asia/Manila',
+        'date_range': {
+            'start': start.isoformat() if start is not None else None,
+            'end': end.isoformat() if end is not None else None
+        }
+    }
+
+ROLLUP_KEY_NAMES = {'day': 'date', 'month': 'month', 'hour': 'hour'}
+
+@app.route('/api/historical/rollup', methods=['GET'])
+@response_cache.cached(response_version)
+def get_rollup_data():
+    # Mean/min/max/count of AQI and every pollutant per day, month or hour of day, from the rollups
+    try:
+        rollups = get_rollups()
+        if rollups is None:
+            return jsonify({'error': 'Data not available'}), 500
+
+        city = request.args.get('city', 'all')
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ROLLUP_KEY_NAMES:
+            return jsonify({'error': f'granularity must be one of {list(ROLLUP_KEY_NAMES)}'}), 400
+        month_num = parse_month(request.args.get('month', None))
+        try:
+            output_format = negotiate_format(request, allowed=('json', 'arrow', 'parquet'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 406
+
+        if city not in rollups[granularity]:
+            return jsonify({'error': 'City not found'}), 404
+        table = rollups[granularity].table(city, month_num).drop(columns=['first_time', 'last_time'])
+        if city == 'all':
+            # Location columns only describe a single city
+            table = table.drop(columns=['lat', 'lon', 'city_name'])
+
+        # Days and months as ISO strings, hours as integers
+        key_name = ROLLUP_KEY_NAMES[granularity]
+        if granularity == 'day':
+            keys = table.index.strftime('%Y-%m-%d')
+        elif granularity == 'month':
+            keys = table.index.strftime('%Y-%m')
+        else:
+            keys = table.index.astype(int)
+        table.insert(0, key_name, keys)
+
+        if output_format == 'arrow':
+            return Response(arrow_bytes(table), mimetype=FORMAT_MIMETYPES['arrow'])
+        if output_format == 'parquet':
+            return Response(parquet_bytes(table), mimetype=FORMAT_MIMETYPES['parquet'])
+
+        # Cells without readings have no mean/min/max; send null rather than NaN
+        records = table.astype(object).where(table.notna(), None).to_dict('records')
+        return jsonify({'data': records, 'granularity': granularity, 'timezone': 'Asia/Manila'})
+
+    except Exception as e:
+        logger.error(f"Error in rollup data: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/heatmap', methods=['GET'])
+@response_cache.cached(response_version)
 def get_heatmap_data():
+    # Served from per-station sums; zoom returns grid cells, bbox limits either to the visible area
     try:
-        df = load_data()
-        if df is None:
+        index = get_spatial_index()
+        if index is None:
             return jsonify({'error': 'Data not available'}), 500
-        
+
         city = request.args.get('city', 'all')
-        
-        if city != 'all':
-            df = df[df['city_name'] == city]
-        
-        # Ensure we have required columns
-        required_cols = ['datetime', 'main.aqi', 'lat', 'lon', 'city_name']
-        missing_cols = [col for col in required_cols if col not in df.columns]
-        if missing_cols:
-            return jsonify({'error': f'Missing required columns: {missing_cols}'}), 400
-        
-        # Convert datetime if needed
-        if not pd.api.types.is_datetime64_any_dtype(df['datetime']):
-            df['datetime'] = pd.to_datetime(df['datetime'])
-        
-        # Group by city and calculate average AQI and coordinates
-        heatmap_data = df.groupby('city_name').agg({
-            'main.aqi': 'mean',
-            'lat': 'first',
-            'lon': 'first',
-            'datetime': 'count'  # Count of data points per city
-        }).reset_index()
-        
-        # Rename columns for clarity
-        heatmap_data = heatmap_data.rename(columns={
-            'main.aqi': 'avg_aqi',
-            'datetime': 'data_points'
-        })
-        
-        # Convert to list of dictionaries
-        result = heatmap_data.to_dict(orient='records')
-        
-        return jsonify(result)
+        try:
+            bbox = parse_bbox(request.args.get('bbox'))
+            zoom = parse_zoom(request.args.get('zoom'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        with metrics.stage('aggregate'):
+            if zoom is not None and city == 'all':
+                records = index.cells(zoom, bbox)
+            else:
+                records = index.stations(city, bbox)
+        with metrics.stage('serialize'):
+            return jsonify(records)
         
     except Exception as e:
         logger.error(f"Unexpected error in get_heatmap_data: {str(e)}")
         logger.error(traceback.format_exc())
         return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@app.route('/api/correlations', methods=['GET'])
+@response_cache.cached(response_version)
+def get_correlation_data():
+    # Pearson/Spearman matrices over AQI and the pollutants plus a stratified sample for the scatter plots
+    try:
+        correlations = get_correlations()
+        if correlations is None:
+            return jsonify({'error': 'Data not available'}), 500
+
+        city = request.args.get('city', 'all')
+        try:
+            limit = int(request.args.get('points', str(DEFAULT_CORRELATION_POINTS)))
+        except ValueError:
+            return jsonify({'error': 'points must be an integer'}), 400
+        if not 0 <= limit <= MAX_CORRELATION_POINTS:
+            return jsonify({'error': f'points must be between 0 and {MAX_CORRELATION_POINTS}'}), 400
+        if city not in correlations:
+            return jsonify({'error': 'City not found'}), 404
+        month_num = parse_month(request.args.get('month', None))
+
+        with metrics.stage('aggregate'):
+            if month_num is None:
+                city_correlations = correlations[city]
+            else:
+                # The running co-moments cover whole cities, so a month is computed from its rows
+                store = get_data_store()
+                city_correlations = CityCorrelations.from_rows(store.take(store.positions(city, month_num)))
+            result = city_correlations.result(limit)
+        with metrics.stage('serialize'):
+            points = result['points']
+            points['datetime'] = iso_strings(points['datetime'])
+            for col in POLLUTANT_FEATURES:
+                # Sampled from float32 columns; sent with the digits they were read with
+                points[col] = shortest_float32(points[col].to_numpy())
+            result['points'] = points.to_dict(orient='records')
+            result['city'] = city
+            result['month'] = month_num
+            return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error in correlations: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def timed(timings, section, compute, *args):
+    # Run compute(*args) and record its wall time in milliseconds under section
+    start = time.perf_counter()
+    result = compute(*args)
+    elapsed = time.perf_counter() - start
+    timings[section] = round(elapsed * 1000, 3)
+    metrics.observe_stage(section, elapsed)
+    return result
+
+@app.route('/api/dashboard', methods=['GET'])
+@response_cache.cached(response_version, uses_model=True)
+def get_dashboard():
+    # Everything AirQualityDashboard needs for one city in a single response, from the precomputed per-city state
+    try:
+        snapshot = current_snapshot()
+        store = snapshot.store
+        aggregated_data = get_aggregated_data()
+        if store is None or aggregated_data is None:
+            return jsonify({'error': 'Data not available'}), 500
+        if snapshot.model is None or snapshot.scaler is None:
+            return jsonify({'error': 'Model or scaler not loaded', 'details': 'Check model files'}), 500
+
+        city = request.args.get('city', 'all')
+        days = int(request.args.get('days', '7'))
+        if city not in aggregated_data:
+            return jsonify({'error': 'City not found'}), 404
+
+        timings = {}
+        daily_avg, date_range = timed(timings, 'daily', daily_aggregates, get_rollups(), city)
+        summary = aggregated_data[city]
+        predictions, forecast, stale = timed(timings, 'predictions', cached_forecast, snapshot, city, days)
+        payload = {
+            'daily': daily_payload(daily_avg, date_range),
+            'predictions': predictions or [],
+            'pollutants': summary['pollutants'],
+            'health_risk': timed(timings, 'health_risk', health_risk_for, store, city),
+            'metrics': {
+                'average_aqi': summary['average_aqi'],
+                'primary_pollutant': summary['primary_pollutant'],
+                'trend': summary['trend']
+            },
+            'heatmap': timed(timings, 'heatmap', get_spatial_index().stations, city),
+            'timings_ms': timings
+        }
+
+        with metrics.stage('serialize'):
+            response = jsonify(payload)
+        response.headers['Server-Timing'] = ', '.join(f"{name};dur={ms}" for name, ms in timings.items())
+        return with_forecast_headers(response, forecast, stale)
+
+    except Exception as e:
+        logger.error(f"Error in dashboard: {str(e)}")
+        return jsonify({'error': str(e)}), 500
     
 
+# Changed days sent in one daily event; a bigger change (e.g. a rewritten CSV) asks clients to refetch instead
+MAX_STREAM_DAYS = 31
+LATEST_COLUMNS = ['city_name', 'datetime', 'lat', 'lon', 'main.aqi'] + POLLUTANT_FEATURES
+
+def stream_events(old, new, cities):
+    # What changed between two snapshots, as {city: [(event, data)]} for the cities (or 'all') with /api/stream
+    # subscribers; comparisons across all cities are made once and sliced per city
+    events = {city: [] for city in cities}
+    if new.data_version != old.data_version and new.store is not None and old.store is not None:
+        readings, risks = latest_changes(old.store, new.store)
+        old_rollups, new_rollups = old.cached('rollups', compute_rollups), new.cached('rollups', compute_rollups)
+        for city in cities:
+            if city == 'all':
+                city_readings = list(readings.values())
+                risk = overall_risk_change(old.store, new.store, risks)
+            else:
+                city_readings = [readings[city]] if city in readings else []
+                risk = dict(HEALTH_RISK_LEVELS[risks[city]]) if city in risks else None
+            if city_readings:
+                events[city].append(('latest', {'city': city, 'readings': city_readings}))
+            if risk is not None:
+                events[city].append(('health_risk', {'city': city, **risk}))
+            daily = daily_changes(old_rollups, new_rollups, city)
+            if daily is None:
+                events[city].append(('resync', {'reason': 'data'}))
+            elif daily:
+                events[city].append(('daily', {'city': city, 'data': daily}))
+    if new.model_version != old.model_version:
+        for city in cities:
+            events[city].append(('model', {'city': city, 'version': new.version, 'model_version': new.model_version}))
+    return events
+
+def latest_changes(old_store, new_store):
+    # Latest readings newer than in old_store, and the risk band of each city whose band changed, keyed by city
+    latest = new_store.latest
+    previous = old_store.latest.reindex(latest.index)
+    known = latest.index.isin(old_store.latest.index)
+    newer = latest[(latest['datetime'] != previous['datetime']).to_numpy() | ~known]
+    if newer.empty:
+        # Backfilled or re-ingested readings leave every city's latest reading, and so its band, as it was
+        return {}, {}
+    records = newer[LATEST_COLUMNS].copy()
+    records['datetime'] = iso_strings(records['datetime'])
+    for col in POLLUTANT_FEATURES:
+        # Held as float32; sent with the digits they were read with
+        records[col] = shortest_float32(records[col].to_numpy())
+    readings = dict(zip(newer.index, records.astype(object).where(records.notna(), None).to_dict('records')))
+
+    levels = health_risk_index(latest['main.aqi'].to_numpy(dtype=float))
+    moved = (levels != health_risk_index(previous['main.aqi'].to_numpy(dtype=float))) | ~known
+    return readings, dict(zip(latest.index[moved], levels[moved].tolist()))
+
+def overall_risk_change(old_store, new_store, risks):
+    # The band of the newest reading anywhere plus the cities whose band changed; None if nothing did
+    latest, previous = new_store.latest_for('all'), old_store.latest_for('all')
+    if latest is None:
+        return None
+    level = health_risk_index(latest['main.aqi'])
+    if not risks and previous is not None and health_risk_index(previous['main.aqi']) == level:
+        return None
+    return {**HEALTH_RISK_LEVELS[level], 'cities': city_risks(new_store.latest.loc[list(risks)])}
+
+def daily_changes(old_rollups, new_rollups, city):
+    # Points (as in /api/historical/daily) of the days that gained readings; None if too many to send
+    days = new_rollups['day'].changed_keys(old_rollups['day'], city)
+    if len(days) == 0:
+        return []
+    if len(days) > MAX_STREAM_DAYS:
+        return None
+    daily_avg, _ = daily_aggregates(new_rollups, city, start=days.min().tz_localize('Asia/Manila'))
+    return daily_avg[daily_avg.index.isin(days)].to_dict('records')
+
+# One background thread computes each update once per subscribed city and fans the frames out
+broadcaster = Broadcaster(stream_events, app.json.dumps,
+                          max_subscribers=int(os.environ.get('AQI_STREAM_MAX_CLIENTS', '10000')))
+
+# X-Accel-Buffering stops nginx from holding events back
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def open_stream(city, notify):
+    # Subscribe to /api/stream updates with the hello event queued first; None when at capacity
+    snapshot = current_snapshot()
+    if snapshot.store is None:
+        raise RuntimeError('Data not available')
+    if city != 'all' and not snapshot.store.has_city(city):
+        raise LookupError('City not found')
+    hello = broadcaster.frame('hello', {
+        'city': city,
+        'version': snapshot.version,
+        'data_version': snapshot.data_version,
+        'model_version': snapshot.model_version,
+        'keepalive_seconds': KEEPALIVE_SECONDS
+    }, snapshot.version)
+    return broadcaster.subscribe(city, notify, [hello])
+
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    # Server-Sent Events with the changes to a city as they happen; asgi_app serves this path without a thread per client
+    city = request.args.get('city', 'all')
+    wakeup = threading.Event()
+    try:
+        subscription = open_stream(city, wakeup.set)
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+    if subscription is None:
+        return jsonify({'error': 'Too many live connections, retry shortly'}), 503, {'Retry-After': '5'}
+
+    response = Response(iter_frames(subscription, wakeup), mimetype='text/event-stream', headers=STREAM_HEADERS)
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscription))
+    return response
+
+# Rebuild dependent caches before a new version goes live so the swap causes no latency spike
+registry.warmups.append(lambda snapshot: snapshot.cached('aggregated_data', compute_aggregated_data))
+registry.warmups.append(lambda snapshot: snapshot.cached('rollups', compute_rollups))
+registry.warmups.append(lambda snapshot: snapshot.cached('spatial_index', compute_spatial_index))
+registry.warmups.append(lambda snapshot: snapshot.cached('correlations', compute_correlations))
+# A reloaded model is loaded before the swap, so a broken artifact keeps the current version live
+registry.warmups.append(lambda snapshot: warm_up_model(snapshot))
+# Runs after the model warmup, so a broken model fails the reload there first
+registry.warmups.append(lambda snapshot: forecast_cache.refresh(snapshot))
+
+def warm_up_model(snapshot):
+    if snapshot.model is not None:
+        snapshot.model.warm_up(len(MODEL_FEATURES))
+
+# Free cached responses of replaced versions; data-only entries survive a model-only reload
+registry.listeners.append(lambda old, new: response_cache.discard_stale({new.data_version, new.version}))
+# Ingested readings swap in without warmups; their forecast is computed in the background
+registry.listeners.append(lambda old, new: forecast_cache.refresh_async(new))
+# Live deltas for /api/stream subscribers are computed on the broadcaster's thread, not the swapping one
+registry.listeners.append(broadcaster.publish)
+
+def admin_authorized():
+    # Admin, ingest and profiling requests need X-Admin-Token to match AQI_ADMIN_TOKEN; without a
+    # token they are refused unless AQI_ADMIN_OPEN=1 opens them (e.g. for local development)
+    token = os.environ.get('AQI_ADMIN_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    return os.environ.get('AQI_ADMIN_OPEN', '0') not in ('', '0')
+
+@app.route('/api/admin/reload', methods=['POST'])
+def admin_reload():
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    target = request.args.get('target', 'all')
+    if target not in ('all', 'data', 'model'):
+        return jsonify({'error': 'target must be one of all, data, model'}), 400
+    wait = request.args.get('wait', '0') in ('1', 'true')
+
+    # Requests already running keep the snapshot they pinned
+    registry.reload(data=target in ('all', 'data'), model=target in ('all', 'model'), wait=wait)
+    if wait:
+        status = registry.status()
+        return jsonify(status), 500 if status['last_error'] else 200
+    return jsonify({'status': 'reloading', 'target': target}), 202
+
+@app.route('/api/admin/versions', methods=['GET'])
+def admin_versions():
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    status = registry.status()
+    model = current_snapshot().model
+    status['model'] = model.info() if model is not None else None
+    status['forecast'] = forecast_cache.stats()
+    return jsonify(status)
+
+@app.route('/api/admin/cache', methods=['GET'])
+def admin_cache():
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify(response_cache.stats())
+
+@app.route('/api/metrics/internal', methods=['GET'])
+def internal_metrics():
+    # Prometheus text format: request latencies, stage timings and cache counters
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def cache_metrics():
+    stats = response_cache.stats()
+    forecasts = forecast_cache.stats()
+    yield ('aqi_response_cache_requests_total', 'counter', 'Response cache lookups by result.',
+           [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses']),
+            ({'result': 'not_modified'}, stats['not_modified'])])
+    yield ('aqi_response_cache_hit_ratio', 'gauge', 'Share of response cache lookups answered from the cache.',
+           [({}, stats['hit_rate'])])
+    yield ('aqi_response_cache_evictions_total', 'counter', 'Entries evicted to stay within the size limits.',
+           [({}, stats['evictions'])])
+    yield ('aqi_response_cache_bytes', 'gauge', 'Bytes held by the response cache.', [({}, stats['bytes'])])
+    yield ('aqi_forecast_refreshes_total', 'counter', 'Forecasts computed for a data/model version.',
+           [({}, forecasts['computed'])])
+    yield ('aqi_forecast_stale_served_total', 'counter', 'Requests answered with the previous version\'s forecast.',
+           [({}, forecasts['stale_served'])])
+    yield ('aqi_forecast_compute_seconds', 'gauge', 'Duration of the last forecast computation.',
+           [({}, forecasts['last_seconds'])])
+
+def model_metrics():
+    snapshot = registry.peek()
+    model = snapshot.model if snapshot is not None else None
+    info = model.info() if model is not None else {}
+    yield ('aqi_model_loaded', 'gauge', 'Whether the model artifact has been loaded.',
+           [({'format': info.get('format', 'none')}, 1 if info.get('loaded') else 0)])
+    yield ('aqi_model_load_seconds', 'gauge', 'Time it took to load the model artifact.',
+           [({}, info.get('load_seconds'))])
+
+def coalescing_metrics():
+    flights = [response_cache.flights, derived_flights, registry.flights, forecast_cache.flights]
+    stats = [(flight.name, flight.stats()) for flight in flights]
+    yield ('aqi_coalesced_executions_total', 'counter', 'Computations actually run, by kind.',
+           [({'kind': name}, flight['executions']) for name, flight in stats])
+    yield ('aqi_coalesced_requests_total', 'counter', 'Callers that waited for an identical computation instead of running it.',
+           [({'kind': name}, flight['coalesced']) for name, flight in stats])
+    yield ('aqi_coalesced_in_flight', 'gauge', 'Computations currently running.',
+           [({'kind': name}, flight['in_flight']) for name, flight in stats])
+
+def stream_metrics():
+    stats = broadcaster.stats()
+    yield ('aqi_stream_subscribers', 'gauge', 'Open /api/stream connections.', [({}, stats['subscribers'])])
+    yield ('aqi_stream_updates_total', 'counter', 'Snapshot changes pushed to subscribers.', [({}, stats['published'])])
+    yield ('aqi_stream_computations_total', 'counter', 'Per-city deltas computed for those changes.',
+           [({}, stats['computations'])])
+    yield ('aqi_stream_frames_total', 'counter', 'Events queued to subscribers.', [({}, stats['frames_sent'])])
+    yield ('aqi_stream_resyncs_total', 'counter', 'Subscribers told to refetch after falling behind.',
+           [({}, stats['resyncs'])])
+
+metrics.collectors.extend([cache_metrics, model_metrics, coalescing_metrics, stream_metrics])
+
+def ingest_readings(rows, csv_tail=None, data_version=None):
+    # Merge new readings into a new snapshot; aggregates are updated in O(batch) instead of recomputed
+    def change(snapshot):
+        aggregates = snapshot.cached('aggregated_data', compute_aggregated_data)
+        rollups = snapshot.cached('rollups', compute_rollups)
+        spatial_index = snapshot.cached('spatial_index', compute_spatial_index)
+        correlations = snapshot.cached('correlations', compute_correlations)
+        store = snapshot.store.append(rows)
+        if csv_tail is not None:
+            store.csv_tail = csv_tail
+        version = data_version or hashlib.sha1(
+            f"{snapshot.data_version}+{len(rows)}@{time.time_ns()}".encode()).hexdigest()[:12]
+        return snapshot.with_data(store, version, {
+            'aggregated_data': aggregates.add(rows),
+            'rollups': rollups.add(rows),
+            'spatial_index': spatial_index.add(rows),
+            'correlations': correlations.add(rows)
+        })
+    return registry.update(change)
+
+def ingest_csv_tail():
+    # Ingest lines appended to the CSV since it was loaded; None if the file was rewritten instead
+    if os.environ.get('AQI_SHARED_DATA'):
+        return None
+    store = registry.current().store
+    if store is None or store.csv_tail is None or not store.csv_tail.is_append_only():
+        return None
+    rows, next_tail = store.csv_tail.read_new_rows()
+    if rows is None:
+        store.csv_tail = next_tail
+        return 0
+    ingest_readings(rows, csv_tail=next_tail, data_version=file_version(CSV_PATH))
+    return len(rows)
+
+@app.route('/api/readings', methods=['POST'])
+def post_readings():
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    # Each worker maps the same published arrays, so new data has to go through the publisher
+    if os.environ.get('AQI_SHARED_DATA'):
+        return jsonify({'error': 'Ingestion is disabled in shared-data mode; publish a new version instead'}), 409
+    if get_data_store() is None:
+        return jsonify({'error': 'Data not available'}), 500
+
+    try:
+        body = request.get_data(as_text=True)
+        if request.mimetype == 'text/csv':
+            rows = readings_from_csv(body)
+        elif request.mimetype == 'application/x-ndjson':
+            rows = readings_from_ndjson(body)
+        else:
+            rows = readings_from_records(json.loads(body))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid readings', 'details': str(e)}), 400
+
+    try:
+        # Optionally persist to the CSV too; the tail offset moves past our own write
+        csv_tail = None
+        if request.args.get('persist', '0') in ('1', 'true'):
+            store = get_data_store()
+            written = append_to_csv(CSV_PATH, rows)
+            if store.csv_tail is not None:
+                csv_tail = store.csv_tail.after_append(written)
+        snapshot = ingest_readings(rows, csv_tail=csv_tail)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': 'Invalid readings', 'details': str(e)}), 400
+
+    return jsonify({
+        'ingested': len(rows),
+        'cities': sorted(rows['city_name'].astype(str).unique().tolist()),
+        'data_version': snapshot.data_version
+    }), 201
+
+@app.route('/api/readings/tail', methods=['POST'])
+def post_readings_tail():
+    if not admin_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    ingested = ingest_csv_tail()
+    if ingested is None:
+        return jsonify({'error': 'CSV was rewritten rather than appended to; use /api/admin/reload'}), 409
+    return jsonify({'ingested': ingested, 'data_version': registry.current().data_version})
+
 # Add a health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -584,5 +1318,13 @@ def test_predictions():
 
 
 
+# Optional eager start: AQI_MODEL_WARMUP=1 loads data and model now instead of on the first request
+if os.environ.get('AQI_MODEL_WARMUP') == '1':
+    warm_up_model(registry.current())
+
+# Optional file watcher: AQI_WATCH_INTERVAL=<seconds> reloads data/model when their files change
+if float(os.environ.get('AQI_WATCH_INTERVAL', '0')) > 0:
+    registry.watch(float(os.environ['AQI_WATCH_INTERVAL']))
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5500)
\ No newline at end of file
@@ -0,0 +1,216 @@
+# registry.py - Versioned data/model registry with background reload and atomic swap
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Derived values needed by several requests at once are computed by the first and shared
+derived_flights = SingleFlight('derived')
+
+
+class Snapshot:
+    """One immutable (dataset, model) version plus the caches derived from it.
+
+    Requests hold on to the snapshot they started with, so a reload never changes
+    the data under a request that is already running.
+    """
+
+    def __init__(self, store, data_version, model, scaler, model_version, data_cache=None):
+        self.store = store
+        self.data_version = data_version
+        self.model = model
+        self.scaler = scaler
+        self.model_version = model_version
+        self.loaded_at = datetime.now()
+        # Caches that only depend on the data survive a model-only reload
+        self.data_cache = data_cache if data_cache is not None else {}
+        self.model_cache = {}
+
+    @property
+    def version(self):
+        return f"{self.data_version}:{self.model_version}"
+
+    def with_data(self, store, data_version, data_cache=None):
+        """New snapshot with different data and the same model."""
+        return Snapshot(store, data_version, self.model, self.scaler, self.model_version, data_cache)
+
+    def cached(self, name, compute, uses_model=False):
+        """Compute a derived value once per snapshot; concurrent callers wait for the same computation."""
+        cache = self.model_cache if uses_model else self.data_cache
+        if name in cache:
+            return cache[name]
+
+        def compute_once():
+            # Stored before the flight ends, so a caller arriving just after it finds the value
+            if name not in cache:
+                cache[name] = compute(self)
+            return cache[name]
+
+        # Keyed on the cache itself: snapshots that share data share its data cache
+        value, _ = derived_flights.do((id(cache), name), compute_once)
+        return value
+
+
+class Registry:
+    """Holds the current Snapshot and replaces it when the data or model changes.
+
+    load_data() returns (store, version) and load_model() returns
+    (model, scaler, version). New versions are built on a background thread,
+    warmed up, and only then swapped in with a single reference assignment.
+    """
+
+    def __init__(self, load_data, load_model, data_paths=(), model_paths=(), refresh_data=None):
+        self._load_data = load_data
+        self._load_model = load_model
+        # refresh_data() may absorb a data file change incrementally; returns False to fall back to a reload
+        self._refresh_data = refresh_data
+        self.data_paths = list(data_paths)
+        self.model_paths = list(model_paths)
+        self._current = None
+        self._build_lock = threading.Lock()
+        self.flights = SingleFlight('load')
+        self._watcher = None
+        # warmup(snapshot) runs before a new snapshot goes live; listener(old, new) runs after
+        self.warmups = []
+        self.listeners = []
+        self.reloading = False
+        self.last_reload = None
+        self.last_error = None
+
+    def current(self):
+        snapshot = self._current
+        if snapshot is None:
+            snapshot, _ = self.flights.do('initial', self._initial)
+        return snapshot
+
+    def _initial(self):
+        # First load, shared by every request that arrives before it finishes
+        with self._build_lock:
+            if self._current is None:
+                self._current = self._build(None, data=True, model=True)
+            return self._current
+
+    def peek(self):
+        """The current snapshot, or None if nothing has been loaded yet; never triggers a load."""
+        return self._current
+
+    def _build(self, previous, data, model):
+        if data or previous is None:
+            store, data_version = self._load_data()
+            if store is None and previous is not None:
+                raise RuntimeError("Dataset could not be loaded; keeping the current version")
+            data_cache = None
+        else:
+            store, data_version, data_cache = previous.store, previous.data_version, previous.data_cache
+
+        if model or previous is None:
+            loaded_model, scaler, model_version = self._load_model()
+            if loaded_model is None and previous is not None:
+                raise RuntimeError("Model could not be loaded; keeping the current version")
+        else:
+            loaded_model, scaler, model_version = previous.model, previous.scaler, previous.model_version
+
+        return Snapshot(store, data_version, loaded_model, scaler, model_version, data_cache)
+
+    def reload(self, data=True, model=True, wait=False):
+        """Build a new snapshot in the background and swap it in when ready."""
+        thread = threading.Thread(target=self._reload, args=(data, model), daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _reload(self, data, model):
+        with self._build_lock:
+            self.reloading = True
+            start = time.perf_counter()
+            try:
+                old = self._current
+                new = self._build(old, data, model)
+                for warmup in self.warmups:
+                    warmup(new)
+                self._current = new
+                self.last_error = None
+                self.last_reload = datetime.now()
+                logger.info(f"Swapped in version {new.version} in {time.perf_counter() - start:.2f}s")
+                for listener in self.listeners:
+                    listener(old, new)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Reload failed: {str(e)}")
+            finally:
+                self.reloading = False
+
+    def update(self, change):
+        """Swap in change(current_snapshot) as the new version, e.g. after ingesting readings."""
+        self.current()
+        with self._build_lock:
+            old = self._current
+            new = change(old)
+            if new is old:
+                return old
+            self._current = new
+            self.last_reload = datetime.now()
+            for listener in self.listeners:
+                listener(old, new)
+            return new
+
+    @staticmethod
+    def _fingerprint(paths):
+        stamps = []
+        for path in paths:
+            try:
+                stat = path.stat()
+                stamps.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamps.append(None)
+        return stamps
+
+    def watch(self, interval):
+        """Poll the data and model files and reload whichever changed."""
+        if self._watcher is not None:
+            return
+
+        def poll():
+            loaded = (self._fingerprint(self.data_paths), self._fingerprint(self.model_paths))
+            previous = loaded
+            while True:
+                time.sleep(interval)
+                observed = (self._fingerprint(self.data_paths), self._fingerprint(self.model_paths))
+                # Wait for a file to stop changing so a half-written CSV or pickle is never loaded
+                if observed != previous:
+                    previous = observed
+                    continue
+                data_changed = observed[0] != loaded[0]
+                model_changed = observed[1] != loaded[1]
+                if data_changed and self._refresh_data is not None:
+                    try:
+                        if self._refresh_data():
+                            data_changed = False
+                    except Exception as e:
+                        logger.error(f"Incremental data refresh failed, reloading: {str(e)}")
+                if data_changed or model_changed:
+                    logger.info(f"Detected change (data={data_changed}, model={model_changed}), reloading")
+                    self.reload(data=data_changed, model=model_changed, wait=True)
+                loaded = observed
+
+        self._watcher = threading.Thread(target=poll, daemon=True, name='registry-watcher')
+        self._watcher.start()
+
+    def status(self):
+        snapshot = self._current
+        return {
+            'data_version': snapshot.data_version if snapshot else None,
+            'model_version': snapshot.model_version if snapshot else None,
+            'loaded_at': snapshot.loaded_at.isoformat() if snapshot else None,
+            'reloading': self.reloading,
+            'last_reload': self.last_reload.isoformat() if self.last_reload else None,
+            'last_error': self.last_error,
+            'watching': self._watcher is not None,
+            'coalescing': {'load': self.flights.stats(), 'derived': derived_flights.stats()}
+        }
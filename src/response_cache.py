@@ -0,0 +1,171 @@
+# response_cache.py - Versioned LRU response cache with ETag / Last-Modified conditional GETs
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request
+
+from singleflight import SingleFlight
+
+
+class CachedResponse:
+    __slots__ = ('body', 'status', 'mimetype', 'headers', 'size')
+
+    def __init__(self, body, status, mimetype, headers):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.headers = headers
+        self.size = len(body)
+
+
+class ResponseCache:
+    """Size-bounded LRU of rendered responses keyed on (endpoint, query, Accept, version).
+
+    Because the data/model version is part of the key, a reload never serves a
+    stale body; entries of replaced versions are dropped by discard_stale().
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        # Concurrent misses of the same key render once; the others wait for the entry
+        self.flights = SingleFlight('response')
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        # Bodies too large to ever fit are served but not cached
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def discard_stale(self, versions):
+        """Drop entries whose version is not in the given set."""
+        with self._lock:
+            for key in [key for key in self._entries if key[-1] not in versions]:
+                self._bytes -= self._entries.pop(key).size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+                'coalescing': self.flights.stats()
+            }
+
+    def cached(self, version_info, uses_model=False):
+        """Decorator for GET views whose output depends only on the query and the data version.
+
+        version_info(uses_model) returns (version, timezone-aware last_modified datetime).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if g.get('profiler') is not None:
+                    # A profiled request (?profile=1) measures the real work, not a cache lookup
+                    return view(*args, **kwargs)
+                version, last_modified = version_info(uses_model)
+                key = (
+                    request.path,
+                    tuple(sorted(request.args.items(multi=True))),
+                    request.headers.get('Accept', ''),
+                    version
+                )
+                etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+                # Answer revalidations before doing any work
+                if self._is_not_modified(etag, last_modified):
+                    with self._lock:
+                        self.not_modified += 1
+                    return self._not_modified(etag, last_modified)
+
+                entry = self.get(key)
+                if entry is None:
+                    rendered = []
+
+                    def render():
+                        response = make_response(view(*args, **kwargs))
+                        rendered.append(response)
+                        if response.status_code != 200 or response.cache_control.no_store or response.is_streamed:
+                            return None
+                        entry = CachedResponse(response.get_data(), response.status_code, response.mimetype,
+                                               [(k, v) for k, v in response.headers.items()
+                                                if k.lower() not in ('content-length', 'content-type')])
+                        self.put(key, entry)
+                        return entry
+
+                    entry, _ = self.flights.do(key, render)
+                    if entry is None:
+                        # Streams and uncacheable responses cannot be shared, so waiters render their own
+                        response = rendered[0] if rendered else make_response(view(*args, **kwargs))
+                        if response.status_code != 200 or response.cache_control.no_store:
+                            return response
+                        # Streams are not buffered into the cache, but still revalidate
+                        return self._with_validators(response, etag, last_modified)
+
+                response = Response(entry.body, status=entry.status, mimetype=entry.mimetype,
+                                    headers=entry.headers)
+                return self._with_validators(response, etag, last_modified)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _is_not_modified(etag, last_modified):
+        # Weak tags survive compression middleware unchanged, so compare weakly
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(etag)
+        if request.if_modified_since and last_modified:
+            return last_modified.replace(microsecond=0) <= request.if_modified_since
+        return False
+
+    @staticmethod
+    def _with_validators(response, etag, last_modified):
+        response.set_etag(etag, weak=True)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept')
+        return response
+
+    def _not_modified(self, etag, last_modified):
+        return self._with_validators(Response(status=304), etag, last_modified)
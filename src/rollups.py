@@ -0,0 +1,226 @@
+# rollups.py - Per-city daily, monthly and hour-of-day aggregates maintained alongside the dataset
+
+import numpy as np
+import pandas as pd
+
+from aggregates import AGGREGATE_COLUMNS
+
+GRANULARITIES = ('day', 'month', 'hour')
+STATS = ('sum', 'count', 'min', 'max')
+
+# How two partial aggregates of the same (city, key) cell combine
+_MERGE_SPEC = {f'{col}:{stat}': 'sum' if stat in ('sum', 'count') else stat
+               for col in AGGREGATE_COLUMNS for stat in STATS}
+_MERGE_SPEC.update({'lat': 'first', 'lon': 'first', 'first_time': 'min', 'last_time': 'max'})
+
+
+def rollup_keys(local_times, granularity):
+    """Group keys for naive local datetime64 values: calendar day, calendar month or hour of day."""
+    days = local_times.astype('datetime64[D]')
+    if granularity == 'day':
+        return days
+    if granularity == 'month':
+        return local_times.astype('datetime64[M]')
+    return ((local_times - days) // np.timedelta64(1, 'h')).astype(np.int8)
+
+
+def _city_codes(cities):
+    # City names in sorted order and each row's position among them
+    if isinstance(cities.dtype, pd.CategoricalDtype):
+        # DataStore keeps categories sorted, so category codes already follow name order
+        return np.asarray(cities.cat.categories.astype(str), dtype=object), cities.cat.codes.to_numpy()
+    codes, names = pd.factorize(np.asarray(cities.astype(str)), sort=True)
+    return np.asarray(names, dtype=object), codes
+
+
+def _times_like(datetimes, instants):
+    # int64 instants back into datetimes with the unit and timezone of the given ones
+    times = pd.DatetimeIndex(instants.view(f'datetime64[{datetimes.unit}]'))
+    if datetimes.tz is not None:
+        times = times.tz_localize('UTC').tz_convert(datetimes.tz)
+    return times.array
+
+
+def _aggregate(frame, keys, by_city):
+    """Cells of the given (non-empty) rows as a key-indexed table, plus each cell's city.
+
+    Rows must be sorted by city, then datetime; day and month cells are then
+    contiguous runs and only hour-of-day cells need a stable sort.
+    """
+    key_codes, key_values = pd.factorize(keys, sort=True)
+    city_names, city_codes = _city_codes(frame['city_name'])
+    if by_city:
+        cells = city_codes.astype(np.int64) * len(key_values) + key_codes
+    else:
+        cells = key_codes.astype(np.int64)
+
+    order = slice(None)
+    if np.any(cells[1:] < cells[:-1]):
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+    starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+
+    data = {}
+    for col in AGGREGATE_COLUMNS:
+        values = frame[col].to_numpy(dtype=float)[order]
+        present = ~np.isnan(values)
+        data[f'{col}:sum'] = np.add.reduceat(np.where(present, values, 0.0), starts)
+        data[f'{col}:count'] = np.add.reduceat(present.astype(np.int64), starts)
+        # fmin/fmax skip NaN, so a cell is only NaN when it has no readings at all
+        data[f'{col}:min'] = np.fmin.reduceat(values, starts)
+        data[f'{col}:max'] = np.fmax.reduceat(values, starts)
+    data['lat'] = frame['lat'].to_numpy(dtype=float)[order][starts]
+    data['lon'] = frame['lon'].to_numpy(dtype=float)[order][starts]
+    # Cells across cities hold their rows city by city, so the time bounds are reduced, not read off the ends
+    datetimes = frame['datetime'].array[order]
+    data['first_time'] = _times_like(datetimes, np.minimum.reduceat(datetimes.asi8, starts))
+    data['last_time'] = _times_like(datetimes, np.maximum.reduceat(datetimes.asi8, starts))
+
+    # Within a cell rows keep their city-major order, so the first row has the smallest city name
+    cities = city_names[city_codes[order][starts]]
+    if not by_city:
+        data['city_name'] = cities
+    index = pd.Index(key_values[key_codes[order][starts]], name='key')
+    return pd.DataFrame(data, index=index), cities
+
+
+def _split_by_city(table, cities):
+    # {city: table indexed by key}; each city's cells are contiguous
+    starts = np.concatenate(([0], np.flatnonzero(cities[1:] != cities[:-1]) + 1))
+    stops = np.append(starts[1:], len(cities))
+    return {cities[start]: table.iloc[start:stop] for start, stop in zip(starts, stops)}
+
+
+def _merge(table, batch, order):
+    # Combine existing cells with a batch; "first" columns come from the earliest chunk in order
+    if table is None:
+        return batch
+    combined = pd.concat([table, batch]).sort_values(order, kind='stable')
+    spec = dict(_MERGE_SPEC)
+    if 'city_name' in combined.columns:
+        spec['city_name'] = 'first'
+    return combined.groupby(level=0, sort=True).agg(spec)
+
+
+class Rollup:
+    """Aggregates of one granularity: a key-indexed table per city plus one across all cities.
+
+    Tables hold sums, non-null counts, minima and maxima per column so that
+    new readings merge in without revisiting the raw rows.
+    """
+
+    def __init__(self, granularity, by_city, overall):
+        self.granularity = granularity
+        self.by_city = by_city
+        self.overall = overall
+
+    @classmethod
+    def from_frame(cls, granularity, frame, local_times):
+        """Build from rows sorted by city, then datetime."""
+        keys = rollup_keys(local_times, granularity)
+        if len(frame) == 0:
+            return cls(granularity, {}, None)
+        by_city = _split_by_city(*_aggregate(frame, keys, by_city=True))
+        overall, _ = _aggregate(frame, keys, by_city=False)
+        return cls(granularity, by_city, overall)
+
+    def add(self, rows, local_times):
+        """Return a rollup that includes the given rows; self is left unchanged."""
+        batch = Rollup.from_frame(self.granularity, rows, local_times)
+        by_city = dict(self.by_city)
+        for city, table in batch.by_city.items():
+            by_city[city] = _merge(by_city.get(city), table, ['first_time'])
+        overall = self.overall
+        if batch.overall is not None:
+            overall = _merge(overall, batch.overall, ['city_name', 'first_time'])
+        return Rollup(self.granularity, by_city, overall)
+
+    def __contains__(self, city):
+        if city == 'all':
+            return self.overall is not None
+        return city in self.by_city
+
+    def changed_keys(self, previous, city):
+        """Keys of the city's cells that gained readings since previous, an older version of this rollup."""
+        if city not in self:
+            return pd.Index([])
+        cells = self.overall if city == 'all' else self.by_city[city]
+        before = None
+        if previous is not None and city in previous:
+            before = previous.overall if city == 'all' else previous.by_city[city]
+        # add() reuses the tables of cities a batch did not touch
+        if before is cells:
+            return cells.index[:0]
+        if before is None:
+            return cells.index
+        count_columns = [f'{col}:count' for col in AGGREGATE_COLUMNS]
+        counts = cells[count_columns].sum(axis=1)
+        previous_counts = before[count_columns].sum(axis=1).reindex(cells.index, fill_value=0)
+        return cells.index[(counts != previous_counts).to_numpy()]
+
+    def _key_of(self, timestamp):
+        # Key of the cell holding a timezone-aware instant, on the local clock the keys are built on
+        local_time = pd.Timestamp(timestamp).tz_convert('Asia/Manila').tz_localize(None)
+        return pd.Timestamp(rollup_keys(np.array([local_time], dtype='datetime64[ns]'), self.granularity)[0])
+
+    def table(self, city, month=None, start=None, end=None):
+        """Mean/min/max/count per column for one city (or 'all'), optionally limited to a month (1-12).
+
+        start/end are inclusive timezone-aware bounds; day and month cells
+        overlapping them (in local time) are kept. Columns are named
+        "<column>.mean" etc., plus lat, lon, city_name, first_time and
+        last_time; the index holds the keys.
+        """
+        table = self.overall if city == 'all' else self.by_city[city]
+        if self.granularity != 'hour' and (start is not None or end is not None):
+            # Keys are sorted, so the window is a slice between two binary searches
+            lo, hi = 0, len(table)
+            if start is not None:
+                lo = table.index.searchsorted(self._key_of(start))
+            if end is not None:
+                hi = table.index.searchsorted(self._key_of(end), side='right')
+            table = table.iloc[lo:hi]
+        if month is not None and self.granularity != 'hour':
+            table = table[table.index.month == month]
+
+        result = {}
+        for col in AGGREGATE_COLUMNS:
+            counts = table[f'{col}:count'].to_numpy()
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[f'{col}.mean'] = table[f'{col}:sum'].to_numpy() / counts
+            result[f'{col}.min'] = table[f'{col}:min'].to_numpy()
+            result[f'{col}.max'] = table[f'{col}:max'].to_numpy()
+            result[f'{col}.count'] = counts
+        result['lat'] = table['lat'].to_numpy()
+        result['lon'] = table['lon'].to_numpy()
+        result['city_name'] = table['city_name'].to_numpy() if city == 'all' else np.full(len(table), city, dtype=object)
+        result['first_time'] = table['first_time']
+        result['last_time'] = table['last_time']
+        return pd.DataFrame(result, index=table.index)
+
+
+class Rollups:
+    """Daily, monthly and hour-of-day rollups for a DataStore, indexed by granularity."""
+
+    def __init__(self, rollups):
+        self.rollups = rollups
+
+    @classmethod
+    def from_store(cls, store):
+        # The store keeps Manila calendar days; hours and months come from the same local clock
+        local_times = store.df['datetime'].dt.tz_localize(None).to_numpy()
+        return cls({granularity: Rollup.from_frame(granularity, store.df, local_times)
+                    for granularity in GRANULARITIES})
+
+    def add(self, rows):
+        """Return rollups including the given readings (datetimes in Asia/Manila)."""
+        if rows.empty:
+            return self
+        rows = rows.assign(city_name=rows['city_name'].astype(str)).sort_values(
+            ['city_name', 'datetime'], kind='mergesort')
+        local_times = rows['datetime'].dt.tz_localize(None).to_numpy()
+        return Rollups({granularity: rollup.add(rows, local_times)
+                        for granularity, rollup in self.rollups.items()})
+
+    def __getitem__(self, granularity):
+        return self.rollups[granularity]
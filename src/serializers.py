@@ -0,0 +1,235 @@
+# serializers.py - Batched and columnar serialization of DataStore rows for API responses
+
+import base64
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+# pyarrow is optional; the columnar formats are only offered when it is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Rows serialized per chunk; bounds peak memory regardless of the result size
+BATCH_SIZE = 5000
+
+# Response formats and their media types, in content-negotiation preference order
+FORMAT_MIMETYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+COLUMNAR_FORMATS = ('arrow', 'parquet')
+
+
+def negotiate_format(request, allowed=tuple(FORMAT_MIMETYPES)):
+    """Pick a response format from ?format= or the Accept header, defaulting to JSON.
+
+    Raises ValueError for an unknown format or a columnar one without pyarrow.
+    """
+    output_format = request.args.get('format')
+    if output_format is None:
+        mimetypes = [FORMAT_MIMETYPES[name] for name in allowed]
+        best = request.accept_mimetypes.best_match(mimetypes, default=FORMAT_MIMETYPES['json'])
+        output_format = next(name for name in allowed if FORMAT_MIMETYPES[name] == best)
+    if output_format not in allowed:
+        raise ValueError(f'Unsupported format: {output_format}')
+    if output_format in COLUMNAR_FORMATS and pa is None:
+        raise ValueError(f'{output_format} output requires pyarrow to be installed')
+    return output_format
+
+
+def iso_strings(datetimes):
+    """Vectorized Timestamp.isoformat() for whole-second datetimes."""
+    if datetimes.empty:
+        return pd.Series([], index=datetimes.index, dtype=object)
+    if datetimes.dt.tz is None:
+        strings = np.datetime_as_string(datetimes.to_numpy(), unit='s')
+        return pd.Series(strings, index=datetimes.index)
+
+    local = datetimes.dt.tz_localize(None).to_numpy()
+    utc = datetimes.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+    strings = np.datetime_as_string(local, unit='s')
+
+    # Format each distinct UTC offset once (+08:00) and append it per row
+    offsets, inverse = np.unique((local - utc) // np.timedelta64(1, 'm'), return_inverse=True)
+    suffixes = np.array([
+        f"{'+' if minutes >= 0 else '-'}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+        for minutes in offsets.astype(np.int64).tolist()
+    ], dtype=str)
+    return pd.Series(np.char.add(strings, suffixes[inverse.ravel()]), index=datetimes.index)
+
+
+def shortest_float32(values):
+    """float32 values as the float64 of their shortest decimal, e.g. 76.34 rather than 76.33774566650391.
+
+    Pollutants are held as float32 (see data_cache.apply_types); widened
+    as-is they would be written with digits the source data never had.
+    """
+    values32 = np.asarray(values, dtype=np.float32)
+    exact = values32.astype(np.float64)
+    result = exact.copy()
+    pending = np.isfinite(exact) & (exact != 0)
+    with np.errstate(divide='ignore'):
+        exponent = np.floor(np.log10(np.abs(np.where(pending, exact, 1.0)))).astype(np.int64)
+    # Nine significant digits always identify a float32, so at most nine rounds
+    for digits in range(1, 10):
+        if not pending.any():
+            break
+        rows = np.flatnonzero(pending)
+        shift = digits - 1 - exponent[rows]
+        # Dividing by an exact power of ten gives the double nearest to the decimal
+        up = 10.0 ** np.maximum(shift, 0)
+        down = 10.0 ** np.maximum(-shift, 0)
+        candidate = np.round(exact[rows] * up / down) * down / up
+        hit = candidate.astype(np.float32) == values32[rows]
+        result[rows[hit]] = candidate[hit]
+        pending[rows[hit]] = False
+    return result
+
+
+def _decimal_places(values):
+    # (fewest, most) decimal places that write a float column exactly: enough for every value, but no
+    # more than 15 significant digits, past which to_json prints 76.34 as 76.340000000000003
+    finite = values[np.isfinite(values)]
+    largest = float(np.abs(finite).max()) if len(finite) else 0.0
+    most = max(1, 15 - (int(np.log10(largest)) + 1 if largest >= 1 else 0))
+    for places in range(1, most + 1):
+        if np.array_equal(np.round(finite, places), finite):
+            return places, most
+    # Too many digits to write exactly either way; full precision keeps the most of them
+    return 15, 15
+
+
+def _json_lines(frame):
+    # One JSON object per row, each float column written with as many decimals as its values need
+    float_columns = [col for col, dtype in frame.dtypes.items() if dtype.kind == 'f']
+    if 'datetime' in frame.columns or float_columns:
+        frame = frame.copy()
+    if 'datetime' in frame.columns:
+        frame['datetime'] = iso_strings(frame['datetime'])
+    for col in float_columns:
+        if frame[col].dtype == np.float32:
+            frame[col] = shortest_float32(frame[col].to_numpy())
+    places = {col: _decimal_places(frame[col].to_numpy()) for col in float_columns}
+
+    # to_json takes one precision, so neighbouring columns share a call while some precision suits them all
+    runs = []
+    for i, col in enumerate(frame.columns):
+        fewest, most = places.get(col, (1, 15))
+        if runs and max(runs[-1][0], fewest) <= min(runs[-1][1], most):
+            runs[-1] = (max(runs[-1][0], fewest), min(runs[-1][1], most), runs[-1][2] + [i])
+        else:
+            runs.append((fewest, most, [i]))
+    parts = [frame.iloc[:, columns].to_json(orient='records', lines=True, double_precision=precision)
+             .rstrip('\n').split('\n') for precision, _, columns in runs]
+    if len(parts) == 1:
+        return parts[0]
+    return ['{' + ','.join(part[1:-1] for part in row) + '}' for row in zip(*parts)]
+
+
+def records_json(frame):
+    """Comma-separated JSON objects for the rows of a frame (no enclosing brackets)."""
+    if frame.empty:
+        return ''
+    return ','.join(_json_lines(frame))
+
+
+def ndjson_lines(frame):
+    """One JSON object per line for the rows of a frame."""
+    if frame.empty:
+        return ''
+    return '\n'.join(_json_lines(frame)) + '\n'
+
+
+def iter_batches(store, positions, fields=None, batch_size=BATCH_SIZE):
+    """Yield the selected rows as frames of at most batch_size rows."""
+    for start in range(0, len(positions), batch_size):
+        yield store.take(positions[start:start + batch_size], fields)
+
+
+def iter_ndjson(store, positions, fields=None):
+    for frame in iter_batches(store, positions, fields):
+        yield ndjson_lines(frame)
+
+
+def iter_json_document(store, positions, envelope, fields=None):
+    """Stream {"data": [...], **envelope} as a chunked JSON document."""
+    yield '{"data":['
+    first = True
+    for frame in iter_batches(store, positions, fields):
+        chunk = records_json(frame)
+        if chunk:
+            yield chunk if first else ',' + chunk
+            first = False
+    yield '],' + json.dumps(envelope, default=str)[1:]
+
+
+def encode_cursor(city, timestamp, ordinal=0):
+    """Opaque pagination cursor pointing just past the (city, datetime) row.
+
+    ordinal tells apart rows of a city that share the datetime (DataStore.tie_ordinal).
+    """
+    payload = json.dumps([city, pd.Timestamp(timestamp).isoformat(), int(ordinal)])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on malformed input.
+
+    Cursors issued before the ordinal was added decode with ordinal None.
+    """
+    try:
+        city, timestamp, *ordinal = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(ordinal) > 1 or (ordinal and (not isinstance(ordinal[0], int) or ordinal[0] < 0)):
+            raise ValueError('bad ordinal')
+        return city, pd.Timestamp(timestamp), ordinal[0] if ordinal else None
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def arrow_table(frame):
+    """Arrow table built column-wise from a DataFrame."""
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+
+def arrow_bytes(frame):
+    """A whole DataFrame as an Arrow IPC stream."""
+    table = arrow_table(frame)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def parquet_bytes(frame):
+    """A whole DataFrame as a Parquet file."""
+    sink = io.BytesIO()
+    pq.write_table(arrow_table(frame), sink)
+    return sink.getvalue()
+
+
+def iter_arrow_stream(store, positions, fields=None):
+    """Stream the selected rows as Arrow IPC record batches."""
+    sink = io.BytesIO()
+    # Take the schema from a real row so object columns are typed even for empty results
+    schema = arrow_table(store.take(range(0, min(1, len(store))), fields)).schema
+    writer = pa.ipc.new_stream(sink, schema)
+    for frame in iter_batches(store, positions, fields):
+        writer.write_batch(pa.RecordBatch.from_pandas(frame, schema=schema, preserve_index=False))
+        yield _drain(sink)
+    writer.close()
+    yield _drain(sink)
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -0,0 +1,155 @@
+# shared_dataset.py - Publish a DataStore as memory-mapped arrays that worker processes attach to
+#
+# One loader process publishes the sorted dataset:
+#   python shared_dataset.py publish [--dir /dev/shm/aqi_dataset]
+# and every worker started with AQI_SHARED_DATA=<dir> maps the same pages
+# instead of loading its own copy.
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from data_store import DataStore
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def default_directory():
+    # tmpfs keeps the arrays in RAM; fall back to the temp dir where /dev/shm does not exist
+    shm = Path('/dev/shm')
+    base = shm if shm.is_dir() else Path(tempfile.gettempdir())
+    return base / 'aqi_dataset'
+
+
+def _save(directory, name, values):
+    np.save(directory / f"{name}.npy", np.ascontiguousarray(values))
+    return f"{name}.npy"
+
+
+def _load(directory, filename):
+    return np.load(directory / filename, mmap_mode='r')
+
+
+def publish(store, directory):
+    """Write the store's columns and index arrays under a new version directory.
+
+    The manifest is replaced last, so attaching workers only ever see a complete
+    version. Returns the published version id.
+    """
+    directory = Path(directory)
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    version_dir = directory / version
+    version_dir.mkdir(parents=True)
+
+    columns = []
+    for i, name in enumerate(store.df.columns):
+        series = store.df[name]
+        column = {'name': name}
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            utc = series.dt.tz_convert('UTC').dt.tz_localize(None)
+            column.update(kind='datetime', tz=str(series.dt.tz), file=_save(version_dir, f"col_{i}", utc.to_numpy()))
+        elif is_numeric_dtype(series.dtype) or is_bool_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+            column.update(kind='array', file=_save(version_dir, f"col_{i}", series.to_numpy()))
+        else:
+            # Strings and categoricals are shared as integer codes plus a category list
+            categorical = series.astype('category')
+            column.update(kind='category',
+                          categories=categorical.cat.categories.tolist(),
+                          file=_save(version_dir, f"col_{i}", categorical.cat.codes.to_numpy()))
+        columns.append(column)
+
+    index = {name: _save(version_dir, name, getattr(store, name)) for name in DataStore.INDEX_ARRAYS}
+    manifest = {
+        'version': version,
+        'rows': len(store),
+        'columns': columns,
+        'index': index,
+        'cities': store.cities.tolist()
+    }
+
+    tmp_path = directory / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, directory / MANIFEST_NAME)
+
+    _prune(directory, keep={version, *_previous_versions(directory, version)})
+    return version
+
+
+def _previous_versions(directory, current):
+    # Keep the newest older version too; workers may still be attached to it
+    versions = sorted(p.name for p in directory.iterdir() if p.is_dir() and p.name != current)
+    return versions[-1:]
+
+
+def _prune(directory, keep):
+    # Mapped files stay valid after unlinking, so removing old versions is safe for attached workers
+    for path in directory.iterdir():
+        if path.is_dir() and path.name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _wrap_datetime(values, tz):
+    # Build the tz-aware array directly on the mapped buffer; the public
+    # constructors all copy, so only fall back to them if the internal one is gone
+    dtype = pd.DatetimeTZDtype(np.datetime_data(values.dtype)[0], tz)
+    try:
+        return pd.arrays.DatetimeArray._simple_new(values, dtype=dtype)
+    except AttributeError:
+        return pd.Series(values).dt.tz_localize('UTC').dt.tz_convert(tz).array
+
+
+def attach(directory):
+    """Map the currently published version into a DataStore without copying columns."""
+    directory = Path(directory)
+    with open(directory / MANIFEST_NAME) as file:
+        manifest = json.load(file)
+    version_dir = directory / manifest['version']
+
+    data = {}
+    for column in manifest['columns']:
+        values = _load(version_dir, column['file'])
+        if column['kind'] == 'datetime':
+            data[column['name']] = _wrap_datetime(values, column['tz'])
+        elif column['kind'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(values, categories=column['categories'])
+        else:
+            data[column['name']] = values
+    df = pd.DataFrame(data, copy=False)
+
+    # Only the arrays DataStore still takes; versions published by older code may carry more
+    index = {name: _load(version_dir, manifest['index'][name]) for name in DataStore.INDEX_ARRAYS}
+    store = DataStore.from_index(df, cities=np.array(manifest['cities'], dtype=object), **index)
+    store.shared_version = manifest['version']
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish the air quality dataset for shared-memory workers')
+    parser.add_argument('command', choices=['publish'])
+    parser.add_argument('--dir', default=os.environ.get('AQI_SHARED_DATA') or str(default_directory()),
+                        help='Directory the workers attach to (AQI_SHARED_DATA)')
+    args = parser.parse_args()
+
+    # Imported here so the API module's own shared-mode lookup is not involved
+    from python_app import load_data
+
+    df = load_data()
+    if df is None:
+        raise SystemExit("Dataset could not be loaded; nothing published")
+    version = publish(DataStore(df), args.dir)
+    print(f"Published {len(df)} records as version {version} in {args.dir}")
+    print(f"Start workers with AQI_SHARED_DATA={args.dir}")
+
+
+if __name__ == '__main__':
+    main()
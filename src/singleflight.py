@@ -0,0 +1,72 @@
+# singleflight.py - Coalesce concurrent identical computations into one in-flight execution
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile wait and share its result.
+
+    Keys identify the work completely (e.g. endpoint, query and data version),
+    so sharing a result is only ever sharing an identical one. An exception
+    raised by the executing call is raised in every waiter too.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def do(self, key, function):
+        """(result, shared); shared is True when another caller's execution was reused."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            # Removed before waking the waiters, so a later caller starts a fresh execution
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'in_flight': len(self._calls),
+                'waiting': sum(call.waiters for call in self._calls.values())
+            }
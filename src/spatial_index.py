@@ -0,0 +1,261 @@
+# spatial_index.py - Per-station AQI sums bucketed into lat/lon grid cells for map viewport queries
+
+import numpy as np
+import pandas as pd
+
+MAX_ZOOM = 20
+# Grid cells per map tile edge; a tile spans 360 / 2**zoom degrees of longitude
+CELLS_PER_TILE = 8
+
+
+def cell_size(zoom):
+    """Edge length in degrees of the grid cells used at a map zoom level."""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def _first_valid(values, starts, stops):
+    # First non-NaN value of each block, NaN for blocks without one
+    n = len(values)
+    candidates = np.where(np.isnan(values), n, np.arange(n))
+    first = np.minimum.reduceat(candidates, starts) if len(starts) else np.array([], dtype=np.int64)
+    found = first < stops
+    result = np.full(len(starts), np.nan)
+    result[found] = values[first[found]]
+    return result
+
+
+class GridLevel:
+    """Stations aggregated into the cells of one zoom level, sorted by (column, row)."""
+
+    def __init__(self, zoom, ix, iy, aqi_sum, aqi_count, points, stations, lat_sum, lon_sum, first_station):
+        self.zoom = zoom
+        self.ix = ix
+        self.iy = iy
+        self.aqi_sum = aqi_sum
+        self.aqi_count = aqi_count
+        self.points = points
+        self.stations = stations
+        self.lat_sum = lat_sum
+        self.lon_sum = lon_sum
+        self.first_station = first_station
+
+    @classmethod
+    def build(cls, zoom, index):
+        located = np.flatnonzero(~np.isnan(index.lat) & ~np.isnan(index.lon))
+        ix, iy = index.cell_of(zoom, located)
+        keys, station_cell = np.unique(np.column_stack([ix, iy]), axis=0, return_inverse=True)
+        station_cell = station_cell.ravel()
+        n_cells = len(keys)
+
+        def total(values):
+            return np.bincount(station_cell, weights=values, minlength=n_cells)
+
+        first_station = np.full(n_cells, len(index.cities), dtype=np.int64)
+        np.minimum.at(first_station, station_cell, located)
+        return cls(zoom, keys[:, 0] if n_cells else np.array([], dtype=np.int64),
+                   keys[:, 1] if n_cells else np.array([], dtype=np.int64),
+                   total(index.aqi_sum[located]), total(index.aqi_count[located]),
+                   total(index.points[located]).astype(np.int64),
+                   np.bincount(station_cell, minlength=n_cells),
+                   total(index.lat[located]), total(index.lon[located]), first_station)
+
+    def add(self, cells, aqi_sum, aqi_count, points):
+        """Copy with per-station deltas added to their (existing) cells."""
+        positions = self.positions(*cells)
+        level = GridLevel(self.zoom, self.ix, self.iy, self.aqi_sum.copy(), self.aqi_count.copy(),
+                          self.points.copy(), self.stations, self.lat_sum, self.lon_sum, self.first_station)
+        np.add.at(level.aqi_sum, positions, aqi_sum)
+        np.add.at(level.aqi_count, positions, aqi_count)
+        np.add.at(level.points, positions, points)
+        return level
+
+    def positions(self, ix, iy):
+        # Cells are sorted by ix, then iy, so a combined key is monotonic
+        order_keys = self.ix.astype(np.int64) * (1 << 32) + self.iy
+        return np.searchsorted(order_keys, np.asarray(ix, dtype=np.int64) * (1 << 32) + iy)
+
+    def query(self, ix_range, iy_range):
+        """Positions of the cells inside inclusive column and row ranges."""
+        lo = np.searchsorted(self.ix, ix_range[0], side='left')
+        hi = np.searchsorted(self.ix, ix_range[1], side='right')
+        rows = self.iy[lo:hi]
+        return lo + np.flatnonzero((rows >= iy_range[0]) & (rows <= iy_range[1]))
+
+
+class SpatialIndex:
+    """Per-station AQI sums with lazily built grid levels for viewport queries.
+
+    A station is a city_name with its first known coordinates, as on the map.
+    add() folds new readings into the station sums and into every grid level
+    built so far, so cell averages stay current without regrouping raw rows.
+    """
+
+    def __init__(self, cities, lat, lon, aqi_sum, aqi_count, points, levels=None):
+        self.cities = cities
+        self.lat = lat
+        self.lon = lon
+        self.aqi_sum = aqi_sum
+        self.aqi_count = aqi_count
+        self.points = points
+        self._levels = levels if levels is not None else {}
+
+    @classmethod
+    def from_store(cls, store):
+        """Build from a DataStore with one reduceat per column over the city blocks."""
+        starts = store.offsets[:-1]
+        stops = store.offsets[1:]
+        if len(starts) == 0:
+            empty = np.array([])
+            return cls(np.array([], dtype=object), empty, empty, empty, empty, np.array([], dtype=np.int64))
+
+        aqi = store.df['main.aqi'].to_numpy(dtype=float)
+        present = ~np.isnan(aqi)
+        return cls(
+            np.asarray(store.cities, dtype=object),
+            _first_valid(store.df['lat'].to_numpy(dtype=float), starts, stops),
+            _first_valid(store.df['lon'].to_numpy(dtype=float), starts, stops),
+            np.add.reduceat(np.where(present, aqi, 0.0), starts),
+            np.add.reduceat(present.astype(float), starts),
+            np.add.reduceat(store.df['datetime'].notna().to_numpy().astype(np.int64), starts)
+        )
+
+    def _lookup(self, names):
+        # Position of each name among the sorted stations and whether it is there
+        position = np.searchsorted(self.cities, names)
+        known = np.zeros(len(names), dtype=bool)
+        in_range = position < len(self.cities)
+        known[in_range] = self.cities[position[in_range]] == names[in_range]
+        return position, known
+
+    def cell_of(self, zoom, stations):
+        size = cell_size(zoom)
+        ix = np.floor((self.lon[stations] + 180.0) / size).astype(np.int64)
+        iy = np.floor((self.lat[stations] + 90.0) / size).astype(np.int64)
+        return ix, iy
+
+    def level(self, zoom):
+        # Levels are cached on the index; a dict store is atomic, so concurrent builders just race harmlessly
+        zoom = min(max(int(zoom), 0), MAX_ZOOM)
+        level = self._levels.get(zoom)
+        if level is None:
+            level = GridLevel.build(zoom, self)
+            self._levels[zoom] = level
+        return level
+
+    def add(self, rows):
+        """Return an index including the given readings; self is left unchanged."""
+        rows = rows.dropna(subset=['city_name'])
+        if rows.empty:
+            return self
+        rows = rows.sort_values('datetime', kind='mergesort')
+        groups = rows.groupby(rows['city_name'].astype(str), sort=True)
+        aqi = groups['main.aqi'].agg(['sum', 'count'])
+        batch = pd.DataFrame({
+            'aqi_sum': aqi['sum'].to_numpy(dtype=float),
+            'aqi_count': aqi['count'].to_numpy(dtype=float),
+            'points': groups['datetime'].count().to_numpy(dtype=np.int64),
+            'lat': groups['lat'].first().to_numpy(dtype=float),
+            'lon': groups['lon'].first().to_numpy(dtype=float)
+        }, index=aqi.index)
+
+        names = batch.index.to_numpy(dtype=object)
+        position, known = self._lookup(names)
+        if known.all() and not (np.isnan(self.lat[position]) & batch['lat'].notna().to_numpy()).any():
+            aqi_sum, aqi_count, points = self.aqi_sum.copy(), self.aqi_count.copy(), self.points.copy()
+            aqi_sum[position] += batch['aqi_sum'].to_numpy()
+            aqi_count[position] += batch['aqi_count'].to_numpy()
+            points[position] += batch['points'].to_numpy()
+            index = SpatialIndex(self.cities, self.lat, self.lon, aqi_sum, aqi_count, points)
+
+            # Stations without coordinates are in no cell
+            located = ~np.isnan(self.lat[position]) & ~np.isnan(self.lon[position])
+            deltas = batch[located]
+            for zoom, level in list(self._levels.items()):
+                index._levels[zoom] = level.add(index.cell_of(zoom, position[located]),
+                                                deltas['aqi_sum'].to_numpy(), deltas['aqi_count'].to_numpy(),
+                                                deltas['points'].to_numpy())
+            return index
+
+        # New or newly located stations change the cell layout: merge the station table, levels rebuild on demand
+        table = pd.DataFrame({
+            'lat': self.lat, 'lon': self.lon, 'aqi_sum': self.aqi_sum,
+            'aqi_count': self.aqi_count, 'points': self.points
+        }, index=pd.Index(self.cities, dtype=object))
+        merged = table.reindex(table.index.union(batch.index))
+        for col in ('aqi_sum', 'aqi_count', 'points'):
+            merged[col] = merged[col].fillna(0).add(batch[col], fill_value=0)
+        for col in ('lat', 'lon'):
+            merged[col] = merged[col].fillna(batch[col])
+        return SpatialIndex(merged.index.to_numpy(dtype=object), merged['lat'].to_numpy(dtype=float),
+                            merged['lon'].to_numpy(dtype=float), merged['aqi_sum'].to_numpy(dtype=float),
+                            merged['aqi_count'].to_numpy(dtype=float),
+                            merged['points'].to_numpy().astype(np.int64))
+
+    def stations(self, city='all', bbox=None):
+        """Per-station records, the shape /api/heatmap has always returned."""
+        if city == 'all':
+            selected = np.arange(len(self.cities))
+        else:
+            i = np.searchsorted(self.cities, city)
+            selected = np.array([i] if i < len(self.cities) and self.cities[i] == city else [], dtype=np.int64)
+        if bbox is not None:
+            west, south, east, north = bbox
+            lat, lon = self.lat[selected], self.lon[selected]
+            in_lon = (lon >= west) & (lon <= east) if west <= east else (lon >= west) | (lon <= east)
+            selected = selected[in_lon & (lat >= south) & (lat <= north)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            averages = self.aqi_sum[selected] / self.aqi_count[selected]
+        return [
+            {
+                'city_name': city_name,
+                'avg_aqi': _number(average),
+                'lat': _number(lat),
+                'lon': _number(lon),
+                'data_points': int(points)
+            }
+            for city_name, average, lat, lon, points in zip(
+                self.cities[selected].tolist(), averages.tolist(), self.lat[selected].tolist(),
+                self.lon[selected].tolist(), self.points[selected].tolist())
+        ]
+
+    def cells(self, zoom, bbox=None):
+        """Aggregated grid cells at a zoom level, limited to those overlapping the bbox."""
+        level = self.level(zoom)
+        size = cell_size(level.zoom)
+        if bbox is None:
+            selected = np.arange(len(level.ix))
+        else:
+            west, south, east, north = bbox
+            iy_range = (np.floor((south + 90.0) / size), np.floor((north + 90.0) / size))
+            # A box across the antimeridian is two column ranges
+            lon_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+            selected = np.concatenate([
+                level.query((np.floor((lo + 180.0) / size), np.floor((hi + 180.0) / size)), iy_range)
+                for lo, hi in lon_ranges
+            ])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            averages = level.aqi_sum[selected] / level.aqi_count[selected]
+        stations = level.stations[selected]
+        records = []
+        for k, cell in enumerate(selected.tolist()):
+            west_edge = level.ix[cell] * size - 180.0
+            south_edge = level.iy[cell] * size - 90.0
+            single = stations[k] == 1
+            records.append({
+                'cell': f"{level.zoom}/{level.ix[cell]}/{level.iy[cell]}",
+                'city_name': self.cities[level.first_station[cell]] if single else None,
+                'avg_aqi': _number(averages[k]),
+                # Mean station position, so single-station cells sit exactly on the station
+                'lat': float(level.lat_sum[cell] / stations[k]),
+                'lon': float(level.lon_sum[cell] / stations[k]),
+                'data_points': int(level.points[cell]),
+                'stations': int(stations[k]),
+                'bounds': [float(west_edge), float(south_edge), float(west_edge + size), float(south_edge + size)]
+            })
+        return records
+
+
+def _number(value):
+    # NaN (no readings or no coordinates) becomes null in JSON
+    return None if np.isnan(value) else float(value)
@@ -0,0 +1,24 @@
+# test_correlations.py - Scatter point allocation across AQI strata
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from correlations import CityCorrelations, CoMoments
+
+
+def _correlations(kept, population):
+    strata = np.repeat(np.arange(1, len(kept) + 1), kept)
+    sample = pd.DataFrame({'stratum': strata, 'key': np.arange(len(strata))})
+    return CityCorrelations(CoMoments.from_values(np.zeros((0, 2))),
+                            pd.Series(population, index=np.arange(1, len(kept) + 1)), sample)
+
+
+@pytest.mark.parametrize('limit', [0, 1, 3, 5, 10, 37, 500, 1999, 2000, 5000])
+def test_points_returns_min_of_limit_and_available(limit):
+    correlations = _correlations([1000, 1000, 200, 3, 1], [50000, 20000, 200, 3, 1])
+    points = correlations.points(limit)
+    assert len(points) == min(limit, 2204)
+    # Every level that fits in the equal half of the budget is represented
+    if limit >= 10:
+        assert set(points['stratum']) == {1, 2, 3, 4, 5}
@@ -0,0 +1,44 @@
+# test_data_store.py - Cursor positions in a store with repeated timestamps
+
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+
+from data_store import DataStore
+from serializers import decode_cursor, encode_cursor
+
+
+def _store():
+    # Two cities with every hour recorded by three stations, so each timestamp appears three times
+    datetimes = pd.date_range('2024-01-01', periods=20, freq='h', tz='Asia/Manila').repeat(3)
+    frame = pd.DataFrame({'datetime': datetimes, 'main.aqi': np.arange(len(datetimes), dtype=float)})
+    return DataStore(pd.concat([frame.assign(city_name='A'), frame.assign(city_name='B')], ignore_index=True))
+
+
+def test_cursor_pages_cover_rows_sharing_a_timestamp():
+    store = _store()
+    for per_page in (1, 2, 4, 7, 100):
+        seen = []
+        offset = 0
+        while offset < len(store):
+            page = range(offset, min(offset + per_page, len(store)))
+            seen.extend(page)
+            last = store.df.iloc[page[-1]]
+            cursor = encode_cursor(last['city_name'], last['datetime'], store.tie_ordinal(page[-1]))
+            offset = store.position_after(*decode_cursor(cursor))
+        assert seen == list(range(len(store)))
+
+
+def test_cursor_without_ordinal_skips_the_whole_timestamp():
+    store = _store()
+    city, timestamp = 'A', store.df['datetime'].iloc[0]
+    assert store.position_after(city, timestamp) == 3
+    assert store.position_after(city, timestamp, 0) == 1
+    assert store.position_after(city, timestamp, 2) == 3
+
+
+def test_decode_cursor_without_ordinal():
+    legacy = base64.urlsafe_b64encode(json.dumps(['A', '2024-01-01T00:00:00+08:00']).encode()).decode()
+    assert decode_cursor(legacy)[2] is None
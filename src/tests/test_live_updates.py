@@ -0,0 +1,41 @@
+# test_live_updates.py - Events computed for /api/stream when an ingest changes the data
+
+import numpy as np
+import pandas as pd
+
+from data_store import DataStore
+from python_app import LATEST_COLUMNS, latest_changes, stream_events
+from registry import Snapshot
+
+
+def _readings(city, start, hours, aqi):
+    datetimes = pd.date_range(start, periods=hours, freq='h', tz='Asia/Manila')
+    frame = pd.DataFrame({column: np.full(hours, 10.0) for column in LATEST_COLUMNS})
+    frame['city_name'] = city
+    frame['datetime'] = datetimes
+    frame['main.aqi'] = aqi
+    return frame
+
+
+def _snapshots(rows, added):
+    store = DataStore(pd.concat(rows, ignore_index=True))
+    old = Snapshot(store, 'v1', None, None, 'm1')
+    return old, old.with_data(store.append(added), 'v2')
+
+
+def test_backfill_ingest_sends_no_latest_or_risk_events():
+    old, new = _snapshots([_readings('A', '2024-03-02', 24, 2), _readings('B', '2024-03-02', 24, 3)],
+                          _readings('A', '2024-03-01', 24, 5))
+    assert latest_changes(old.store, new.store) == ({}, {})
+
+    events = stream_events(old, new, ['all', 'A', 'B'])
+    assert [name for name, _ in events['A']] == ['daily']
+    assert [name for name, _ in events['all']] == ['daily']
+    assert events['B'] == []
+
+
+def test_newer_reading_sends_latest_and_risk_events():
+    old, new = _snapshots([_readings('A', '2024-03-02', 24, 2)], _readings('A', '2024-03-03', 1, 5))
+    readings, risks = latest_changes(old.store, new.store)
+    assert readings['A']['datetime'] == '2024-03-03T00:00:00+08:00'
+    assert risks == {'A': 4}
@@ -0,0 +1,46 @@
+# test_rollups.py - Rollups built in one pass agree with rollups built incrementally
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregates import AGGREGATE_COLUMNS
+from data_store import DataStore
+from rollups import GRANULARITIES, Rollups
+
+
+def _readings(city, start, hours, lat):
+    frame = pd.DataFrame({column: np.arange(hours, dtype=float) + 1 for column in AGGREGATE_COLUMNS})
+    frame['city_name'] = city
+    frame['datetime'] = pd.date_range(start, periods=hours, freq='h', tz='Asia/Manila')
+    frame['lat'] = lat
+    frame['lon'] = 121.0
+    return frame
+
+
+@pytest.fixture
+def readings():
+    # A covers 05:00-07:00 and B 00:00-02:00 of the same days, so B holds each day's first reading
+    # although A comes first in city order
+    days = pd.date_range('2024-03-01', periods=3, freq='D')
+    a = pd.concat([_readings('A', day + pd.Timedelta(hours=5), 3, 14.0) for day in days], ignore_index=True)
+    b = pd.concat([_readings('B', day, 3, 15.0) for day in days], ignore_index=True)
+    return a, b
+
+
+def test_all_cities_day_bounds(readings):
+    a, b = readings
+    table = Rollups.from_store(DataStore(pd.concat([a, b], ignore_index=True)))['day'].table('all')
+    assert table['first_time'].dt.hour.tolist() == [0, 0, 0]
+    assert table['last_time'].dt.hour.tolist() == [7, 7, 7]
+
+
+@pytest.mark.parametrize('granularity', GRANULARITIES)
+def test_full_build_matches_build_then_ingest(readings, granularity):
+    a, b = readings
+    full = Rollups.from_store(DataStore(pd.concat([a, b], ignore_index=True)))
+    # All of A and the first day of B, then the rest of B arrives as one ingested batch
+    incremental = Rollups.from_store(DataStore(pd.concat([a, b.iloc[:3]], ignore_index=True))).add(b.iloc[3:])
+    for city in ('all', 'A', 'B'):
+        pd.testing.assert_frame_equal(incremental[granularity].table(city), full[granularity].table(city),
+                                      check_dtype=False)
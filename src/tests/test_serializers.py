@@ -0,0 +1,45 @@
+# test_serializers.py - Datetime strings and JSON rows written for API responses
+
+import numpy as np
+import pandas as pd
+
+from serializers import iso_strings, ndjson_lines, records_json, shortest_float32
+
+
+def test_iso_strings_formats_offsets():
+    datetimes = pd.Series(pd.to_datetime(['2024-01-01 08:00:00', '2024-06-30 23:59:59']).tz_localize('Asia/Manila'))
+    assert iso_strings(datetimes).tolist() == [ts.isoformat() for ts in datetimes]
+
+
+def test_iso_strings_empty():
+    for datetimes in (pd.Series([], dtype='datetime64[ns, Asia/Manila]'), pd.Series([], dtype='datetime64[ns]')):
+        strings = iso_strings(datetimes)
+        assert strings.empty
+        assert strings.index.equals(datetimes.index)
+
+
+def test_records_json_writes_source_digits():
+    # Pollutants are float32 in memory; they are written as read, not with float32 noise or padding
+    frame = pd.DataFrame({
+        'city_name': ['A', 'B'],
+        'lat': [14.5995, 14.6],
+        'datetime': pd.to_datetime(['2024-01-01 08:00', '2024-01-01 09:00']).tz_localize('Asia/Manila'),
+        'main.aqi': [2, 3],
+        'components.co': np.array([76.34, 0.05], dtype=np.float32),
+        'components.no': np.array([1234.5, np.nan], dtype=np.float32)
+    })
+    expected = [
+        '{"city_name":"A","lat":14.5995,"datetime":"2024-01-01T08:00:00+08:00","main.aqi":2,'
+        '"components.co":76.34,"components.no":1234.5}',
+        '{"city_name":"B","lat":14.6,"datetime":"2024-01-01T09:00:00+08:00","main.aqi":3,'
+        '"components.co":0.05,"components.no":null}'
+    ]
+    assert records_json(frame) == ','.join(expected)
+    assert ndjson_lines(frame) == '\n'.join(expected) + '\n'
+
+
+def test_shortest_float32_round_trips():
+    values = (np.random.default_rng(3).random(10000) * 500).astype(np.float32)
+    shortest = shortest_float32(values)
+    np.testing.assert_array_equal(shortest.astype(np.float32), values)
+    np.testing.assert_array_equal(shortest, values.astype(str).astype(float))
@@ -0,0 +1,86 @@
+# test_singleflight.py - Concurrent callers of one key share a single execution
+
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def _wait_for_waiters(flight, count, timeout=5.0):
+    # Keeps the leader in flight until every other caller is waiting on it
+    deadline = time.monotonic() + timeout
+    while flight.stats()['waiting'] < count:
+        assert time.monotonic() < deadline, 'callers never joined the in-flight call'
+        time.sleep(0.001)
+
+
+def _run_concurrently(flight, key, function):
+    barrier = threading.Barrier(CALLERS)
+    outcomes = [None] * CALLERS
+
+    def caller(i):
+        barrier.wait()
+        try:
+            outcomes[i] = flight.do(key, function)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+    return outcomes
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight('test')
+    runs = []
+
+    def slow():
+        runs.append(threading.get_ident())
+        _wait_for_waiters(flight, CALLERS - 1)
+        return object()
+
+    outcomes = _run_concurrently(flight, 'key', slow)
+    assert len(runs) == 1
+    results = {id(result) for result, _ in outcomes}
+    assert len(results) == 1
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * (CALLERS - 1)
+    assert flight.stats() == {'executions': 1, 'coalesced': CALLERS - 1, 'errors': 0,
+                              'in_flight': 0, 'waiting': 0}
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight('test')
+    runs = []
+
+    def failing():
+        runs.append(1)
+        _wait_for_waiters(flight, CALLERS - 1)
+        raise RuntimeError('boom')
+
+    outcomes = _run_concurrently(flight, 'key', failing)
+    assert len(runs) == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert len({id(outcome) for outcome in outcomes}) == 1
+    assert flight.stats()['errors'] == 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_call_after_completion_recomputes():
+    flight = SingleFlight('test')
+    counter = iter(range(10))
+
+    assert flight.do('key', lambda: next(counter)) == (0, False)
+    assert flight.do('key', lambda: next(counter)) == (1, False)
+
+    with pytest.raises(ValueError):
+        flight.do('key', lambda: int('x'))
+    assert flight.do('key', lambda: next(counter)) == (2, False)
+    assert flight.stats()['executions'] == 4
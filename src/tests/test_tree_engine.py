@@ -0,0 +1,80 @@
+# test_tree_engine.py - The compiled forest predicts exactly what scikit-learn does
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+from prediction_engine import MODEL_FEATURES, POLLUTANT_FEATURES
+from tree_engine import CompiledForest
+
+
+def _features(n_rows, rng):
+    # Pollutants are continuous; hour, day, month and weekday are the integers that often sit on a split
+    return np.column_stack([
+        rng.random((n_rows, len(POLLUTANT_FEATURES))) * 200,
+        rng.integers(0, 24, n_rows),
+        rng.integers(1, 29, n_rows),
+        rng.integers(1, 13, n_rows),
+        rng.integers(0, 7, n_rows)
+    ]).astype(float)
+
+
+@pytest.fixture(scope='module')
+def trained():
+    # Trained the way train_model.py does: scaler on raw features, forest on float32 scaled features
+    rng = np.random.default_rng(7)
+    X = _features(4000, rng)
+    y = X[:, 0] / 50 + np.sin(X[:, len(POLLUTANT_FEATURES)] / 4) + X[:, -2] / 6 + rng.normal(0, 0.2, len(X))
+    scaler = StandardScaler().fit(pd.DataFrame(X, columns=MODEL_FEATURES))
+    model = RandomForestRegressor(n_estimators=20, random_state=42, min_samples_leaf=2)
+    model.fit(scaler.transform(pd.DataFrame(X, columns=MODEL_FEATURES)).astype(np.float32), y)
+    return model, scaler, X
+
+
+def _sklearn(model, scaler, X):
+    return model.predict(scaler.transform(pd.DataFrame(X, columns=MODEL_FEATURES)))
+
+
+def test_matches_sklearn_on_training_and_new_rows(trained, tmp_path):
+    model, scaler, X = trained
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    X_new = _features(5000, np.random.default_rng(8))
+    for rows in (X, X_new):
+        np.testing.assert_allclose(compiled.predict(rows), _sklearn(model, scaler, rows), rtol=0, atol=1e-9)
+
+    compiled.save(tmp_path / 'model.compiled')
+    loaded = CompiledForest.load(tmp_path / 'model.compiled')
+    np.testing.assert_allclose(loaded.predict(X_new), _sklearn(model, scaler, X_new), rtol=0, atol=1e-9)
+
+
+def test_matches_sklearn_on_split_values(trained):
+    # Every threshold of the time features lies between two integers; the integers themselves must not flip
+    model, scaler, X = trained
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    rows = np.repeat(X[:1], 24 * 28, axis=0)
+    time_start = len(POLLUTANT_FEATURES)
+    rows[:, time_start] = np.tile(np.arange(24), 28)
+    rows[:, time_start + 1] = np.repeat(np.arange(1, 29), 24)
+    np.testing.assert_allclose(compiled.predict(rows), _sklearn(model, scaler, rows), rtol=0, atol=1e-9)
+
+
+def test_save_swaps_versions_in_place(trained, tmp_path):
+    model, scaler, X = trained
+    path = tmp_path / 'model.compiled'
+    # A directory written by an older save is replaced and kept as the previous version
+    path.mkdir()
+    (path / 'meta.json').write_text('{}')
+
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    for _ in range(3):
+        compiled.save(path)
+        assert path.is_symlink()
+        np.testing.assert_array_equal(CompiledForest.load(path).predict(X[:100]), compiled.predict(X[:100]))
+
+    # The current version and the one before it
+    versions = sorted(entry.name for entry in (tmp_path / 'model.compiled.versions').iterdir())
+    assert len(versions) == 2
+    assert path.resolve().name in versions
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ['model.compiled', 'model.compiled.versions']
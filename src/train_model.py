@@ -1,76 +1,322 @@
-import pandas as pd
+# train_model.py - Train the AQI RandomForest from cached, memory-mapped features
+#
+# Run from the src/ directory:
+#   python train_model.py                     # full retrain on all cores
+#   python train_model.py --add-trees 20      # warm start: keep the forest, grow 20 more trees
+#   python train_model.py --add-trees 20 --new-data-only   # new trees see only rows added since last run
+#   python train_model.py --csv /data/generated.csv         # another dataset (or set AQI_CSV_PATH)
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
 import numpy as np
-from sklearn.model_selection import train_test_split
+import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import r2_score
 from sklearn.preprocessing import StandardScaler
-import pickle
-import os
-
-print("Starting AQI model training...")
 
-# Check if data file exists
-data_path = "assets/updated_air_quality.csv"
-if not os.path.exists(data_path):
-    print(f"Error: Data file not found at {data_path}")
-    print("Please ensure the data file is in the correct location.")
-    exit(1)
+from data_cache import load_dataset
+from ingest import CsvTail
+from model_store import choose_artifact, load_artifact, save_joblib
+from prediction_engine import MODEL_FEATURES, POLLUTANT_FEATURES
+from tree_engine import CompiledForest
 
-# Load and preprocess data
-print("Loading and preprocessing data...")
 try:
-    df = pd.read_csv(data_path)
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    
-    # Extract time features
-    df['hour'] = df['datetime'].dt.hour
-    df['day'] = df['datetime'].dt.day
-    df['month'] = df['datetime'].dt.month
-    df['day_of_week'] = df['datetime'].dt.dayofweek
-    
-    # Define features and target
-    features = ['components.co', 'components.no', 'components.no2',
-                'components.o3', 'components.so2', 'components.pm2_5',
-                'components.pm10', 'components.nh3', 'hour', 'day',
-                'month', 'day_of_week']
-    
-    target = 'main.aqi'
-    
-    # Drop rows with missing values
-    df = df.dropna(subset=features + [target])
-    
-    X = df[features]
-    y = df[target]
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # Scale features
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --csv or AQI_CSV_PATH override the bundled dataset
+DATA_PATH = Path(os.environ.get('AQI_CSV_PATH') or "assets/updated_air_quality.csv")
+MODEL_PATH = Path('aqi_model.pkl')
+MODEL_JOBLIB_PATH = Path('aqi_model.joblib')
+MODEL_COMPILED_PATH = Path('aqi_model.compiled')
+SCALER_PATH = Path('aqi_scaler.pkl')
+METRICS_PATH = Path('aqi_model_metrics.json')
+TARGET = 'main.aqi'
+
+# Bump when the cached feature layout changes so old caches are rebuilt
+FEATURE_CACHE_VERSION = 1
+TEST_FRACTION = 0.2
+# Rows scaled per step when writing the scaled matrix, so peak memory stays flat
+CHUNK_ROWS = 1_000_000
+# Training R² is estimated on at most this many rows
+TRAIN_SCORE_ROWS = 200_000
+
+
+def feature_rows(df):
+    """Model features and target for readings with datetimes in Asia/Manila, dropping incomplete rows."""
+    datetimes = df['datetime']
+    frame = df[POLLUTANT_FEATURES].astype(np.float32)
+    frame['hour'] = datetimes.dt.hour
+    frame['day'] = datetimes.dt.day
+    frame['month'] = datetimes.dt.month
+    frame['day_of_week'] = datetimes.dt.dayofweek
+    frame[TARGET] = df[TARGET]
+    frame = frame.dropna()
+    return frame[MODEL_FEATURES].to_numpy(dtype=np.float32), frame[TARGET].to_numpy(dtype=np.float64)
+
+
+class FeatureCache:
+    """Engineered features of the CSV as raw float32 files that are memory-mapped for training.
+
+    When the CSV has only grown since the cache was written, just the new
+    lines are parsed and appended.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.directory = csv_path.parent / '.cache' / 'features' / csv_path.stem
+        self.features_path = self.directory / 'features.f4'
+        self.target_path = self.directory / 'target.f8'
+        self.scaled_path = self.directory / 'scaled.f4'
+        self.meta_path = self.directory / 'meta.json'
+        self.meta = self._read_meta()
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != FEATURE_CACHE_VERSION or meta.get('features') != MODEL_FEATURES:
+            return None
+        return meta
+
+    def _write_meta(self):
+        tmp_path = self.meta_path.with_name(f"{self.meta_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as file:
+            json.dump(self.meta, file)
+        os.replace(tmp_path, self.meta_path)
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def refresh(self):
+        """Bring the cache up to date with the CSV; returns 'cached', 'appended' or 'rebuilt'."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.meta is not None:
+            tail = CsvTail(self.csv_path, self.meta['csv_offset'], self.meta['csv_checksum'])
+            if tail.is_append_only():
+                rows, next_tail = tail.read_new_rows()
+                if rows is None:
+                    return 'cached'
+                X, y = feature_rows(rows)
+                with open(self.features_path, 'ab') as file:
+                    file.write(X.tobytes())
+                with open(self.target_path, 'ab') as file:
+                    file.write(y.tobytes())
+                self.meta.update(rows=self.meta['rows'] + len(y), csv_offset=next_tail.offset,
+                                 csv_checksum=next_tail.checksum)
+                self._write_meta()
+                return 'appended'
+
+        csv_size = self.csv_path.stat().st_size
+        df, _, _ = load_dataset(self.csv_path)
+        X, y = feature_rows(df)
+        del df
+        X.tofile(self.features_path)
+        y.tofile(self.target_path)
+        tail = CsvTail.at(self.csv_path, csv_size)
+        self.meta = {
+            'version': FEATURE_CACHE_VERSION,
+            'features': MODEL_FEATURES,
+            'rows': len(y),
+            'csv_offset': tail.offset,
+            'csv_checksum': tail.checksum,
+            'scaled_rows': 0,
+            'scaler': None
+        }
+        self._write_meta()
+        return 'rebuilt'
+
+    def features(self):
+        return np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(self.rows, len(MODEL_FEATURES)))
+
+    def target(self):
+        return np.memmap(self.target_path, dtype=np.float64, mode='r', shape=(self.rows,))
+
+    def scaled(self, scaler):
+        """Memory-mapped features transformed by scaler; rows already scaled with it are reused."""
+        fingerprint = [scaler.mean_.tolist(), scaler.scale_.tolist()]
+        start = self.meta['scaled_rows'] if self.meta.get('scaler') == fingerprint else 0
+        if start < self.rows:
+            features = self.features()
+            mode = 'r+' if start else 'w+'
+            if start:
+                # Grow the file to the new row count before mapping it writable
+                with open(self.scaled_path, 'ab') as file:
+                    file.truncate(self.rows * len(MODEL_FEATURES) * 4)
+            scaled = np.memmap(self.scaled_path, dtype=np.float32, mode=mode, shape=(self.rows, len(MODEL_FEATURES)))
+            for chunk in range(start, self.rows, CHUNK_ROWS):
+                stop = min(chunk + CHUNK_ROWS, self.rows)
+                scaled[chunk:stop] = (features[chunk:stop] - scaler.mean_) / scaler.scale_
+            scaled.flush()
+            del scaled
+            self.meta.update(scaled_rows=self.rows, scaler=fingerprint)
+            self._write_meta()
+        return np.memmap(self.scaled_path, dtype=np.float32, mode='r', shape=(self.rows, len(MODEL_FEATURES)))
+
+
+def test_mask(n_rows):
+    # Fixed per row position, so rows keep their train/test side as the dataset grows
+    return np.random.default_rng(42).random(n_rows) < TEST_FRACTION
+
+
+def fit_scaler(features, train_rows):
+    # Chunked fit over the training rows; a DataFrame keeps the feature names the API passes at predict time
     scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Train model
-    print("Training RandomForest model...")
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train_scaled, y_train)
-    
-    # Evaluate model
-    train_score = model.score(X_train_scaled, y_train)
-    test_score = model.score(X_test_scaled, y_test)
-    
-    print(f"Model R² score on training data: {train_score:.4f}")
-    print(f"Model R² score on test data: {test_score:.4f}")
-    
-    # Save model and scaler
-    print("Saving model and scaler...")
-    with open('aqi_model.pkl', 'wb') as file:
-        pickle.dump(model, file)
-    
-    with open('aqi_scaler.pkl', 'wb') as file:
-        pickle.dump(scaler, file)
-    
-    print("Model training complete!")
-    print("Files saved: aqi_model.pkl, aqi_scaler.pkl")
-    
-except Exception as e:
-    print(f"An error occurred during model training: {str(e)}")
\ No newline at end of file
+    for chunk in range(0, len(train_rows), CHUNK_ROWS):
+        rows = train_rows[chunk:chunk + CHUNK_ROWS]
+        scaler.partial_fit(pd.DataFrame(features[rows], columns=MODEL_FEATURES))
+    return scaler
+
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def read_previous_metrics():
+    try:
+        with open(METRICS_PATH) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the AQI prediction model')
+    parser.add_argument('--csv', type=Path, default=DATA_PATH, help='Training data CSV')
+    parser.add_argument('--trees', type=int, default=100, help='Trees in a full retrain')
+    parser.add_argument('--add-trees', type=int, default=0,
+                        help='Warm start: keep the saved model and scaler and grow this many trees')
+    parser.add_argument('--new-data-only', action='store_true',
+                        help='With --add-trees, fit the new trees only on rows added since the last run')
+    parser.add_argument('--jobs', type=int, default=-1, help='Parallel jobs (-1 = all cores)')
+    args = parser.parse_args()
+
+    print("Starting AQI model training...")
+    start = time.perf_counter()
+
+    if not args.csv.exists():
+        print(f"Error: Data file not found at {args.csv}")
+        print("Please ensure the data file is in the correct location.")
+        exit(1)
+
+    previous = read_previous_metrics()
+    warm_start = args.add_trees > 0
+    if warm_start and not (MODEL_PATH.exists() and SCALER_PATH.exists()):
+        print("Error: --add-trees needs an existing model and scaler; run a full training first.")
+        exit(1)
+
+    try:
+        print("Loading and preprocessing data...")
+        cache = FeatureCache(args.csv)
+        status = cache.refresh()
+        feature_seconds = time.perf_counter() - start
+        print(f"Feature cache {status}: {cache.rows} rows in {feature_seconds:.2f}s")
+
+        features = cache.features()
+        y = cache.target()
+        is_test = test_mask(cache.rows)
+        train_rows = np.flatnonzero(~is_test)
+        test_rows = np.flatnonzero(is_test)
+
+        if warm_start:
+            artifact_format, model_path = choose_artifact(MODEL_JOBLIB_PATH, MODEL_PATH)
+            # Load a private, writable copy to grow
+            model = load_artifact(artifact_format, model_path, mmap=False)
+            with open(SCALER_PATH, 'rb') as file:
+                scaler = pickle.load(file)
+            # Growing the forest keeps the scaler the existing trees were fitted against
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + args.add_trees, n_jobs=args.jobs)
+            if args.new_data_only and status == 'rebuilt':
+                # Row positions changed with the rewritten CSV, so "new" rows cannot be told apart
+                print("CSV was rewritten since the last run; new trees are fitted on all rows.")
+            elif args.new_data_only:
+                seen = previous.get('rows_total', 0) if previous else 0
+                train_rows = train_rows[train_rows >= seen]
+                if len(train_rows) == 0:
+                    print("No new rows since the last training run; nothing to do.")
+                    return
+            mode = 'warm_start_new_data' if args.new_data_only else 'warm_start'
+        else:
+            scaler = fit_scaler(features, train_rows)
+            model = RandomForestRegressor(n_estimators=args.trees, random_state=42, n_jobs=args.jobs)
+            mode = 'full'
+
+        X = cache.scaled(scaler)
+        print(f"Training RandomForest model ({mode}, {len(train_rows)} rows, {args.jobs} jobs)...")
+        fit_start = time.perf_counter()
+        # The forest validates X once and shares it across trees, so the training rows are gathered once
+        X_train = X[train_rows]
+        model.fit(X_train, y[train_rows])
+        fit_seconds = time.perf_counter() - fit_start
+        del X_train
+
+        # Evaluate model
+        score_rows = train_rows
+        if len(score_rows) > TRAIN_SCORE_ROWS:
+            score_rows = np.sort(np.random.default_rng(0).choice(score_rows, TRAIN_SCORE_ROWS, replace=False))
+        train_score = r2_score(y[score_rows], model.predict(X[score_rows]))
+        test_score = r2_score(y[test_rows], model.predict(X[test_rows])) if len(test_rows) else None
+
+        print(f"Model R² score on training data: {train_score:.4f}")
+        if test_score is not None:
+            print(f"Model R² score on test data: {test_score:.4f}")
+
+        # Save model and scaler
+        print("Saving model and scaler...")
+        model.set_params(warm_start=False)
+        with open(MODEL_PATH, 'wb') as file:
+            pickle.dump(model, file)
+
+        with open(SCALER_PATH, 'wb') as file:
+            pickle.dump(scaler, file)
+
+        # Newer artifacts are preferred by the API; the pickle stays for compatibility
+        save_joblib(model, MODEL_JOBLIB_PATH)
+        # Written last, so the API takes it to be compiled from this model and uses it for small batches
+        CompiledForest.from_sklearn(model, scaler).save(MODEL_COMPILED_PATH)
+
+        peak = peak_memory_mb()
+        metrics = {
+            'trained_at': datetime.now().isoformat(),
+            'mode': mode,
+            'csv': str(args.csv),
+            'rows_total': cache.rows,
+            'rows_fit': int(len(train_rows)),
+            'rows_test': int(len(test_rows)),
+            'n_estimators': model.n_estimators,
+            'n_jobs': args.jobs,
+            'feature_cache': status,
+            'feature_seconds': round(feature_seconds, 3),
+            'fit_seconds': round(fit_seconds, 3),
+            'total_seconds': round(time.perf_counter() - start, 3),
+            'peak_memory_mb': round(peak, 1) if peak is not None else None,
+            'train_r2': train_score,
+            'test_r2': test_score
+        }
+        with open(METRICS_PATH, 'w') as file:
+            json.dump(metrics, file, indent=2)
+
+        print("Model training complete!")
+        print(f"Files saved: {MODEL_PATH}, {MODEL_JOBLIB_PATH}, {MODEL_COMPILED_PATH}, {SCALER_PATH}, {METRICS_PATH}")
+
+    except Exception as e:
+        print(f"An error occurred during model training: {str(e)}")
+
+
+if __name__ == '__main__':
+    main()
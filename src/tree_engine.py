@@ -0,0 +1,219 @@
+# tree_engine.py - RandomForest compiled to flat NumPy node arrays with the scaler folded in
+
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Bump when the saved array layout changes
+ENGINE_VERSION = 2
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+# (sample, tree) pairs traversed together; small enough for the working arrays to stay in cache
+BLOCK_PAIRS = 1 << 16
+
+
+def raw_thresholds(threshold, mean, scale):
+    """Largest raw value x per split with float32((x - mean) / scale) <= threshold.
+
+    scikit-learn trees compare float32 features, so a raw value that scales to
+    just above a threshold in float64 can still go left once rounded.
+    threshold * scale + mean is a starting point; a bisection over float64
+    values then finds the exact boundary of the scaled float32 comparison.
+    """
+    def goes_left(x):
+        with np.errstate(over='ignore', invalid='ignore'):
+            return ((x - mean) / scale).astype(np.float32) <= threshold
+
+    guess = threshold * scale + mean
+    width = (np.abs(threshold) + 1.0) * scale * 1e-6
+    lo, hi = guess - width, guess + width
+    # Widen the bracket until lo goes left and hi goes right
+    while True:
+        low_wrong, high_wrong = ~goes_left(lo), goes_left(hi)
+        if not (low_wrong.any() or high_wrong.any()):
+            break
+        width = width * 2
+        lo = np.where(low_wrong, lo - width, lo)
+        hi = np.where(high_wrong, hi + width, hi)
+    while True:
+        mid = lo + (hi - lo) / 2
+        open_bracket = (mid > lo) & (mid < hi)
+        if not open_bracket.any():
+            return lo
+        left = goes_left(mid)
+        lo = np.where(open_bracket & left, mid, lo)
+        hi = np.where(open_bracket & ~left, mid, hi)
+
+
+class CompiledForest:
+    """A fitted forest regressor as flat node arrays, evaluated for whole batches at once.
+
+    All trees share one set of arrays; roots[t] is the first node of tree t and
+    children[2 * node] / children[2 * node + 1] are its left / right child.
+    Leaves point to themselves and compare against +inf, so every sample can
+    take the same number of steps. Thresholds are mapped back to raw feature
+    units (see raw_thresholds), so predict() takes unscaled features and no
+    StandardScaler call is needed.
+    """
+
+    # predict_batch passes raw features to models that carry the scaler themselves
+    includes_scaler = True
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features_in_ = n_features
+
+    @classmethod
+    def from_sklearn(cls, model, scaler=None):
+        """Compile a fitted RandomForestRegressor (or any forest of single-output regression trees)."""
+        n_features = model.n_features_in_
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        if scaler is not None:
+            if scaler.mean_ is not None:
+                mean = scaler.mean_
+            if scaler.scale_ is not None:
+                scale = scaler.scale_
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            own = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            feature = np.where(is_leaf, 0, tree.feature)
+            threshold = np.full(n_nodes, np.inf)
+            threshold[~is_leaf] = raw_thresholds(tree.threshold[~is_leaf], mean[feature[~is_leaf]],
+                                                 scale[feature[~is_leaf]])
+
+            features.append(feature.astype(np.int32))
+            thresholds.append(threshold)
+            children.append(np.column_stack([
+                np.where(is_leaf, own, tree.children_left),
+                np.where(is_leaf, own, tree.children_right)
+            ]).ravel() + offset)
+            values.append(tree.value[:, 0, 0].astype(np.float64))
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(np.concatenate(features), np.concatenate(thresholds),
+                   np.concatenate(children).astype(np.int32), np.concatenate(values),
+                   np.array(roots, dtype=np.int32), max_depth, n_features)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    def predict(self, X):
+        """Mean leaf value over all trees for each row of raw (unscaled) features."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_rows = len(X)
+        total = np.zeros(n_rows)
+        if n_rows == 0:
+            return total
+
+        n_features = X.shape[1]
+        rows_per_block = max(1, BLOCK_PAIRS // self.n_trees)
+        for start in range(0, n_rows, rows_per_block):
+            block = X[start:start + rows_per_block]
+            flat = block.ravel()
+            # One entry per (row, tree) pair; flat[row_offset + feature] is the value a node splits on
+            row_offsets = np.repeat(np.arange(len(block), dtype=np.int32) * n_features, self.n_trees)
+            node = np.tile(self.roots, len(block))
+            for _ in range(self.max_depth):
+                go_right = flat.take(row_offsets + self.feature.take(node)) > self.threshold.take(node)
+                node = self.children.take(2 * node + go_right)
+            total[start:start + len(block)] = self.value.take(node).reshape(len(block), self.n_trees).sum(axis=1)
+        return total / self.n_trees
+
+    def save(self, directory):
+        """Write the arrays as .npy files that load() can memory-map.
+
+        Each save writes a new version under <directory>.versions and then
+        points the directory, a symlink, at it. The link is swapped atomically,
+        so readers only ever see a complete version.
+        """
+        directory = Path(directory)
+        versions = directory.with_name(f"{directory.name}.versions")
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        version_dir = versions / version
+        version_dir.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(version_dir / f"{name}.npy", getattr(self, name))
+        with open(version_dir / 'meta.json', 'w') as file:
+            json.dump({
+                'version': ENGINE_VERSION,
+                'max_depth': int(self.max_depth),
+                'n_features': int(self.n_features_in_),
+                'n_trees': self.n_trees,
+                'n_nodes': self.n_nodes
+            }, file)
+
+        if directory.is_dir() and not directory.is_symlink():
+            # Written by an older save as a plain directory; it becomes the oldest version
+            os.replace(directory, versions / '00000000000000-legacy')
+        tmp_link = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        tmp_link.unlink(missing_ok=True)
+        tmp_link.symlink_to(Path(versions.name) / version, target_is_directory=True)
+        os.replace(tmp_link, directory)
+        _prune_versions(versions, version)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        directory = Path(directory)
+        with open(directory / 'meta.json') as file:
+            meta = json.load(file)
+        if meta.get('version') != ENGINE_VERSION:
+            raise ValueError(f"Compiled model in {directory} has version {meta.get('version')}, "
+                             f"expected {ENGINE_VERSION}; recompile it")
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode='r' if mmap else None) for name in ARRAYS}
+        return cls(**arrays, max_depth=meta['max_depth'], n_features=meta['n_features'])
+
+
+def _prune_versions(versions, current):
+    # Keep the newest older version too; a reader may have resolved the link just before the swap.
+    # Memory-mapped arrays stay valid after their files are unlinked.
+    older = sorted(path.name for path in versions.iterdir() if path.is_dir() and path.name != current)
+    for name in older[:-1]:
+        shutil.rmtree(versions / name, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the trained forest and scaler into flat arrays')
+    parser.add_argument('--scaler', type=Path, default=Path('aqi_scaler.pkl'))
+    parser.add_argument('--out', type=Path, default=Path('aqi_model.compiled'))
+    args = parser.parse_args()
+
+    import pickle
+    from model_store import choose_artifact, load_artifact
+
+    # Never the compiled artifact itself, which has no sklearn trees left to read
+    artifact_format, model_path = choose_artifact(Path('aqi_model.joblib'), Path('aqi_model.pkl'))
+    model = load_artifact(artifact_format, model_path, mmap=False)
+    with open(args.scaler, 'rb') as file:
+        scaler = pickle.load(file)
+    compiled = CompiledForest.from_sklearn(model, scaler)
+    compiled.save(args.out)
+    print(f"Compiled {compiled.n_trees} trees ({compiled.n_nodes} nodes, depth {compiled.max_depth}) into {args.out}")
+
+
+if __name__ == '__main__':
+    main()